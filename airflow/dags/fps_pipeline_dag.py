@@ -29,27 +29,38 @@ def task_ingest_europa_league(**context):
 
 
 def task_process_data(**context):
-    from processing.data_cleaning import process_and_save
-    for input_file, output_file in [
-        ("european_leagues_with_odds.csv", "european_leagues_with_odds_processed.csv"),
-        ("europa_league_matches.csv", "europa_league_matches_processed.csv"),
-    ]:
-        try:
-            process_and_save(input_file, output_file)
-        except FileNotFoundError:
-            pass
+    from processing.pipeline import run_pipeline
+    # Las fuentes sin datos nuevos se saltan: el manifiesto de caché guarda el hash de sus entradas
+    run_pipeline(["process"], force=context['params'].get('force', False))
 
 
 def task_score_only(**context):
-    from models.integrity_scorer import score_only
-    results = score_only("fps_leagues")
-    if results is None:
+    from processing.pipeline import run_pipeline
+    from models.tracking import flush_logging
+    state = run_pipeline(["score"], force=context['params'].get('force', False))
+    # El runner de Airflow termina con os._exit: se vacía la cola de MLflow explícitamente
+    flush_logging()
+    if "score" in state["cached"]:
+        return
+    if not any("summary" in r for r in state["runs"] or []):
         raise RuntimeError("Scoring failed — model not found. Run fps_retrain DAG first.")
 
 
 def task_retrain(**context):
-    from models.integrity_scorer import train_and_score
-    train_and_score()
+    from models.integrity_scorer import train_and_score, MODEL_DIR
+    incremental = context['params'].get('incremental', True) and (MODEL_DIR / "fps_leagues_scaler.pkl").exists()
+    if incremental:
+        from models.incremental import incremental_retrain
+        incremental_retrain("fps_leagues")
+    else:
+        train_and_score()
+
+    # Modelo de Europa League y scores combinados de todas las competiciones. Tras el incremental
+    # los scores de ligas ya están al día: se combinan sin volver a puntuarlos
+    from models.multi_model import run_models
+    from models.tracking import flush_logging
+    run_models(train=True, model_ids=["europa_league"], score_others=not incremental)
+    flush_logging()
 
 
 def task_notify_scoring(**context):
@@ -73,7 +84,7 @@ with DAG(
     start_date=datetime(2024, 1, 1),
     catchup=False,
     tags=['fair_play_shield', 'scoring'],
-    params={'seasons_back': 1},
+    params={'seasons_back': 1, 'force': False},
 ) as scoring_dag:
 
     start = EmptyOperator(task_id='start')
@@ -121,7 +132,7 @@ with DAG(
     start_date=datetime(2024, 1, 1),
     catchup=False,
     tags=['fair_play_shield', 'training'],
-    params={'seasons_back': 3},
+    params={'seasons_back': 3, 'incremental': True},
 ) as retrain_dag:
 
     start_r = EmptyOperator(task_id='start')
@@ -8,6 +8,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
+CACHE_DIR = DATA_DIR / "cache"
+FEATURE_STORE_DIR = DATA_DIR / "features"
 
 DB_CONFIG = {
     "host": os.getenv("DB_HOST", "localhost"),
@@ -41,3 +43,31 @@ ODDS_MOVEMENT_SUSPICIOUS_PCT = 0.15
 MIN_WIN_STREAK_FOR_UPSET_FLAG = 5
 GOALS_ANOMALY_MULTIPLIER = 4
 XG_DEVIATION_THRESHOLD = 2.0
+
+FEATURE_COLS_LEAGUES = [
+    "odds_movement_abs_max",
+    "result_surprise",
+    "ht_result_changed",
+    "total_goals",
+    "total_cards",
+    "flag_odds_movement",
+    "flag_result_surprise",
+    "flag_streak_break",
+    "flag_goals_anomaly_home",
+    "flag_goals_anomaly_away",
+    "flag_ht_result_changed",
+    "flag_cards_anomaly",
+]
+
+FEATURE_COLS_EL = [
+    "total_goals",
+    "goal_difference",
+    "ht_result_changed",
+    "total_cards",
+    "total_fouls",
+    "total_corners",
+    "home_possession",
+    "away_possession",
+    "home_shots_on_target",
+    "away_shots_on_target",
+]
@@ -1,22 +1,34 @@
 import importlib.util as _ilu
 import dash
 from dash import dcc, html, dash_table, Input, Output, State, callback
+from flask import Response, request
 import dash_bootstrap_components as dbc
-import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-import joblib
 from pathlib import Path
+import threading
+import hashlib
+import time
 import sys
+import os
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from config.settings import PROCESSED_DATA_DIR, RAW_DATA_DIR
+from processing.feature_store import load_features, ensure_store, store_path
+from dashboard.serving import mapped_frame
+from dashboard.table_index import ScoresTable, MatchIndex
+from processing.summary_cube import load_cube, filter_cube, rollup, HIST_EDGES, HIST_COLS
+from dashboard.result_cache import get_cache
+from dashboard.hot_reload import SnapshotWatcher, file_signature
+from dashboard.what_if import load_what_if
+from models.integrity_scorer import load_params
+from models.multi_model import load_registry
+from dashboard.export import EXPORT_FORMATS, export_rows, export_chunks, stream_csv, stream_parquet
 
 MODEL_DIR = Path(__file__).resolve().parent.parent / "models" / "trained"
 
 SCORES_PATH = PROCESSED_DATA_DIR / "integrity_scores.csv"
-LEAGUES_PATH = PROCESSED_DATA_DIR / "european_leagues_with_odds_processed.csv"
 EL_PATH = RAW_DATA_DIR / "europa_league_matches.csv"
 
 ALERT_COLORS = {
@@ -39,38 +51,122 @@ ALERT_LABELS = {
 }
 
 
-def load_trained_models():
-    try:
-        scaler = joblib.load(MODEL_DIR / "fps_leagues_scaler.pkl")
-        iso_forest = joblib.load(MODEL_DIR / "fps_leagues_isolation_forest.pkl")
-        rf_model = joblib.load(MODEL_DIR / "fps_leagues_random_forest.pkl")
-        lr_model = joblib.load(MODEL_DIR / "fps_leagues_logistic.pkl")
-        feature_cols = joblib.load(MODEL_DIR / "fps_leagues_feature_cols.pkl")
-        return scaler, iso_forest, rf_model, lr_model, feature_cols
-    except Exception as e:
-        print(f"Error loading models: {e}")
-        return None, None, None, None, None
-
-
-scaler, iso_forest, rf_model, lr_model, feature_cols = load_trained_models()
-MODELS_LOADED = scaler is not None
+def _read_el():
+    el = pd.read_csv(EL_PATH, parse_dates=["date"])
+    if "league_name" not in el.columns:
+        el["league_name"] = "Europa League"
+    return el
 
 
 def load_data():
-    scores = pd.read_csv(SCORES_PATH, parse_dates=["date"])
-    leagues = pd.read_csv(LEAGUES_PATH, parse_dates=["date"], low_memory=False)
-    el = pd.read_csv(EL_PATH, parse_dates=["date"]) if EL_PATH.exists() else pd.DataFrame()
+    # Cada dataset se lee de su copia Arrow mapeada en memoria (dashboard/serving.py), compartida entre workers
+    scores = mapped_frame("scores", SCORES_PATH, lambda: pd.read_csv(SCORES_PATH, parse_dates=["date"]))
+    leagues_path = ensure_store("leagues")
+    if leagues_path is not None:
+        leagues = mapped_frame("leagues", leagues_path, lambda: load_features("leagues"))
+    else:
+        leagues = pd.DataFrame(columns=["match_id", "date", "home_team", "away_team"])
+    el = mapped_frame("el", EL_PATH, _read_el) if EL_PATH.exists() else pd.DataFrame()
     return scores, leagues, el
 
 
-scores_df, leagues_df, el_df = load_data()
-
-if not el_df.empty and "league_name" not in el_df.columns:
-    el_df["league_name"] = "Europa League"
-
-_leagues = sorted(scores_df["league_name"].dropna().unique().tolist()) if "league_name" in scores_df.columns else []
-_seasons = sorted(scores_df["season"].dropna().unique().tolist(), reverse=True) if "season" in scores_df.columns else []
-FLAG_COLS = [c for c in scores_df.columns if c.startswith("flag_")]
+# Datos, modelos y layout forman una instantánea que se carga en la primera petición (o al arrancar
+# el servidor), no al importar. Una recarga construye otra completa y la publica con una sola
+# asignación: cada callback toma get_data() una vez y trabaja sobre una versión coherente
+_STATE = {"snapshot": {}}
+# Hilo que está preparando una recarga: sus get_data()/get_models() ven la instantánea nueva
+_LOCAL = threading.local()
+_RELOAD_LOCK = threading.Lock()
+
+
+def data_version():
+    # Identifica el integrity_scores.csv cargado; la caché de resultados se invalida al cambiar
+    stat = SCORES_PATH.stat()
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _model_files():
+    # Bundle de ligas (simulador) y parámetros de todos los modelos (pesos del detalle de partido)
+    files = set(MODEL_DIR.glob("fps_leagues_*")) | set(MODEL_DIR.glob("*_params.pkl"))
+    return sorted(files) + [MODEL_DIR / "model_registry.pkl"]
+
+
+def models_version():
+    # Identifica los ficheros de modelos cargados: forma parte de la clave de los resultados del simulador
+    return hashlib.sha1(repr(file_signature(_model_files())).encode()).hexdigest()[:12]
+
+
+def source_signature():
+    # Todo lo que sirve el dashboard: scores, features, partidos de la EL y ficheros de modelos
+    return file_signature([SCORES_PATH, store_path("leagues"), EL_PATH, *_model_files()])
+
+
+def _snapshot():
+    pending = getattr(_LOCAL, "snapshot", None)
+    return pending if pending is not None else _STATE["snapshot"]
+
+
+def get_data():
+    snapshot = _snapshot()
+    if "data" not in snapshot:
+        snapshot.setdefault("signature", source_signature())
+        version = data_version()
+        scores, leagues, el = load_data()
+        snapshot["data"] = {
+            "version": version,
+            "scores": scores,
+            "leagues": leagues,
+            "el": el,
+            "league_names": sorted(scores["league_name"].dropna().unique().tolist()) if "league_name" in scores.columns else [],
+            "seasons": sorted(scores["season"].dropna().unique().tolist(), reverse=True) if "season" in scores.columns else [],
+            "flag_cols": [c for c in scores.columns if c.startswith("flag_")],
+            "table": ScoresTable(scores),
+            "matches": MatchIndex(scores, leagues),
+            "cube": load_cube(scores, SCORES_PATH),
+        }
+    return snapshot["data"]
+
+
+def get_models():
+    snapshot = _snapshot()
+    if "models" not in snapshot:
+        snapshot.setdefault("signature", source_signature())
+        version = models_version()
+        # Scorer de ligas cargado y calentado con una predicción: el simulador solo hace llamadas de una fila
+        what_if = load_what_if(get_data()["leagues"])
+        snapshot["models"] = {
+            "loaded": what_if is not None,
+            "version": version,
+            "what_if": what_if,
+            "feature_cols": what_if.feature_cols if what_if is not None else [],
+            # Pesos y modelo supervisado de cada bundle, por model_id (columna model_id de los scores)
+            "params": {spec["model_id"]: load_params(spec["prefix"]) for spec in load_registry()},
+        }
+    return snapshot["models"]
+
+
+def reload_snapshot():
+    # Construye datos, índices, cubo, modelos y layout nuevos en este hilo sin tocar la instantánea
+    # publicada; si algo falla, las peticiones siguen con la anterior
+    with _RELOAD_LOCK:
+        snapshot = {"signature": source_signature()}
+        _LOCAL.snapshot = snapshot
+        try:
+            _prepare()
+        finally:
+            _LOCAL.snapshot = None
+        _STATE["snapshot"] = snapshot
+        # Los resultados de la versión anterior ya no sirven (la caché también se invalida sola
+        # al ver la versión nueva en la siguiente petición)
+        get_cache().clear()
+    data = snapshot["data"]
+    print(f"🔄 Datos recargados: {len(data['scores'])} partidos, "
+          f"{(data['scores']['alert_level'] == 'high_alert').sum()} alertas altas, "
+          f"modelos {'cargados' if snapshot['models']['loaded'] else 'no disponibles'}")
+    return snapshot
+
+
+_WATCHER = SnapshotWatcher(source_signature, reload_snapshot)
 
 
 app = dash.Dash(
@@ -90,27 +186,30 @@ def _kpi_card(value, label, color, border):
     ], className=f"bg-dark border-{border} text-center"), width=2)
 
 
-def build_kpi_cards():
-    total = len(scores_df)
-    high_alert = int((scores_df["alert_level"] == "high_alert").sum())
-    suspicious = int((scores_df["alert_level"] == "suspicious").sum())
-    avg_score = scores_df["integrity_score"].mean()
-    ligas = len(_leagues)
-    temporadas = len(_seasons)
+def build_kpi_cards(cube=None):
+    cube = get_data()["cube"] if cube is None else cube
+    by_level = rollup(cube, "alert_level")["count"]
+    total = int(by_level.sum())
+    high_alert = int(by_level.get("high_alert", 0))
+    suspicious = int(by_level.get("suspicious", 0))
+    avg_score = cube["score_sum"].sum() / max(total, 1)
+    ligas = cube["league_name"].nunique()
+    temporadas = cube["season"].nunique()
 
-    return dbc.Row([
+    return [
         _kpi_card(f"{total:,}", "Partidos analizados", "info", "info"),
         _kpi_card(f"{high_alert}", "🔴 Alta sospecha", "danger", "danger"),
         _kpi_card(f"{suspicious}", "🟠 Sospechosos", "warning", "warning"),
         _kpi_card(f"{avg_score:.1f}", "Score promedio", "light", "secondary"),
         _kpi_card(f"{ligas}", "Ligas cubiertas", "primary", "primary"),
         _kpi_card(f"{temporadas}", "Temporadas", "success", "success"),
-    ], className="mb-4 g-2")
+    ]
 
 
 def build_alerts_tab():
-    league_opts = [{"label": l, "value": l} for l in _leagues]
-    season_opts = [{"label": s, "value": s} for s in _seasons]
+    data = get_data()
+    league_opts = [{"label": l, "value": l} for l in data["league_names"]]
+    season_opts = [{"label": s, "value": s} for s in data["seasons"]]
     level_opts = [
         {"label": f"{ALERT_ICONS[k]} {ALERT_LABELS[k]}", "value": k}
         for k in ["high_alert", "suspicious", "monitor", "normal"]
@@ -213,14 +312,19 @@ def build_alerts_tab():
     ], className="mt-3")
 
 
-def build_score_distribution():
+def build_score_distribution(cube=None):
+    cube = get_data()["cube"] if cube is None else cube
+    hist = rollup(cube, "alert_level")
+    centers = (HIST_EDGES[:-1] + HIST_EDGES[1:]) / 2
     fig = go.Figure()
     for level, color in ALERT_COLORS.items():
-        subset = scores_df[scores_df["alert_level"] == level]
+        counts = hist.loc[level, HIST_COLS].to_numpy() if level in hist.index else np.zeros(len(HIST_COLS))
         label = ALERT_LABELS.get(level, level)
-        fig.add_trace(go.Histogram(
-            x=subset["integrity_score"],
-            name=f"{ALERT_ICONS.get(level, '')} {label} ({len(subset)})",
+        fig.add_trace(go.Bar(
+            x=centers,
+            y=counts,
+            width=HIST_EDGES[1] - HIST_EDGES[0],
+            name=f"{ALERT_ICONS.get(level, '')} {label} ({int(counts.sum())})",
             marker_color=color,
             opacity=0.8,
         ))
@@ -236,18 +340,15 @@ def build_score_distribution():
     return fig
 
 
-def build_league_comparison():
-    if "league_name" not in scores_df.columns:
+def build_league_comparison(cube=None):
+    cube = get_data()["cube"] if cube is None else cube
+    if cube["league_name"].isna().all():
         return go.Figure()
 
-    league_stats = scores_df.groupby("league_name").agg(
-        mean_score=("integrity_score", "mean"),
-        max_score=("integrity_score", "max"),
-        high_alerts=("alert_level", lambda x: (x == "high_alert").sum()),
-        total=("integrity_score", "count"),
-    ).reset_index()
-    league_stats["pct_high"] = league_stats["high_alerts"] / league_stats["total"] * 100
-    league_stats = league_stats.sort_values("mean_score", ascending=True)
+    league_stats = rollup(cube, "league_name")
+    high = rollup(cube[cube["alert_level"] == "high_alert"], "league_name")["count"]
+    league_stats["pct_high"] = high.reindex(league_stats.index, fill_value=0) / league_stats["count"] * 100
+    league_stats = league_stats.sort_values("mean_score", ascending=True).reset_index()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -274,14 +375,12 @@ def build_league_comparison():
     return fig
 
 
-def build_time_series():
-    ts = scores_df.copy()
-    ts["month"] = ts["date"].dt.to_period("M").astype(str)
-    monthly = ts.groupby("month").agg(
-        mean_score=("integrity_score", "mean"),
-        high_alerts=("alert_level", lambda x: (x == "high_alert").sum()),
-        total=("integrity_score", "count"),
-    ).reset_index()
+def build_time_series(cube=None):
+    cube = get_data()["cube"] if cube is None else cube
+    monthly = rollup(cube, "month")
+    high = rollup(cube[cube["alert_level"] == "high_alert"], "month")["count"]
+    monthly["high_alerts"] = high.reindex(monthly.index, fill_value=0)
+    monthly = monthly.sort_index().reset_index()
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(
@@ -305,39 +404,120 @@ def build_time_series():
     return fig
 
 
-def build_scatter_odds():
-    if "odds_movement_abs_max" not in leagues_df.columns:
+def build_analysis(leagues=None, seasons=None, cube=None):
+    # KPIs y gráficos agregados para los filtros de la pestaña de análisis, leídos del cubo
+    cube = filter_cube(get_data()["cube"] if cube is None else cube, leagues, seasons)
+    return (
+        build_kpi_cards(cube),
+        build_score_distribution(cube),
+        build_league_comparison(cube),
+        build_time_series(cube),
+    )
+
+
+def build_analysis_filters():
+    data = get_data()
+    return dbc.Row([
+        dbc.Col([
+            dbc.Label("Liga", className="small text-muted"),
+            dcc.Dropdown(
+                id="analysis-league-filter",
+                options=[{"label": l, "value": l} for l in data["league_names"]],
+                placeholder="Todas",
+                multi=True,
+                style={"fontSize": "13px"},
+            ),
+        ], width=4),
+        dbc.Col([
+            dbc.Label("Temporada", className="small text-muted"),
+            dcc.Dropdown(
+                id="analysis-season-filter",
+                options=[{"label": s, "value": s} for s in data["seasons"]],
+                placeholder="Todas",
+                multi=True,
+                style={"fontSize": "13px"},
+            ),
+        ], width=3),
+    ], className="mb-3 g-2 align-items-end")
+
+
+SCATTER_BINS = 60
+OVERLAY_LEVELS = ["suspicious", "high_alert"]
+
+
+def _scatter_odds_figure(data):
+    scores_df, leagues_df = data["scores"], data["leagues"]
+    if "odds_movement_abs_max" not in leagues_df.columns or "match_id" not in leagues_df.columns:
         return go.Figure()
 
-    filtered = leagues_df.dropna(subset=["odds_movement_abs_max", "total_goals"])
-    if filtered.empty:
+    x = leagues_df["odds_movement_abs_max"].to_numpy(dtype=float)
+    y = leagues_df["total_goals"].to_numpy(dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    if not valid.any():
         return go.Figure()
+    x, y = x[valid], y[valid]
+
+    # Todos los partidos entran en la rejilla; goles en celdas de un entero
+    x_edges = np.linspace(0, max(x.max(), 0.15) * 1.001, SCATTER_BINS + 1)
+    y_edges = np.arange(-0.5, y.max() + 1.5)
+    counts, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges])
+    counts = counts.T
+    z = np.where(counts > 0, np.log10(np.maximum(counts, 1)), np.nan)
+
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=z,
+        customdata=counts,
+        colorscale="Blues",
+        showscale=False,
+        hovertemplate="Mov. cuotas %{x:.1%} · %{y:.0f} goles<br>%{customdata:.0f} partidos<extra></extra>",
+        name="Densidad",
+    ))
 
-    n = min(3000, len(filtered))
-    sample = filtered.sample(n=n, random_state=42)
-    merged = sample.merge(
-        scores_df[["date", "home_team", "away_team", "integrity_score", "alert_level"]],
-        on=["date", "home_team", "away_team"],
-        how="left",
-    )
-    merged = merged.dropna(subset=["integrity_score"])
-
-    fig = px.scatter(
-        merged,
-        x="odds_movement_abs_max",
-        y="total_goals",
-        color="alert_level",
-        color_discrete_map=ALERT_COLORS,
-        hover_data=["home_team", "away_team", "integrity_score", "date"],
-        title="Movimiento de cuotas vs Goles (color = nivel alerta)",
+    # Solo los partidos sospechosos se dibujan uno a uno (WebGL), unidos a scores por match_id
+    positions = data["matches"].score_rows.reindex(leagues_df["match_id"].to_numpy()[valid]).to_numpy()
+    scored = ~np.isnan(positions)
+    rows = scores_df.iloc[positions[scored].astype(np.int64)]
+    px_, py_ = x[scored], y[scored]
+    for level in OVERLAY_LEVELS:
+        sel = (rows["alert_level"] == level).to_numpy()
+        if not sel.any():
+            continue
+        subset = rows[sel]
+        fig.add_trace(go.Scattergl(
+            x=px_[sel],
+            y=py_[sel],
+            mode="markers",
+            name=f"{ALERT_ICONS[level]} {ALERT_LABELS[level]} ({int(sel.sum())})",
+            marker=dict(color=ALERT_COLORS[level], size=6, opacity=0.85, line=dict(width=0.5, color="#111")),
+            customdata=np.column_stack([
+                subset["home_team"].astype(str), subset["away_team"].astype(str),
+                subset["integrity_score"].round(1), subset["date"].dt.strftime("%Y-%m-%d"),
+            ]),
+            hovertemplate="%{customdata[0]} vs %{customdata[1]} (%{customdata[3]})<br>"
+                          "MIS %{customdata[2]} · Mov. cuotas %{x:.1%} · %{y:.0f} goles<extra></extra>",
+        ))
+    fig.add_vline(x=0.15, line_dash="dash", line_color="white", annotation_text="Umbral 15%")
+    fig.update_layout(
+        title=f"Movimiento de cuotas vs Goles ({int(valid.sum()):,} partidos; puntos = sospechosos)",
         template="plotly_dark",
         height=400,
-        opacity=0.6,
+        xaxis=dict(title="odds_movement_abs_max", tickformat=".0%"),
+        yaxis=dict(title="total_goals"),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02),
     )
-    fig.add_vline(x=0.15, line_dash="dash", line_color="white", annotation_text="Umbral 15%")
     return fig
 
 
+def build_scatter_odds():
+    # La rejilla se calcula una vez por carga de datos: los datos nuevos traen un dict nuevo
+    data = get_data()
+    if "scatter_odds" not in data:
+        data["scatter_odds"] = _scatter_odds_figure(data)
+    return data["scatter_odds"]
+
+
 def build_match_detail_modal():
     return dbc.Modal([
         dbc.ModalHeader(dbc.ModalTitle(id="modal-title", children="Detalle del Partido")),
@@ -349,8 +529,9 @@ def build_match_detail_modal():
 
 
 def build_data_tab():
-    league_opts = [{"label": l, "value": l} for l in _leagues]
-    season_opts = [{"label": s, "value": s} for s in _seasons]
+    data = get_data()
+    league_opts = [{"label": l, "value": l} for l in data["league_names"]]
+    season_opts = [{"label": s, "value": s} for s in data["seasons"]]
     level_opts = [
         {"label": f"{ALERT_ICONS[k]} {ALERT_LABELS[k]}", "value": k}
         for k in ["high_alert", "suspicious", "monitor", "normal"]
@@ -419,11 +600,14 @@ def build_data_tab():
             {"name": "Nivel",    "id": "alert_level"},
         ],
         data=[],
-        sort_action="native",
+        sort_action="custom",
+        sort_mode="single",
         sort_by=[{"column_id": "date", "direction": "desc"}],
         filter_action="none",
         page_size=20,
-        page_action="native",
+        page_current=0,
+        page_count=1,
+        page_action="custom",
         row_selectable="single",
         selected_rows=[],
         style_table={"overflowX": "auto"},
@@ -451,104 +635,122 @@ def build_data_tab():
 
     return html.Div([
         dbc.Card([
-            dbc.CardBody([filter_row, html.Div(id="data-count-inline", className="text-muted small mb-2"), table])
+            dbc.CardBody([
+                filter_row,
+                html.Div([
+                    html.Div(id="data-count-inline", className="text-muted small me-auto"),
+                    dbc.Button("⬇ CSV", id="data-export-csv", href="/export?format=csv", external_link=True,
+                               color="secondary", size="sm", outline=True),
+                    dbc.Button("⬇ Parquet", id="data-export-parquet", href="/export?format=parquet", external_link=True,
+                               color="secondary", size="sm", outline=True),
+                ], className="d-flex gap-2 mb-2 align-items-center"),
+                table,
+            ])
         ], className="bg-dark border-secondary"),
         html.Div(id="data-detail-panel", className="mt-2"),
     ], className="mt-3")
 
 
-def _build_prediction_form_unused():
+WHAT_IF_FLAG_LABELS = {
+    "flag_streak_break": "Ruptura de racha (5+ victorias)",
+    "flag_goals_anomaly_home": "Goles del local anómalos",
+    "flag_goals_anomaly_away": "Goles del visitante anómalos",
+    "flag_cards_anomaly": "Tarjetas anómalas",
+}
+
+
+def what_if_inputs(features):
+    # Valores del formulario a partir de un dict de features (línea base o partido real)
+    return (
+        round(float(features.get("odds_movement_abs_max", 0)) * 100, 2),
+        str(int(features.get("result_surprise", 0) or 0)),
+        str(int(features.get("ht_result_changed", 0) or 0)),
+        int(features.get("total_goals", 0) or 0),
+        int(features.get("total_cards", 0) or 0),
+        [col for col in WHAT_IF_FLAG_LABELS if features.get(col, 0)],
+    )
+
+
+def build_what_if_tab():
+    models = get_models()
+    if not models["loaded"]:
+        return dbc.Alert("Modelos no disponibles: entrena con python models/integrity_scorer.py", color="warning", className="mt-3")
+    odds, surprise, ht_changed, goals, cards, flags = what_if_inputs(models["what_if"].baseline)
+    yes_no = [{"label": "No", "value": "0"}, {"label": "Sí", "value": "1"}]
+
     return html.Div([
         dbc.Row([
             dbc.Col([
                 dbc.Card([
-                    dbc.CardHeader(html.H5("🎯 Predicción de Integridad de Partido")),
+                    dbc.CardHeader(html.H5("🎯 Simulador de Integridad")),
                     dbc.CardBody([
-                        html.P("Ingresa los datos del partido para predecir si presenta anomalías sospechosas.", className="text-muted mb-4"),
-                        
+                        html.P("Modifica las features del partido: el score de cada modelo y el MIS combinado se recalculan al momento.", className="text-muted mb-3"),
                         dbc.Row([
                             dbc.Col([
-                                dbc.Label("Equipo Local"),
-                                dbc.Input(id="input-home-team", type="text", placeholder="Ej: Real Madrid"),
+                                dbc.Button("Partido típico", id="what-if-reset", color="secondary", size="sm", className="w-100"),
                             ], width=6),
                             dbc.Col([
-                                dbc.Label("Equipo Visitante"),
-                                dbc.Input(id="input-away-team", type="text", placeholder="Ej: Barcelona"),
+                                dbc.Button("Usar partido seleccionado", id="what-if-load-match", color="info", size="sm", className="w-100"),
                             ], width=6),
                         ], className="mb-3"),
-                        
-                        html.Hr(),
-                        html.H6("📊 Estadísticas del Partido", className="mb-3"),
-                        
-                        dbc.Row([
-                            dbc.Col([
-                                dbc.Label("Goles Local"),
-                                dbc.Input(id="input-home-goals", type="number", value=1, min=0, max=15),
-                            ], width=3),
-                            dbc.Col([
-                                dbc.Label("Goles Visitante"),
-                                dbc.Input(id="input-away-goals", type="number", value=0, min=0, max=15),
-                            ], width=3),
-                            dbc.Col([
-                                dbc.Label("Tarjetas Totales"),
-                                dbc.Input(id="input-cards", type="number", value=3, min=0, max=20),
-                            ], width=3),
-                            dbc.Col([
-                                dbc.Label("Resultado HT cambió"),
-                                dbc.Select(id="input-ht-changed", options=[
-                                    {"label": "No", "value": "0"},
-                                    {"label": "Sí", "value": "1"},
-                                ], value="0"),
-                            ], width=3),
-                        ], className="mb-3"),
-                        
-                        html.Hr(),
+
                         html.H6("💰 Datos de Cuotas (Apuestas)", className="mb-3"),
-                        
                         dbc.Row([
                             dbc.Col([
                                 dbc.Label("Movimiento de cuotas (%)"),
-                                dbc.Input(id="input-odds-movement", type="number", value=5, min=0, max=100, step=0.1),
-                                dbc.FormText("Cambio % entre cuota apertura y cierre"),
-                            ], width=4),
+                                dbc.Input(id="input-odds-movement", type="number", value=odds, min=0, max=100, step=0.01),
+                                dbc.FormText("Cambio % máximo entre cuota apertura y cierre"),
+                            ], width=6),
                             dbc.Col([
                                 dbc.Label("Resultado sorpresa"),
                                 dbc.Select(id="input-result-surprise", options=[
                                     {"label": "No (favorito ganó)", "value": "0"},
                                     {"label": "Sí (no favorito ganó)", "value": "1"},
-                                ], value="0"),
+                                ], value=surprise),
                                 dbc.FormText("¿Ganó el equipo menos favorecido?"),
+                            ], width=6),
+                        ], className="mb-3"),
+
+                        html.Hr(),
+                        html.H6("📊 Estadísticas del Partido", className="mb-3"),
+                        dbc.Row([
+                            dbc.Col([
+                                dbc.Label("Goles totales"),
+                                dbc.Input(id="input-total-goals", type="number", value=goals, min=0, max=20),
                             ], width=4),
                             dbc.Col([
-                                dbc.Label("Ruptura de racha"),
-                                dbc.Select(id="input-streak-break", options=[
-                                    {"label": "No", "value": "0"},
-                                    {"label": "Sí", "value": "1"},
-                                ], value="0"),
-                                dbc.FormText("¿Se rompió racha de 5+ victorias?"),
+                                dbc.Label("Tarjetas totales"),
+                                dbc.Input(id="input-cards", type="number", value=cards, min=0, max=20),
                             ], width=4),
-                        ], className="mb-4"),
-                        
-                        dbc.Button("🔍 Analizar Partido", id="btn-predict", color="primary", size="lg", className="w-100"),
+                            dbc.Col([
+                                dbc.Label("Resultado HT cambió"),
+                                dbc.Select(id="input-ht-changed", options=yes_no, value=ht_changed),
+                            ], width=4),
+                        ], className="mb-3"),
+
+                        html.Hr(),
+                        html.H6("🚩 Flags de contexto", className="mb-2"),
+                        dbc.Checklist(
+                            id="input-flags",
+                            options=[{"label": label, "value": col} for col, label in WHAT_IF_FLAG_LABELS.items()],
+                            value=flags,
+                            switch=True,
+                        ),
+                        dbc.FormText("Los flags de cuotas, sorpresa y cambio al descanso se derivan de los campos de arriba, como en el pipeline."),
                     ])
                 ], className="bg-dark border-primary"),
             ], width=6),
-            
+
             dbc.Col([
                 dbc.Card([
                     dbc.CardHeader(html.H5("📋 Resultado del Análisis")),
-                    dbc.CardBody(id="prediction-result", children=[
-                        html.Div([
-                            html.I(className="fas fa-arrow-left me-2"),
-                            html.P("Completa el formulario y haz clic en 'Analizar Partido'", className="text-muted text-center mt-5"),
-                        ], className="text-center", style={"minHeight": "400px", "display": "flex", "alignItems": "center", "justifyContent": "center"}),
-                    ])
+                    dbc.CardBody(id="prediction-result"),
                 ], className="bg-dark border-secondary h-100"),
             ], width=6),
-        ]),
-        
+        ], className="mt-3"),
+
         html.Hr(className="my-4"),
-        
+
         dbc.Card([
             dbc.CardHeader(html.H6("ℹ️ Cómo interpretar los resultados")),
             dbc.CardBody([
@@ -567,68 +769,155 @@ def _build_prediction_form_unused():
     ])
 
 
-app.layout = dbc.Container([
-    build_match_detail_modal(),
+def build_layout():
+    return dbc.Container([
+        build_match_detail_modal(),
+
+        dbc.Navbar(
+            dbc.Container([
+                html.Div([
+                    html.H4("🛡️ Fair Play Shield", className="text-light mb-0"),
+                    html.Small("Sistema de detección de partidos amañados — v2", className="text-muted"),
+                ]),
+            ]),
+            color="dark",
+            dark=True,
+            className="mb-4",
+        ),
 
-    dbc.Navbar(
-        dbc.Container([
-            html.Div([
-                html.H4("🛡️ Fair Play Shield", className="text-light mb-0"),
-                html.Small("Sistema de detección de partidos amañados — v2", className="text-muted"),
+        dbc.Row(build_kpi_cards(), id="kpi-row", className="mb-4 g-2"),
+
+        dbc.Tabs(id="main-tabs", children=[
+            dbc.Tab(label="📊 Análisis General", tab_id="tab-analysis", children=[
+                html.Div([
+                    build_analysis_filters(),
+                    dbc.Row([
+                        dbc.Col(dcc.Graph(id="graph-score-distribution", figure=build_score_distribution()), width=6),
+                        dbc.Col(dcc.Graph(id="graph-league-comparison", figure=build_league_comparison()), width=6),
+                    ], className="mb-4"),
+                    dbc.Row([
+                        dbc.Col(dcc.Graph(id="graph-time-series", figure=build_time_series()), width=6),
+                        dbc.Col(dcc.Graph(figure=build_scatter_odds()), width=6),
+                    ]),
+                ], className="mt-3")
             ]),
-        ]),
-        color="dark",
-        dark=True,
-        className="mb-4",
-    ),
 
-    build_kpi_cards(),
+            dbc.Tab(label="� Partidos", tab_id="tab-data", children=[
+                build_data_tab(),
+            ]),
 
-    dbc.Tabs(id="main-tabs", children=[
-        dbc.Tab(label="📊 Análisis General", tab_id="tab-analysis", children=[
-            html.Div([
-                dbc.Row([
-                    dbc.Col(dcc.Graph(figure=build_score_distribution()), width=6),
-                    dbc.Col(dcc.Graph(figure=build_league_comparison()), width=6),
-                ], className="mb-4"),
-                dbc.Row([
-                    dbc.Col(dcc.Graph(figure=build_time_series()), width=6),
-                    dbc.Col(dcc.Graph(figure=build_scatter_odds()), width=6),
-                ]),
-            ], className="mt-3")
-        ]),
+            dbc.Tab(label="🎯 Simulador", tab_id="tab-what-if", children=[
+                build_what_if_tab(),
+            ]),
+        ], className="mb-4"),
+
+        html.Footer([
+            html.Hr(),
+            html.P("Fair Play Shield v2.0 — Sistema de detección de partidos amañados", className="text-muted text-center small"),
+        ], className="mt-4"),
+
+    ], fluid=True, className="bg-dark")
+
+
+def serve_layout():
+    # Dash llama a esta función en cada carga de página: el layout se construye una sola vez
+    snapshot = _snapshot()
+    if "layout" not in snapshot:
+        snapshot["layout"] = build_layout()
+    return snapshot["layout"]
+
+
+app.layout = serve_layout
 
-        dbc.Tab(label="� Partidos", tab_id="tab-data", children=[
-            build_data_tab(),
-        ]),
-    ], className="mb-4"),
 
-    html.Footer([
-        html.Hr(),
-        html.P("Fair Play Shield v2.0 — Sistema de detección de partidos amañados", className="text-muted text-center small"),
-    ], className="mt-4"),
+@app.server.route("/cache-stats")
+def cache_stats():
+    return get_cache().stats()
 
-], fluid=True, className="bg-dark")
 
+# Descargas simultáneas por worker: cada una ocupa un hilo mientras dura
+_EXPORT_SLOTS = threading.BoundedSemaphore(int(os.environ.get("FPS_EXPORT_MAX", "2")))
+
+
+@app.server.route("/export")
+def export_data():
+    # Partidos filtrados como en la tabla, con features y aportaciones, servidos bloque a bloque
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return {"error": f"Formato no soportado: {fmt}. Opciones: {sorted(EXPORT_FORMATS)}"}, 400
+    if not _EXPORT_SLOTS.acquire(blocking=False):
+        return {"error": "Demasiadas exportaciones en curso, inténtalo en unos segundos"}, 429
+    try:
+        # Una sola instantánea para toda la descarga, aunque haya una recarga a mitad
+        data = get_data()
+        sort_by = [{"column_id": request.args.get("sort", "date"), "direction": request.args.get("dir", "desc")}]
+        rows = export_rows(
+            data["table"],
+            leagues=request.args.getlist("league"),
+            seasons=request.args.getlist("season"),
+            levels=request.args.getlist("level"),
+            team_search=request.args.get("q"),
+            sort_by=sort_by,
+        )
+        stream = stream_csv if fmt == "csv" else stream_parquet
+        response = Response(stream(export_chunks(data, rows)), mimetype=EXPORT_FORMATS[fmt])
+    except Exception:
+        _EXPORT_SLOTS.release()
+        raise
+    filename = f"fps_export_{time.strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["X-Export-Rows"] = str(len(rows))
+    # Se libera al cerrar la respuesta, también si el cliente corta la descarga
+    response.call_on_close(_EXPORT_SLOTS.release)
+    return response
+
+
+@app.server.route("/reload-stats")
+def reload_stats():
+    stats = _WATCHER.stats()
+    stats["data_version"] = _STATE["snapshot"].get("data", {}).get("version")
+    return stats
 
 _cb_path = Path(__file__).resolve().parent / "callbacks.py"
 _cb_spec = _ilu.spec_from_file_location("callbacks", _cb_path)
 _cb_mod = _ilu.module_from_spec(_cb_spec)
 _cb_spec.loader.exec_module(_cb_mod)
-_cb_mod.register_callbacks(
-    app, scores_df, leagues_df, el_df,
-    ALERT_COLORS, ALERT_ICONS, ALERT_LABELS, FLAG_COLS,
-    MODELS_LOADED, scaler, iso_forest, rf_model, lr_model, feature_cols,
-)
+_cb_mod.register_callbacks(app, get_data, get_models, build_analysis, what_if_inputs, ALERT_COLORS, ALERT_ICONS, ALERT_LABELS)
+
+
+def _prepare():
+    data = get_data()
+    get_models()
+    serve_layout()
+    data["table"].order()
+    return data
+
+
+def warm_up():
+    # Carga datos, modelos, layout y el orden por defecto de la tabla antes de servir
+    # (con gunicorn --preload, antes del fork: los workers lo heredan sin recalcularlo)
+    data = _prepare()
+    scores_df = data["scores"]
+    print(f"Datos: {len(scores_df)} partidos scored")
+    print(f"Ligas: {len(data['league_names'])}")
+    print(f"Temporadas: {len(data['seasons'])}")
+    print(f"Alertas altas: {(scores_df['alert_level'] == 'high_alert').sum()}")
+    return data
+
+
+def start_watcher(reload=None):
+    # Vigila scores y modelos desde la versión ya cargada; en gunicorn lo arranca el maestro (when_ready)
+    # con una recarga que además sustituye los workers
+    if reload is not None:
+        _WATCHER.reload = reload
+    return _WATCHER.start(_STATE["snapshot"].get("signature"))
 
 
 if __name__ == "__main__":
     print("\n🛡️  Fair Play Shield Dashboard v2")
     print("=" * 40)
-    print(f"Datos: {len(scores_df)} partidos scored")
-    print(f"Ligas: {len(_leagues)}")
-    print(f"Temporadas: {len(_seasons)}")
-    print(f"Alertas altas: {(scores_df['alert_level'] == 'high_alert').sum()}")
+    warm_up()
+    start_watcher()
     print(f"\nAbriendo en http://localhost:8050")
     print("=" * 40)
     app.run(debug=False, host="0.0.0.0", port=8050)
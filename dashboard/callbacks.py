@@ -1,55 +1,90 @@
-from dash import Input, Output, html
+from urllib.parse import urlencode
+from dash import Input, Output, State, ctx, html, no_update
 import dash_bootstrap_components as dbc
 import pandas as pd
+from dashboard.result_cache import get_cache, normalize, normalize_search
+from dashboard.what_if import MANUAL_FLAGS
+from models.integrity_scorer import DEFAULT_PARAMS
 
 
-def register_callbacks(
-    app, scores_df, leagues_df, el_df,
-    ALERT_COLORS, ALERT_ICONS, ALERT_LABELS, FLAG_COLS,
-    MODELS_LOADED, scaler, iso_forest, rf_model, lr_model, feature_cols,
-):
-
-    def _apply_filters(df, leagues, seasons, levels, team_search):
-        if leagues:
-            df = df[df["league_name"].isin(leagues)]
-        if seasons:
-            df = df[df["season"].isin(seasons)]
-        if levels:
-            df = df[df["alert_level"].isin(levels)]
-        if team_search and len(team_search) >= 2:
-            q = team_search.lower()
-            mask = (
-                df["home_team"].str.lower().str.contains(q, na=False)
-                | df["away_team"].str.lower().str.contains(q, na=False)
-            )
-            df = df[mask]
-        return df
-
-    def _prep_table_df(df):
-        out = df.copy()
-        if "date" in out.columns:
-            out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.strftime("%Y-%m-%d")
-        if "home_goals" in out.columns and "away_goals" in out.columns:
-            out["score_display"] = (
-                out["home_goals"].fillna("?").astype(str)
-                + " - "
-                + out["away_goals"].fillna("?").astype(str)
-            )
-        return out
+def register_callbacks(app, get_data, get_models, build_analysis, what_if_inputs, ALERT_COLORS, ALERT_ICONS, ALERT_LABELS):
+
+    @app.callback(
+        Output("kpi-row", "children"),
+        Output("graph-score-distribution", "figure"),
+        Output("graph-league-comparison", "figure"),
+        Output("graph-time-series", "figure"),
+        Input("analysis-league-filter", "value"),
+        Input("analysis-season-filter", "value"),
+        prevent_initial_call=True,
+    )
+    def update_analysis(leagues, seasons):
+        # Los agregados salen del cubo de resumen: el coste no depende del número de partidos
+        key = ("analysis", normalize(leagues), normalize(seasons))
+        data = get_data()
+        return get_cache().get_or_compute(
+            key, lambda: build_analysis(leagues, seasons, data["cube"]), version=data["version"]
+        )
 
     @app.callback(
         Output("data-table", "data"),
+        Output("data-table", "page_count"),
+        Output("data-table", "selected_rows"),
         Output("data-count", "children"),
         Input("data-league-filter", "value"),
         Input("data-season-filter", "value"),
         Input("data-level-filter", "value"),
         Input("data-team-search", "value"),
+        Input("data-table", "page_current"),
+        Input("data-table", "page_size"),
+        Input("data-table", "sort_by"),
+    )
+    def update_data_table(leagues, seasons, levels, team_search, page_current, page_size, sort_by):
+        # Filtro, orden y paginación en el servidor: solo la página visible viaja al navegador
+        data = get_data()
+        table = data["table"]
+        # Las combinaciones de filtros repetidas (liga, temporada actual, high_alert) salen de la caché
+        sort = sort_by[0] if sort_by else {"column_id": "date", "direction": "desc"}
+        search = normalize_search(team_search)
+        key = ("table", normalize(leagues), normalize(seasons), normalize(levels),
+               search, sort["column_id"], sort["direction"])
+        rows = get_cache().get_or_compute(
+            key, lambda: table.rows(table.mask(leagues, seasons, levels, search), sort_by),
+            version=data["version"],
+        )
+        records, total, page_count = table.page(rows, page_current, page_size or 20)
+        return records, page_count, [], f"{total:,} partidos"
+
+    @app.callback(
+        Output("data-export-csv", "href"),
+        Output("data-export-parquet", "href"),
+        Input("data-league-filter", "value"),
+        Input("data-season-filter", "value"),
+        Input("data-level-filter", "value"),
+        Input("data-team-search", "value"),
+        Input("data-table", "sort_by"),
+    )
+    def update_export_links(leagues, seasons, levels, team_search, sort_by):
+        # La descarga aplica en el servidor los mismos filtros y orden que la tabla visible
+        sort = sort_by[0] if sort_by else {"column_id": "date", "direction": "desc"}
+        params = [("league", v) for v in leagues or []] + [("season", v) for v in seasons or []] \
+            + [("level", v) for v in levels or []] + [("sort", sort["column_id"]), ("dir", sort["direction"])]
+        search = normalize_search(team_search)
+        if search:
+            params.append(("q", search))
+        query = urlencode(params)
+        return f"/export?format=csv&{query}", f"/export?format=parquet&{query}"
+
+    @app.callback(
+        Output("data-table", "page_current"),
+        Input("data-league-filter", "value"),
+        Input("data-season-filter", "value"),
+        Input("data-level-filter", "value"),
+        Input("data-team-search", "value"),
+        Input("data-table", "sort_by"),
     )
-    def update_data_table(leagues, seasons, levels, team_search):
-        df = _apply_filters(scores_df.copy(), leagues, seasons, levels, team_search)
-        df = df.sort_values("date", ascending=False)
-        out = _prep_table_df(df)
-        return out.to_dict("records"), f"{len(out):,} partidos"
+    def reset_data_page(*_):
+        return 0
 
     @app.callback(
         Output("data-league-filter", "value"),
@@ -85,25 +120,20 @@ def register_callbacks(
         date_str = row.get("date", "?")
         mis = float(row.get("integrity_score", 0))
 
-        scores_date_col = pd.to_datetime(scores_df["date"], errors="coerce").dt.strftime("%Y-%m-%d")
-        leagues_date_col = pd.to_datetime(leagues_df["date"], errors="coerce").dt.strftime("%Y-%m-%d")
-
-        orig = scores_df[
-            (scores_date_col == date_str)
-            & (scores_df["home_team"] == home)
-            & (scores_df["away_team"] == away)
-        ]
-        orig_league = leagues_df[
-            (leagues_date_col == date_str)
-            & (leagues_df["home_team"] == home)
-            & (leagues_df["away_team"] == away)
-        ]
+        # Índice construido al cargar los datos: la búsqueda no depende del tamaño del histórico
+        r, lr = get_data()["matches"].lookup(row.get("match_id"))
 
         iso_score = rf_score = lr_score = None
+        model_id = None
         result = home_goals = away_goals = None
         ht_result = None
-        if not orig.empty:
-            r = orig.iloc[0]
+        contributions = {}
+        if r is not None:
+            contributions = {
+                c[len("contrib_"):]: float(r[c])
+                for c in r.index if c.startswith("contrib_") and pd.notna(r[c])
+            }
+            model_id = r.get("model_id", None)
             iso_score = r.get("iso_score", None)
             rf_score = r.get("rf_score", None)
             lr_score = r.get("lr_score", None)
@@ -124,8 +154,7 @@ def register_callbacks(
 
         active_flags = []
         match_features = {}
-        if not orig_league.empty:
-            lr = orig_league.iloc[0]
+        if lr is not None:
             for col, (flag_label, flag_desc) in _FLAG_LABELS.items():
                 val = lr.get(col, None)
                 if val is not None and pd.notna(val) and int(val) == 1:
@@ -164,11 +193,11 @@ def register_callbacks(
                 dbc.Col(html.Small(f"{v:.0f}", className="text-light"), width=2),
             ], className="align-items-center mb-1")
 
+        # Pesos del bundle que puntuó el partido (scores antiguos sin model_id: el de ligas)
+        params = get_models()["params"].get(model_id if isinstance(model_id, str) else "leagues", DEFAULT_PARAMS)
         score_col = [
             html.H6("🧠 Scores por modelo", className="text-info mb-2"),
-            _bar("Isolation Forest (×0.35)", iso_score, 0.35),
-            _bar("Random Forest (×0.40)", rf_score, 0.40),
-            _bar("Logistic Regression (×0.25)", lr_score, 0.25),
+            *[_bar(lbl, val, weight) for (lbl, weight), val in zip(_model_labels(params), [iso_score, rf_score, lr_score])],
             html.Hr(className="my-2"),
             dbc.Row([
                 dbc.Col(html.Small("MIS Final", className="text-muted"), width=5),
@@ -183,6 +212,19 @@ def register_callbacks(
             ], className="align-items-center"),
         ]
 
+        drivers = sorted(contributions.items(), key=lambda kv: -abs(kv[1]))[:5]
+        if drivers:
+            score_col.append(html.Hr(className="my-2"))
+            score_col.append(html.H6("📌 Features que más pesan en el MIS", className="text-info mb-2"))
+            for feat, pts in drivers:
+                score_col.append(dbc.Row([
+                    dbc.Col(html.Small(feat, className="text-muted"), width=8),
+                    dbc.Col(html.Small(
+                        f"{pts:+.1f}",
+                        className="text-warning fw-bold" if pts > 0 else "text-success",
+                    ), width=4),
+                ], className="mb-1"))
+
         flags_col = [html.H6("🚩 Flags activados", className="text-warning mb-2")]
         if active_flags:
             for fl, desc in active_flags:
@@ -190,6 +232,15 @@ def register_callbacks(
                     dbc.Badge(f"🚩 {fl}", color="warning", className="text-dark mb-1"),
                     html.P(desc, className="text-muted small mb-2 ms-1"),
                 ]))
+        elif drivers:
+            flags_col.append(html.Div([
+                html.P("Ningún flag binario activado.", className="text-success small mb-1"),
+                html.P(
+                    f"El MIS se explica sobre todo por {drivers[0][0]} ({drivers[0][1]:+.1f} puntos). "
+                    "Ver desglose por feature →",
+                    className="text-muted small",
+                ),
+            ]))
         else:
             flags_col.append(html.Div([
                 html.P("Ningún flag binario activado.", className="text-success small mb-1"),
@@ -244,3 +295,109 @@ def register_callbacks(
             ]),
         ], className="border mt-2", style={"borderColor": color, "borderWidth": "2px"})
 
+
+    @app.callback(
+        Output("input-odds-movement", "value"),
+        Output("input-result-surprise", "value"),
+        Output("input-ht-changed", "value"),
+        Output("input-total-goals", "value"),
+        Output("input-cards", "value"),
+        Output("input-flags", "value"),
+        Input("what-if-reset", "n_clicks"),
+        Input("what-if-load-match", "n_clicks"),
+        State("data-table", "selected_rows"),
+        State("data-table", "data"),
+        prevent_initial_call=True,
+    )
+    def fill_what_if(_reset, _load, selected_rows, rows):
+        what_if = get_models()["what_if"]
+        if what_if is None:
+            return (no_update,) * 6
+        if ctx.triggered_id == "what-if-reset":
+            return what_if_inputs(what_if.baseline)
+        # Features reales del partido seleccionado en la pestaña de partidos
+        if not selected_rows or not rows:
+            return (no_update,) * 6
+        _, features = get_data()["matches"].lookup(rows[selected_rows[0]].get("match_id"))
+        if features is None:
+            return (no_update,) * 6
+        return what_if_inputs({**what_if.baseline, **features.dropna().to_dict()})
+
+    @app.callback(
+        Output("prediction-result", "children"),
+        Input("input-odds-movement", "value"),
+        Input("input-result-surprise", "value"),
+        Input("input-ht-changed", "value"),
+        Input("input-total-goals", "value"),
+        Input("input-cards", "value"),
+        Input("input-flags", "value"),
+    )
+    def update_what_if(odds, surprise, ht_changed, goals, cards, flags):
+        models = get_models()
+        what_if = models["what_if"]
+        if what_if is None:
+            return html.P("Modelos no disponibles.", className="text-muted")
+        values = {
+            "odds_movement_abs_max": float(odds) / 100 if odds is not None else None,
+            "result_surprise": float(surprise or 0),
+            "ht_result_changed": float(ht_changed or 0),
+            "total_goals": goals,
+            "total_cards": cards,
+        }
+        values.update({col: float(col in (flags or [])) for col in MANUAL_FLAGS})
+        # Mismos valores, mismo resultado: la clave incluye la versión de los modelos cargados
+        key = ("what_if", models["version"], tuple(sorted(values.items())))
+        result = get_cache().get_or_compute(key, lambda: what_if.score(values), version=get_data()["version"])
+        return _what_if_result(result, what_if.scorer.params, ALERT_COLORS, ALERT_ICONS, ALERT_LABELS)
+
+
+def _score_bar(label, value, color=None, height="16px"):
+    color = color or ("#e74c3c" if value >= 70 else "#e67e22" if value >= 50 else "#f39c12" if value >= 30 else "#27ae60")
+    return dbc.Row([
+        dbc.Col(html.Small(label, className="text-muted"), width=5),
+        dbc.Col(dbc.Progress(
+            children=[dbc.Progress(value=value, bar=True, style={"backgroundColor": color})],
+            value=value, max=100, style={"height": height},
+        ), width=5),
+        dbc.Col(html.Small(f"{value:.1f}", className="text-light"), width=2),
+    ], className="align-items-center mb-1")
+
+
+def _model_labels(params):
+    # Nombre y peso de cada modelo según los parámetros del bundle (pesos tunables, RF o HGB)
+    supervised = "Random Forest" if params.get("supervised_model") == "random_forest" else "Gradient Boosting"
+    return [
+        (f"Isolation Forest (×{params['weight_if']:.2f})", params["weight_if"]),
+        (f"{supervised} (×{params['weight_rf']:.2f})", params["weight_rf"]),
+        (f"Logistic Regression (×{params['weight_lr']:.2f})", params["weight_lr"]),
+    ]
+
+
+def _what_if_result(result, params, ALERT_COLORS, ALERT_ICONS, ALERT_LABELS):
+    level = result["alert_level"]
+    color = ALERT_COLORS.get(level, "#95a5a6")
+    mis = result["integrity_score"]
+    drivers = sorted(result["contributions"].items(), key=lambda kv: -abs(kv[1]))[:5]
+    active = [col for col, v in result["features"].items() if col.startswith("flag_") and v]
+
+    return html.Div([
+        html.Div([
+            html.H1(f"{mis:.1f}", className="mb-0", style={"color": color}),
+            dbc.Badge(f"{ALERT_ICONS.get(level, '⚪')} {ALERT_LABELS.get(level, level)}", style={"backgroundColor": color}),
+            html.P("Match Integrity Score", className="text-muted small mt-1"),
+        ], className="text-center mb-3"),
+        html.H6("🧠 Scores por modelo", className="text-info mb-2"),
+        *[_score_bar(lbl, result[key]) for (lbl, _), key in zip(_model_labels(params), ["iso_score", "rf_score", "lr_score"])],
+        html.Hr(className="my-2"),
+        _score_bar("MIS Final", mis, color=color, height="20px"),
+        html.Hr(className="my-2"),
+        html.H6("📌 Qué mueve el score", className="text-info mb-2"),
+        *[
+            dbc.Row([
+                dbc.Col(html.Small(col, className="text-muted"), width=8),
+                dbc.Col(html.Small(f"{v:+.1f}", className="text-warning" if v > 0 else "text-success"), width=4),
+            ], className="mb-1")
+            for col, v in drivers
+        ],
+        html.P(f"Flags activos: {', '.join(active) if active else 'ninguno'}", className="text-muted small mt-2 mb-0"),
+    ])
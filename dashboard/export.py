@@ -0,0 +1,116 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dashboard.result_cache import normalize_search
+
+# Filas por bloque: la memoria de una descarga no depende del tamaño de la selección
+EXPORT_CHUNK_ROWS = int(os.environ.get("FPS_EXPORT_CHUNK_ROWS", "20000"))
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _query_values(table, col, values):
+    # Los parámetros de la URL llegan como texto: se traducen a los valores de la columna (temporadas numéricas)
+    by_text = {str(value): value for value in table.categories.get(col, {})}
+    return [by_text[v] for v in values if v in by_text]
+
+
+def export_rows(table, leagues=None, seasons=None, levels=None, team_search=None, sort_by=None):
+    # Mismos filtros y orden que la tabla de partidos (ScoresTable), sobre los índices ya cargados
+    filters = {}
+    for col, values in (("league_name", leagues), ("season", seasons), ("alert_level", levels)):
+        if values:
+            filters[col] = _query_values(table, col, values)
+            if not filters[col]:
+                return np.empty(0, dtype=np.int32)
+    mask = table.mask(filters.get("league_name"), filters.get("season"), filters.get("alert_level"),
+                      normalize_search(team_search))
+    return table.rows(mask, sort_by)
+
+
+def export_chunks(data, rows, chunk_size=EXPORT_CHUNK_ROWS):
+    # Scores (con scores por modelo y aportaciones contrib_*) + features del store, bloque a bloque
+    scores = data["scores"]
+    features = data["leagues"]
+    matches = data["matches"]
+    ids = data["table"].display["match_id"].to_numpy()
+    feature_cols = [c for c in features.columns if c not in scores.columns and c != "match_id"]
+    # Enteros y booleanos pasan a float: un bloque con partidos sin features tendría NaN y el
+    # esquema cambiaría entre bloques
+    widen = {c: "float64" for c in feature_cols
+             if pd.api.types.is_integer_dtype(features[c]) or pd.api.types.is_bool_dtype(features[c])}
+    # Selección vacía: un bloque vacío, para que el fichero tenga al menos la cabecera/esquema
+    for start in range(0, max(len(rows), 1), chunk_size):
+        block = rows[start:start + chunk_size]
+        chunk = scores.iloc[block].reset_index(drop=True)
+        if "match_id" not in chunk.columns:
+            chunk.insert(0, "match_id", ids[block])
+        if feature_cols and len(features):
+            positions = matches.feature_rows.reindex(chunk["match_id"].to_numpy())
+            found = positions.notna().to_numpy()
+            part = features[feature_cols].iloc[positions.fillna(0).to_numpy(dtype=np.int64)].reset_index(drop=True)
+            part = part.astype(widen)
+            # Partidos sin fila en el store (p. ej. Europa League): features vacías
+            chunk = pd.concat([chunk, part.where(np.broadcast_to(found[:, None], part.shape))], axis=1)
+        yield chunk
+
+
+def stream_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+
+
+class _Drain:
+    # Fichero de solo escritura que entrega lo escrito en cada pop(): el Parquet sale por la
+    # respuesta a medida que se cierran los row groups, sin montarse entero en memoria
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def pop(self):
+        out = b"".join(self.parts)
+        self.parts = []
+        return out
+
+
+def stream_parquet(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _Drain()
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+            # Un row group por bloque, con el esquema del primero (mismos tipos en todo el fichero)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.pop()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.pop()
@@ -0,0 +1,22 @@
+import os
+
+# Servidor de producción del dashboard. Con preload_app los datos se cargan una vez en el
+# proceso maestro (mmap de data/serving/*.arrow) y los workers los comparten tras el fork
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+workers = int(os.environ.get("FPS_WORKERS", "2"))
+threads = int(os.environ.get("FPS_THREADS", "4"))
+worker_class = "gthread"
+preload_app = True
+timeout = int(os.environ.get("FPS_WORKER_TIMEOUT", "60"))
+max_requests = 1000
+max_requests_jitter = 100
+accesslog = "-"
+
+
+def when_ready(server):
+    # Solo el maestro vigila las fuentes: al cambiar recarga la instantánea y sustituye los workers
+    # (dashboard/wsgi.py). Un worker reciclado por max_requests nace también con la versión al día
+    from dashboard.app import start_watcher
+    from dashboard.wsgi import reload_and_respawn
+
+    start_watcher(reload_and_respawn)
@@ -0,0 +1,95 @@
+from pathlib import Path
+import threading
+import time
+import os
+
+# Cada cuántos segundos se comprueba si hay scores o modelos nuevos (0 desactiva la recarga)
+RELOAD_INTERVAL = float(os.environ.get("FPS_RELOAD_INTERVAL", "30"))
+
+
+def file_signature(paths):
+    # (ruta, mtime_ns, tamaño) de cada fichero existente: cambia con cada escritura o reemplazo
+    signature = []
+    for path in paths:
+        try:
+            stat = Path(path).stat()
+        except OSError:
+            continue
+        signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class SnapshotWatcher:
+    # Hilo en segundo plano que compara la firma de las fuentes con la cargada y, cuando cambia,
+    # prepara la instantánea nueva fuera de las peticiones y la publica de una vez
+
+    def __init__(self, signature, reload, interval=RELOAD_INTERVAL):
+        self.signature = signature
+        self.reload = reload
+        self.interval = interval
+        self.loaded = None
+        self.pending = None
+        self.reloads = 0
+        self.errors = 0
+        self.last_reload = None
+        self.last_error = None
+        self.pid = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, loaded=None):
+        # Los hilos no sobreviven al fork: con gunicorn se arranca en el maestro (when_ready)
+        if self.interval <= 0 or (self.thread is not None and self.pid == os.getpid() and self.thread.is_alive()):
+            return self
+        self.loaded = loaded if loaded is not None else self.signature()
+        self.pending = None
+        self.pid = os.getpid()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="fps-hot-reload", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        current = self.signature()
+        if current == self.loaded:
+            self.pending = None
+            return False
+        # Se espera a que la firma sea estable durante un intervalo: los modelos se guardan en
+        # varios ficheros y no conviene cargar un conjunto a medio escribir
+        if current != self.pending:
+            self.pending = current
+            return False
+        try:
+            self.reload()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"⚠️  Recarga fallida, se mantiene la versión anterior: {self.last_error}")
+            return False
+        self.loaded = current
+        self.pending = None
+        self.reloads += 1
+        self.last_reload = time.time()
+        return True
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            # Con gunicorn el hilo vive en el maestro, el proceso padre de cada worker
+            "running": self.thread is not None and (self.pid == os.getppid()
+                                                    or (self.pid == os.getpid() and self.thread.is_alive())),
+            "watcher_pid": self.pid,
+            "interval_seconds": self.interval,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_reload": self.last_reload,
+            "last_error": self.last_error,
+            "pending": self.pending is not None,
+        }
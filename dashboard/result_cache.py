@@ -0,0 +1,122 @@
+from collections import OrderedDict
+import numpy as np
+import threading
+import time
+import sys
+import os
+
+# Tamaño máximo y vida de las entradas; configurables por entorno para el despliegue
+MAX_BYTES = int(float(os.environ.get("FPS_CACHE_MAX_MB", "64")) * 1024 * 1024)
+TTL_SECONDS = float(os.environ.get("FPS_CACHE_TTL", "600"))
+
+
+def estimate_size(value, depth=0):
+    # Aproximación en bytes: arrays por nbytes, componentes y figuras por su JSON de plotly
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, "to_plotly_json") and depth < 50:
+        return estimate_size(value.to_plotly_json(), depth + 1)
+    if isinstance(value, dict) and depth < 50:
+        return sys.getsizeof(value) + sum(estimate_size(k, depth + 1) + estimate_size(v, depth + 1)
+                                          for k, v in value.items())
+    if isinstance(value, (list, tuple)) and depth < 50:
+        return sys.getsizeof(value) + sum(estimate_size(v, depth + 1) for v in value)
+    return sys.getsizeof(value)
+
+
+def normalize(values):
+    # Los dropdowns devuelven None, [] o listas en cualquier orden: misma selección, misma clave
+    if not values:
+        return ()
+    return tuple(sorted(values, key=str))
+
+
+def normalize_search(text, min_length=2):
+    text = (text or "").strip().lower()
+    return text if len(text) >= min_length else ""
+
+
+class ResultCache:
+    # LRU con caducidad y tope de memoria; se vacía al cambiar la versión de los datos
+
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def _drop(self, key):
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def _sync_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.bytes = 0
+            self.version = version
+
+    def get_or_compute(self, key, compute, version=None):
+        now = time.monotonic()
+        with self.lock:
+            self._sync_version(version)
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, created, _ = entry
+                if now - created <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._drop(key)
+                self.expirations += 1
+            self.misses += 1
+
+        # El cálculo se hace fuera del lock: dos peticiones iguales a la vez pueden calcular ambas
+        value = compute()
+        size = estimate_size(value)
+        with self.lock:
+            if version != self.version or size > self.max_bytes:
+                return value
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, now, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+_CACHE = ResultCache()
+
+
+def get_cache():
+    return _CACHE
@@ -0,0 +1,76 @@
+import pandas as pd
+from pathlib import Path
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import DATA_DIR
+
+# Copias Arrow IPC (sin compresión) de los datasets del dashboard: se abren con mmap, así que
+# los workers de gunicorn comparten las columnas numéricas a través de la caché de páginas del SO
+SERVING_DIR = DATA_DIR / "serving"
+
+
+def _arrow_column(values):
+    import pyarrow as pa
+
+    if pd.api.types.is_float_dtype(values):
+        # NaN se guarda como valor, no como nulo: la lectura no tiene que rellenar y no copia
+        return pa.array(values.to_numpy(), from_pandas=False)
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values) \
+            or pd.api.types.is_datetime64_any_dtype(values):
+        return pa.Array.from_pandas(values)
+    # Texto: diccionario (códigos + valores únicos) → Categorical en pandas, mucho más compacto que object
+    text = values.where(values.isna(), values.astype(str))
+    return pa.array(text, type=pa.string(), from_pandas=True).dictionary_encode()
+
+
+def source_key(source_path):
+    stat = Path(source_path).stat()
+    return f"{Path(source_path).resolve()}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def write_arrow(df, path, source=""):
+    import pyarrow as pa
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_arrays([_arrow_column(df[col]) for col in df.columns], names=list(map(str, df.columns)))
+    table = table.replace_schema_metadata({"fps_source": source})
+    # Temporal por proceso: varios workers pueden regenerar la misma copia a la vez tras una recarga
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    # Los procesos que ya mapearon el fichero anterior siguen leyendo su versión hasta soltarla
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_arrow(path):
+    import pyarrow as pa
+
+    # El mapa no se cierra aquí: lo mantienen vivo los buffers de la tabla y del DataFrame
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    # split_blocks evita consolidar columnas en un bloque nuevo: las float quedan como vistas del mmap
+    return table.to_pandas(split_blocks=True)
+
+
+def _stored_source(path):
+    import pyarrow as pa
+
+    try:
+        metadata = pa.ipc.open_file(pa.memory_map(str(path), "r")).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    return metadata.get(b"fps_source", b"").decode()
+
+
+def mapped_frame(name, source_path, read_source):
+    # Regenera la copia Arrow si falta o si la fuente cambió (ruta, fecha o tamaño); si no, solo mapea
+    path = SERVING_DIR / f"{name}.arrow"
+    source = source_key(source_path)
+    if not path.exists() or _stored_source(path) != source:
+        write_arrow(read_source(), path, source)
+    return read_arrow(path)
+
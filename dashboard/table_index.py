@@ -0,0 +1,194 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import unicodedata
+import sys
+import re
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from processing.feature_store import match_ids
+
+# Columnas que viajan al navegador: las de la tabla más match_id para el detalle
+TABLE_COLUMNS = ["match_id", "date", "home_team", "away_team", "score_display", "league_name",
+                 "season", "integrity_score", "alert_level"]
+FILTER_COLUMNS = ["league_name", "season", "alert_level"]
+# Parecido mínimo (trigramas compartidos / trigramas de la consulta) para aceptar un nombre con erratas
+FUZZY_THRESHOLD = 0.5
+
+
+def _ids(df):
+    # Scores antiguos (sin match_id): el id se calcula con la misma clave que el feature store
+    if "match_id" in df.columns:
+        return df["match_id"].to_numpy()
+    if df.empty:
+        return np.empty(0, dtype=np.int64)
+    return match_ids(df)
+
+
+def _display_frame(scores):
+    # Formato de la tabla calculado una sola vez al cargar los datos, no en cada callback
+    out = pd.DataFrame(index=scores.index)
+    for col in TABLE_COLUMNS:
+        if col in scores.columns:
+            out[col] = scores[col]
+    out["match_id"] = _ids(scores)
+    if "date" in out.columns:
+        out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.strftime("%Y-%m-%d")
+    if "home_goals" in scores.columns and "away_goals" in scores.columns:
+        out["score_display"] = (
+            scores["home_goals"].fillna("?").astype(str)
+            + " - "
+            + scores["away_goals"].fillna("?").astype(str)
+        )
+    return out.reset_index(drop=True)
+
+
+def fold(text):
+    # Minúsculas sin acentos ni signos: "Atlético" y "atletico" son la misma búsqueda
+    ascii_text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", " ", ascii_text.lower()).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TeamSearch:
+    # Índice de trigramas sobre los nombres únicos de equipo; cada equipo apunta a sus filas (local o visitante)
+
+    def __init__(self, home, away):
+        n = len(home)
+        teams = pd.Categorical(pd.concat([home, away]).astype(str).to_numpy())
+        self.names = [fold(t) for t in teams.categories]
+        codes = teams.codes
+        positions = np.concatenate([np.arange(n), np.arange(n)]).astype(np.int32)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(self.names) + 1))
+        self.team_rows = [np.unique(positions[order[bounds[i]:bounds[i + 1]]]) for i in range(len(self.names))]
+        self.n = n
+        self.grams = {}
+        for team_id, name in enumerate(self.names):
+            for gram in trigrams(name):
+                self.grams.setdefault(gram, set()).add(team_id)
+
+    def teams(self, query):
+        query = fold(query)
+        if not query:
+            return []
+        if len(query) < 3:
+            return [i for i, name in enumerate(self.names) if query in name]
+        # Subcadena exacta: los candidatos son la intersección de los equipos de cada trigrama interior
+        inner = {query[i:i + 3] for i in range(len(query) - 2)}
+        candidates = set.intersection(*(self.grams.get(g, set()) for g in inner))
+        exact = [i for i in candidates if query in self.names[i]]
+        if exact:
+            return exact
+        # Sin coincidencia exacta: equipos que comparten suficientes trigramas (erratas, letras cambiadas)
+        query_grams = trigrams(query)
+        shared = {}
+        for gram in query_grams:
+            for team_id in self.grams.get(gram, ()):
+                shared[team_id] = shared.get(team_id, 0) + 1
+        return [i for i, count in shared.items() if count / len(query_grams) >= FUZZY_THRESHOLD]
+
+    def mask(self, query):
+        mask = np.zeros(self.n, dtype=bool)
+        for team_id in self.teams(query):
+            mask[self.team_rows[team_id]] = True
+        return mask
+
+
+def _sort_key(values):
+    # Clave numérica por columna (NaN = ausente): fechas en ns, texto por su posición en orden alfabético
+    if pd.api.types.is_datetime64_any_dtype(values):
+        key = values.to_numpy(dtype="datetime64[ns]").astype("int64").astype(float)
+        key[values.isna().to_numpy()] = np.nan
+        return key
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=float)
+    codes = pd.Categorical(values.astype("string")).codes.astype(float)
+    codes[codes < 0] = np.nan
+    return codes
+
+
+class ScoresTable:
+    # Índice de la tabla de partidos: filtros sobre códigos enteros, órdenes precalculados y
+    # serialización solo de la página visible
+
+    def __init__(self, scores):
+        self.display = _display_frame(scores)
+        self.n = len(self.display)
+        self.codes = {}
+        self.categories = {}
+        for col in FILTER_COLUMNS:
+            if col in scores.columns:
+                cat = pd.Categorical(scores[col].to_numpy())
+                self.codes[col] = cat.codes
+                self.categories[col] = {value: i for i, value in enumerate(cat.categories)}
+        self.teams = TeamSearch(scores["home_team"], scores["away_team"])
+        self.sort_keys = {col: scores[col].reset_index(drop=True) for col in TABLE_COLUMNS if col in scores.columns}
+        if "score_display" in self.display.columns:
+            self.sort_keys["score_display"] = self.display["score_display"]
+        self.orders = {}
+
+    def _match_codes(self, col, values):
+        lookup = self.categories.get(col, {})
+        return [lookup[v] for v in values if v in lookup]
+
+    def mask(self, leagues=None, seasons=None, levels=None, team_search=None):
+        mask = np.ones(self.n, dtype=bool)
+        for col, values in (("league_name", leagues), ("season", seasons), ("alert_level", levels)):
+            if values and col in self.codes:
+                mask &= np.isin(self.codes[col], self._match_codes(col, values))
+        if team_search and len(team_search) >= 2:
+            mask &= self.teams.mask(team_search)
+        return mask
+
+    def order(self, column="date", direction="desc"):
+        # Orden global por columna, calculado la primera vez que se pide; filtrar después conserva el orden
+        if column not in self.sort_keys:
+            column = "date"
+        if (column, direction) not in self.orders:
+            key = _sort_key(self.sort_keys[column])
+            key = -key if direction == "desc" else key
+            self.orders[(column, direction)] = np.argsort(key, kind="stable")
+        return self.orders[(column, direction)]
+
+    def rows(self, mask, sort_by=None):
+        # Filas filtradas en el orden pedido (int32); es lo que guarda la caché de resultados
+        sort = sort_by[0] if sort_by else {"column_id": "date", "direction": "desc"}
+        order = self.order(sort["column_id"], sort["direction"])
+        return order[mask[order]].astype(np.int32)
+
+    def page(self, rows, page_current=0, page_size=20):
+        total = len(rows)
+        page_count = max(1, -(-total // page_size))
+        page_current = min(page_current or 0, page_count - 1)
+        start = page_current * page_size
+        records = self.display.iloc[rows[start:start + page_size]].to_dict("records")
+        return records, total, page_count
+
+
+class MatchIndex:
+    # match_id → fila en scores y en el store de features; el detalle de un partido es una búsqueda en un hash
+
+    def __init__(self, scores, features):
+        self.scores = scores
+        self.features = features
+        self.score_rows = self._positions(scores)
+        self.feature_rows = self._positions(features)
+
+    @staticmethod
+    def _positions(df):
+        positions = pd.Series(np.arange(len(df)), index=_ids(df))
+        return positions[~positions.index.duplicated()]
+
+    def lookup(self, match_id):
+        if match_id is None:
+            return None, None
+        score_pos = self.score_rows.get(match_id)
+        feature_pos = self.feature_rows.get(match_id)
+        score_row = self.scores.iloc[score_pos] if score_pos is not None else None
+        feature_row = self.features.iloc[feature_pos] if feature_pos is not None else None
+        return score_row, feature_row
@@ -0,0 +1,103 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import ODDS_MOVEMENT_SUSPICIOUS_PCT
+from models.integrity_scorer import IntegrityScorer, ALERT_BINS, ALERT_LEVELS
+
+# Flags que el pipeline deriva de otras features: en el simulador se recalculan igual
+DERIVED_FLAGS = {
+    "flag_odds_movement": lambda f: float(abs(f["odds_movement_abs_max"]) > ODDS_MOVEMENT_SUSPICIOUS_PCT),
+    "flag_result_surprise": lambda f: f["result_surprise"],
+    "flag_ht_result_changed": lambda f: f["ht_result_changed"],
+}
+# Flags que dependen del historial del equipo o de la liga: se marcan a mano
+MANUAL_FLAGS = ["flag_streak_break", "flag_goals_anomaly_home", "flag_goals_anomaly_away", "flag_cards_anomaly"]
+
+
+def load_scorer(prefix="fps_leagues", reference=None):
+    # El mismo scorer que puntúa el histórico, con los árboles compilados; None si no hay modelos
+    try:
+        scorer = IntegrityScorer()
+        scorer.load(prefix, compiled=True)
+        # Bundles sin árboles compilados guardados: se compilan aquí, antes de usarlos
+        if scorer.compiled_ is None:
+            scorer.compile()
+        # Las filas simuladas no deben contar como datos puntuados en el informe de drift
+        scorer.drift_reference_ = None
+        if scorer.iso_range_ is None and reference is not None and len(reference):
+            # Modelos antiguos sin rango guardado: se fija una vez sobre el histórico. Con una sola
+            # fila el rango min/max del bloque es degenerado y el score del IF no significaría nada
+            X_scaled = scorer.transform_block(reference)
+            raw = scorer.compiled_["isolation_forest"].decision_function(X_scaled)
+            scorer.iso_range_ = (float(raw.min()), float(raw.max()))
+    except Exception as e:
+        print(f"Error loading models: {e}")
+        return None
+    return scorer
+
+
+class WhatIf:
+    # Puntuación de una sola fila sobre el scorer ya cargado y calentado: cada recálculo es una
+    # llamada de pocos ms, sin DataFrames intermedios
+
+    def __init__(self, scorer, baseline=None):
+        self.scorer = scorer
+        self.feature_cols = list(scorer.feature_cols)
+        self.baseline = {col: float((baseline or {}).get(col, 0.0)) for col in self.feature_cols}
+        self.mean = np.asarray(scorer.scaler.mean_, dtype=np.float64)
+        self.scale = np.asarray(scorer.scaler.scale_, dtype=np.float64)
+
+    def features(self, values):
+        # Completa con la línea base y recalcula los flags derivados
+        features = dict(self.baseline)
+        features.update({k: float(v) for k, v in values.items() if k in features and v is not None})
+        for col, derive in DERIVED_FLAGS.items():
+            if col in features:
+                features[col] = derive(features)
+        return features
+
+    def score(self, values):
+        features = self.features(values)
+        # Array propio por llamada: los hilos de gunicorn pueden puntuar a la vez
+        X = np.array([[features[col] for col in self.feature_cols]], dtype=np.float32)
+        X[np.isnan(X)] = 0
+        # Mismo escalado que transform_block (float64 redondeado a float32): mismo score que el batch
+        np.divide(X - self.mean, self.scale, out=X, casting="same_kind")
+        integrity, iso_norm, rf_proba, lr_proba = self.scorer.score_scaled(X)
+        contributions = self.scorer.explain_scaled(X, iso_norm, lr_proba)[0]
+        score = float(integrity[0])
+        return {
+            "features": features,
+            "integrity_score": round(score, 2),
+            "alert_level": str(pd.cut([score], bins=ALERT_BINS, labels=ALERT_LEVELS)[0]),
+            "iso_score": round(float(iso_norm[0]) * 100, 2),
+            "rf_score": round(float(rf_proba[0]) * 100, 2),
+            "lr_score": round(float(lr_proba[0]) * 100, 2),
+            "contributions": dict(zip(self.feature_cols, np.round(contributions, 2).tolist())),
+        }
+
+    def warm(self):
+        # Primera llamada al cargar: compila/reserva todo lo perezoso antes de la primera petición
+        return self.score({})
+
+
+def baseline_features(features, feature_cols):
+    # Partido típico: mediana de cada feature en el store, sin flags manuales marcados
+    cols = [c for c in feature_cols if c in features.columns]
+    if features.empty or not cols:
+        return {}
+    baseline = features[cols].apply(pd.to_numeric, errors="coerce").median().fillna(0).to_dict()
+    baseline.update({col: 0.0 for col in MANUAL_FLAGS if col in baseline})
+    return baseline
+
+
+def load_what_if(features, prefix="fps_leagues"):
+    scorer = load_scorer(prefix, reference=features)
+    if scorer is None:
+        return None
+    what_if = WhatIf(scorer, baseline_features(features, scorer.feature_cols))
+    what_if.warm()
+    return what_if
@@ -0,0 +1,29 @@
+from pathlib import Path
+import signal
+import gc
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dashboard.app import app, warm_up, reload_snapshot
+
+# Punto de entrada WSGI: gunicorn -c dashboard/gunicorn.conf.py dashboard.wsgi:server
+print("\n🛡️  Fair Play Shield Dashboard v2 (gunicorn)")
+warm_up()
+# Los objetos cargados pasan a la generación permanente del GC: sus recorridos no tocan las
+# páginas compartidas tras el fork (evita copias copy-on-write en cada worker)
+gc.freeze()
+
+
+def reload_and_respawn():
+    # Recarga en el proceso maestro y pide workers nuevos (SIGHUP: gunicorn arranca los nuevos y cierra
+    # los anteriores al terminar sus peticiones). Los nuevos heredan la instantánea con el fork y la
+    # comparten copy-on-write: DataFrames, índices y modelos se construyen una vez, no una por worker
+    reload_snapshot()
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+    os.kill(os.getpid(), signal.SIGHUP)
+
+
+server = app.server
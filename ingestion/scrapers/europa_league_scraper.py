@@ -322,7 +322,7 @@ def save_data(df, filename="europa_league_matches.csv"):
     return filepath
 
 
-def run(seasons_back=5):
+def run(seasons_back=5, save=True):
     df = scrape_europa_league(seasons_back=seasons_back, thorough=False)
 
     if df.empty:
@@ -333,7 +333,7 @@ def run(seasons_back=5):
         print("[ERROR] No se pudieron obtener datos de Europa League")
         return None, None
 
-    path = save_data(df)
+    path = save_data(df) if save else None
     return df, path
 
 
@@ -274,11 +274,11 @@ def save_data(df, filename="european_leagues_with_odds.csv"):
     return filepath
 
 
-def run(seasons_back=5):
+def run(seasons_back=5, save=True):
     df = scrape_european_leagues(seasons_back=seasons_back)
     if df.empty:
         return None, None
-    path = save_data(df)
+    path = save_data(df) if save else None
     return df, path
 
 
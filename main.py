@@ -4,9 +4,7 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
-from ingestion.scrapers.europa_league_scraper import run as scrape_europa_league
-from ingestion.scrapers.european_leagues_scraper import run as scrape_european_leagues
-from processing.data_cleaning import process_and_save
+# Los módulos de cada paso (pandas, requests, pyarrow) se importan solo si el paso se ejecuta
 
 
 def main():
@@ -15,9 +13,9 @@ def main():
     )
     parser.add_argument(
         "--step",
-        choices=["scrape", "process", "all"],
+        choices=["scrape", "process", "score", "all"],
         default="all",
-        help="Paso a ejecutar: scrape, process, all",
+        help="Paso a ejecutar: scrape, process, score, all",
     )
     parser.add_argument(
         "--seasons",
@@ -25,75 +23,31 @@ def main():
         default=5,
         help="Número de temporadas hacia atrás (default: 5)",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignorar la caché de etapas y recalcular todo",
+    )
     args = parser.parse_args()
 
-    if args.step in ("scrape", "all"):
-        print("\n" + "=" * 60)
-        print("PASO 1A: DESCARGA UEFA EUROPA LEAGUE")
-        print("=" * 60)
-        df_el, el_path = scrape_europa_league(seasons_back=args.seasons)
-        if df_el is not None:
-            print(f"[OK] Europa League: {len(df_el)} partidos")
-        else:
-            print("[WARN] No se pudieron obtener datos de Europa League")
-
-        print("\n" + "=" * 60)
-        print("PASO 1B: DESCARGA LIGAS EUROPEAS (con cuotas)")
-        print("=" * 60)
-        df_leagues, leagues_path = scrape_european_leagues(seasons_back=args.seasons)
-        if df_leagues is not None:
-            print(f"[OK] Ligas europeas: {len(df_leagues)} partidos")
-        else:
-            print("[WARN] No se pudieron obtener datos de ligas europeas")
-
-        if df_el is None and df_leagues is None:
-            print("[FATAL] No se pudieron obtener datos de ninguna fuente. Abortando.")
-            sys.exit(1)
-
-    if args.step in ("process", "all"):
-        print("\n" + "=" * 60)
-        print("PASO 2: LIMPIEZA Y FEATURE ENGINEERING")
-        print("=" * 60)
-
-        input_files = []
-        raw_dir = Path(__file__).resolve().parent / "data" / "raw"
-        for f in ["europa_league_matches.csv", "european_leagues_with_odds.csv"]:
-            if (raw_dir / f).exists():
-                input_files.append(f)
-
-        if not input_files:
-            print("[FATAL] No hay archivos de datos para procesar.")
-            sys.exit(1)
-
-        for input_file in input_files:
-            output_file = input_file.replace(".csv", "_processed.csv")
-            print(f"\n  Procesando: {input_file}")
-            try:
-                df_processed, proc_path = process_and_save(input_file, output_file)
-                print(f"  [OK] {len(df_processed)} partidos procesados → {output_file}")
+    # "all" encadena las etapas en un solo proceso: los DataFrames pasan en memoria
+    # y los CSV/Parquet intermedios se escriben en segundo plano. Las etapas cuyas entradas,
+    # código y configuración no han cambiado se omiten (data/cache/stage_manifest.json)
+    from processing.pipeline import run_pipeline
 
-                if "total_flags" in df_processed.columns:
-                    suspicious = df_processed[df_processed["total_flags"] >= 2].sort_values(
-                        "total_flags", ascending=False
-                    )
-                    if not suspicious.empty:
-                        display_cols = ["date", "home_team", "away_team", "home_goals",
-                                        "away_goals", "result", "season", "total_flags"]
-                        available = [c for c in display_cols if c in suspicious.columns]
-                        print(f"\n  Partidos con 2+ anomalías ({len(suspicious)}):")
-                        print(f"  {suspicious[available].head(15).to_string(index=False)}")
-            except Exception as e:
-                print(f"  [ERROR] {e}")
+    steps = ["scrape", "process", "score"] if args.step == "all" else [args.step]
+    if run_pipeline(steps, seasons=args.seasons, force=args.force) is None:
+        sys.exit(1)
 
     print("\n" + "=" * 60)
     print("FAIR PLAY SHIELD - Pipeline completado!")
     print("=" * 60)
     print("\nArchivos generados en data/:")
     data_dir = Path(__file__).resolve().parent / "data"
-    for subdir in ["raw", "processed"]:
+    for subdir, pattern in [("raw", "*.csv"), ("processed", "*.csv"), ("features", "*.parquet")]:
         d = data_dir / subdir
         if d.exists():
-            for f in sorted(d.glob("*.csv")):
+            for f in sorted(d.glob(pattern)):
                 size_mb = f.stat().st_size / (1024 * 1024)
                 print(f"  {subdir}/{f.name} ({size_mb:.1f} MB)")
 
@@ -0,0 +1,230 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import hashlib
+import time
+import resource
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import PROCESSED_DATA_DIR, CACHE_DIR
+from processing.feature_store import ensure_store, load_features, source_path
+from models.integrity_scorer import (
+    IntegrityScorer,
+    FEATURE_COLS_LEAGUES,
+    MLFLOW_AVAILABLE,
+    MODEL_DIR,
+    setup_mlflow,
+    tracked_run,
+)
+
+
+BACKTEST_CACHE_DIR = CACHE_DIR / "backtest"
+
+# MIS a partir del cual un partido cuenta como positivo (suspicious + high_alert)
+ALERT_THRESHOLD = 60
+
+
+def _data_fingerprint(df, feature_cols):
+    cols = [c for c in df.columns if c in feature_cols or c.startswith("flag_") or c == "total_flags"]
+    cols += ["season"]
+    row_hashes = pd.util.hash_pandas_object(df[sorted(set(cols))], index=False).values
+    h = hashlib.sha1(row_hashes.tobytes())
+    h.update(",".join(feature_cols).encode())
+    return h.hexdigest()[:16]
+
+
+def build_folds(df, min_train_seasons=1):
+    seasons = sorted(df["season"].dropna().unique().tolist())
+    folds = []
+    for k in range(min_train_seasons, len(seasons)):
+        folds.append({
+            "fold": len(folds),
+            "train_seasons": seasons[:k],
+            "test_season": seasons[k],
+        })
+    return folds
+
+
+def prepare_fold_matrices(df, folds, feature_cols=None, cache_dir=BACKTEST_CACHE_DIR):
+    if feature_cols is None:
+        feature_cols = FEATURE_COLS_LEAGUES
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fingerprint = _data_fingerprint(df, feature_cols)
+
+    scorer = IntegrityScorer()
+    paths = []
+    for fold in folds:
+        key = hashlib.sha1(
+            f"{fingerprint}|{','.join(fold['train_seasons'])}|{fold['test_season']}".encode()
+        ).hexdigest()[:16]
+        path = cache_dir / f"fold_{key}.npz"
+        if path.exists():
+            print(f"  [CACHE] Fold {fold['fold']} ({fold['test_season']}): {path.name}")
+        else:
+            train_df = df[df["season"].isin(fold["train_seasons"])]
+            test_df = df[df["season"] == fold["test_season"]]
+            X_train = scorer.prepare_features(train_df, feature_cols)
+            y_train = scorer.create_synthetic_labels(train_df, X_train, verbose=False)
+            X_test = scorer.prepare_features(test_df, feature_cols)
+            y_test = scorer.create_synthetic_labels(test_df, X_test, verbose=False)
+            tmp_path = path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_path,
+                X_train=X_train.to_numpy(dtype=np.float64),
+                y_train=y_train.to_numpy(dtype=np.int8),
+                X_test=X_test.to_numpy(dtype=np.float64),
+                y_test=y_test.to_numpy(dtype=np.int8),
+                feature_cols=np.array(scorer.feature_cols),
+            )
+            os.replace(tmp_path, path)
+            print(f"  [BUILD] Fold {fold['fold']} ({fold['test_season']}): {len(X_train)} train / {len(X_test)} test")
+        paths.append(path)
+    return paths
+
+
+def _run_fold(fold, matrix_path):
+    from sklearn.metrics import roc_auc_score, precision_score, recall_score, f1_score
+
+    t0 = time.perf_counter()
+
+    with np.load(matrix_path) as data:
+        X_train, y_train = data["X_train"], data["y_train"]
+        X_test, y_test = data["X_test"], data["y_test"]
+        feature_cols = data["feature_cols"].tolist()
+
+    scorer = IntegrityScorer()
+    t_fit = time.perf_counter()
+    scorer.fit_matrix(X_train, y_train, feature_cols=feature_cols, verbose=False)
+    fit_seconds = time.perf_counter() - t_fit
+
+    t_score = time.perf_counter()
+    integrity_score, _, rf_proba, lr_proba = scorer.score_matrix(X_test)
+    score_seconds = time.perf_counter() - t_score
+
+    y_pred = (integrity_score > ALERT_THRESHOLD).astype(int)
+    has_both = len(np.unique(y_test)) > 1
+    return {
+        "fold": fold["fold"],
+        "train_seasons": f"{fold['train_seasons'][0]}..{fold['train_seasons'][-1]}",
+        "test_season": fold["test_season"],
+        "train_samples": len(y_train),
+        "test_samples": len(y_test),
+        "test_suspicious_pct": float(y_test.mean() * 100),
+        "auc": roc_auc_score(y_test, integrity_score) if has_both else np.nan,
+        "precision": precision_score(y_test, y_pred, zero_division=0),
+        "recall": recall_score(y_test, y_pred, zero_division=0),
+        "f1": f1_score(y_test, y_pred, zero_division=0),
+        "rf_auc": roc_auc_score(y_test, rf_proba) if has_both else np.nan,
+        "lr_auc": roc_auc_score(y_test, lr_proba) if has_both else np.nan,
+        "fit_seconds": fit_seconds,
+        "score_seconds": score_seconds,
+        "wall_seconds": time.perf_counter() - t0,
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def summarize_folds(folds_df):
+    metric_cols = ["auc", "precision", "recall", "f1", "rf_auc", "lr_auc", "wall_seconds", "peak_memory_mb"]
+    summary = {}
+    for col in metric_cols:
+        summary[f"{col}_mean"] = float(folds_df[col].mean())
+        summary[f"{col}_std"] = float(folds_df[col].std(ddof=0))
+    summary["n_folds"] = len(folds_df)
+    return summary
+
+
+def walk_forward_backtest(df, feature_cols=None, min_train_seasons=1, n_jobs=None, cache_dir=BACKTEST_CACHE_DIR):
+    if "season" not in df.columns:
+        raise ValueError("Walk-forward backtesting requires a 'season' column")
+
+    folds = build_folds(df, min_train_seasons=min_train_seasons)
+    if not folds:
+        raise ValueError(f"Se necesitan al menos {min_train_seasons + 1} temporadas para el backtesting")
+
+    print(f"\n  {len(folds)} folds walk-forward ({folds[0]['test_season']} → {folds[-1]['test_season']})")
+    paths = prepare_fold_matrices(df, folds, feature_cols=feature_cols, cache_dir=cache_dir)
+
+    n_jobs = n_jobs or min(len(folds), os.cpu_count() or 1)
+    # Un proceso nuevo por fold: ru_maxrss refleja el pico de memoria de ese fold
+    with ProcessPoolExecutor(max_workers=n_jobs, max_tasks_per_child=1) as pool:
+        fold_results = list(pool.map(_run_fold, folds, paths))
+
+    folds_df = pd.DataFrame(fold_results).sort_values("fold").reset_index(drop=True)
+    return folds_df, summarize_folds(folds_df)
+
+
+def log_backtest_to_mlflow(folds_df, summary, feature_cols, min_train_seasons):
+    if not MLFLOW_AVAILABLE:
+        return
+
+    with tracked_run(f"backtest_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}") as run:
+        run.log_param("backtest_type", "walk_forward_season")
+        run.log_param("min_train_seasons", min_train_seasons)
+        run.log_param("alert_threshold", ALERT_THRESHOLD)
+        run.log_param("features", ",".join(feature_cols))
+
+        for _, row in folds_df.iterrows():
+            for metric_name in ["auc", "precision", "recall", "f1", "rf_auc", "lr_auc",
+                                "wall_seconds", "peak_memory_mb"]:
+                if pd.notna(row[metric_name]):
+                    run.log_metric(f"fold_{metric_name}", float(row[metric_name]), step=int(row["fold"]))
+
+        for metric_name, metric_value in summary.items():
+            if pd.notna(metric_value):
+                run.log_metric(metric_name, metric_value)
+
+        folds_path = MODEL_DIR / "backtest_folds.csv"
+        folds_df.to_csv(folds_path, index=False)
+        run.log_artifact(str(folds_path))
+
+        print(f"[MLFLOW] Backtest queued for background upload")
+
+
+def run_backtest(min_train_seasons=1, n_jobs=None):
+    print("=" * 60)
+    print("FAIR PLAY SHIELD — Backtesting walk-forward por temporada")
+    print("=" * 60)
+
+    mlflow_enabled = setup_mlflow()
+
+    if ensure_store("leagues") is None:
+        print(f"[ERROR] No se encontró: {source_path('leagues')}")
+        return None, None
+
+    df = load_features("leagues")
+    print(f"\nDatos cargados: {len(df)} partidos")
+
+    folds_df, summary = walk_forward_backtest(
+        df, feature_cols=FEATURE_COLS_LEAGUES, min_train_seasons=min_train_seasons, n_jobs=n_jobs,
+    )
+
+    print("\n--- Resultados por fold ---")
+    display_cols = ["fold", "train_seasons", "test_season", "test_samples", "auc", "precision",
+                    "recall", "f1", "wall_seconds", "peak_memory_mb"]
+    print(folds_df[display_cols].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    print("\n--- Agregado ---")
+    for metric in ["auc", "precision", "recall", "f1"]:
+        print(f"  {metric:10s}: {summary[f'{metric}_mean']:.4f} ± {summary[f'{metric}_std']:.4f}")
+
+    output_path = PROCESSED_DATA_DIR / "backtest_folds.csv"
+    folds_df.to_csv(output_path, index=False)
+    print(f"\n[SAVED] Backtest guardado en: {output_path}")
+
+    if mlflow_enabled:
+        log_backtest_to_mlflow(folds_df, summary, FEATURE_COLS_LEAGUES, min_train_seasons)
+
+    return folds_df, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Backtesting walk-forward por temporada")
+    parser.add_argument("--min-train-seasons", type=int, default=1, help="Temporadas mínimas de entrenamiento (default: 1)")
+    parser.add_argument("--jobs", type=int, default=None, help="Folds en paralelo (default: nº de CPUs)")
+    args = parser.parse_args()
+    run_backtest(min_train_seasons=args.min_train_seasons, n_jobs=args.jobs)
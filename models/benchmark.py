@@ -0,0 +1,109 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import argparse
+import pickle
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import PROCESSED_DATA_DIR
+from processing.feature_store import ensure_store, load_features, source_path
+from models.integrity_scorer import IntegrityScorer, FEATURE_COLS_LEAGUES, SUPERVISED_MODELS, load_params
+
+
+def _expand_history(df, factor, seed=42):
+    if factor <= 1:
+        return df
+    rng = np.random.default_rng(seed)
+    copies = [df]
+    numeric = [c for c in FEATURE_COLS_LEAGUES if c in df.columns and not c.startswith("flag_")]
+    for _ in range(int(factor) - 1):
+        copy = df.copy()
+        for col in numeric:
+            values = pd.to_numeric(copy[col], errors="coerce")
+            copy[col] = values + rng.normal(0, values.std() * 0.05 + 1e-9, len(copy))
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def benchmark_supervised(df, feature_cols=None, models=None, repeats=3):
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import train_test_split
+
+    if feature_cols is None:
+        feature_cols = FEATURE_COLS_LEAGUES
+    if models is None:
+        models = SUPERVISED_MODELS
+
+    base = IntegrityScorer()
+    X = base.prepare_features(df, feature_cols)
+    y = base.create_synthetic_labels(df, X, verbose=False)
+    X_scaled = base.scaler.fit_transform(X)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X_scaled, y, test_size=0.2, random_state=42, stratify=y
+    )
+
+    rows = []
+    for name in models:
+        scorer = IntegrityScorer(params={**load_params("fps_leagues"), "supervised_model": name})
+        model = scorer.supervised
+
+        t0 = time.perf_counter()
+        model.fit(X_train, y_train)
+        train_seconds = time.perf_counter() - t0
+
+        score_seconds = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            model.predict_proba(X_scaled)
+            score_seconds.append(time.perf_counter() - t0)
+
+        proba = model.predict_proba(X_test)[:, 1]
+        rows.append({
+            "model": name,
+            "train_rows": len(X_train),
+            "train_seconds": train_seconds,
+            "score_rows_per_sec": len(X_scaled) / min(score_seconds),
+            "model_size_mb": len(pickle.dumps(model)) / (1024 * 1024),
+            "auc": roc_auc_score(y_test, proba) if y_test.nunique() > 1 else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def run_benchmark(scales=(1,), repeats=3):
+    print("=" * 60)
+    print("FAIR PLAY SHIELD — Benchmark modelo supervisado (RF vs HGB)")
+    print("=" * 60)
+
+    if ensure_store("leagues") is None:
+        print(f"[ERROR] No se encontró: {source_path('leagues')}")
+        return None
+
+    df = load_features("leagues")
+    print(f"\nDatos cargados: {len(df)} partidos")
+
+    results = []
+    for scale in scales:
+        expanded = _expand_history(df, scale)
+        print(f"\n  Escala ×{scale}: {len(expanded)} partidos")
+        bench = benchmark_supervised(expanded, repeats=repeats)
+        bench.insert(0, "scale", scale)
+        results.append(bench)
+
+    results = pd.concat(results, ignore_index=True)
+    print("\n" + results.to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+
+    output_path = PROCESSED_DATA_DIR / "benchmark_supervised.csv"
+    results.to_csv(output_path, index=False)
+    print(f"\n[SAVED] Benchmark guardado en: {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Benchmark RF vs HistGradientBoosting")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4],
+                        help="Factores de réplica del histórico para simular más temporadas (default: 1 4)")
+    parser.add_argument("--repeats", type=int, default=3, help="Repeticiones del scoring (default: 3)")
+    args = parser.parse_args()
+    run_benchmark(scales=args.scales, repeats=args.repeats)
@@ -0,0 +1,248 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import os
+
+BATCH_SIZE = 256
+N_THREADS = os.cpu_count() or 1
+
+
+def _node_depths(children_left, children_right):
+    depths = np.zeros(len(children_left), dtype=np.int32)
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        for child in (children_left[node], children_right[node]):
+            if child != -1:
+                depths[child] = depths[node] + 1
+                stack.append(child)
+    return depths
+
+
+def _average_path_length(n_samples):
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    apl = np.zeros_like(n_samples)
+    apl[n_samples == 2] = 1.0
+    mask = n_samples > 2
+    apl[mask] = 2.0 * (np.log(n_samples[mask] - 1.0) + np.euler_gamma) - 2.0 * (n_samples[mask] - 1.0) / n_samples[mask]
+    return apl
+
+
+def _float32_floor(threshold):
+    # x (float32) <= t (float64)  <=>  x <= mayor float32 que no supera t
+    t32 = threshold.astype(np.float32)
+    over = t32.astype(np.float64) > threshold
+    t32[over] = np.nextafter(t32[over], np.float32(-np.inf))
+    return t32
+
+
+class CompiledForest:
+
+    def __init__(self, kind, feature, threshold, children_left, children_right, value,
+                 roots, max_depth, n_features, offset=0.0, max_samples=0):
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.offset = float(offset)
+        self.max_samples = int(max_samples)
+        # Las hojas apuntan a sí mismas con umbral +inf: el recorrido avanza
+        # max_depth niveles sin ramas ni máscaras
+        self._feature_idx = np.maximum(feature, 0)
+        self._children = np.ascontiguousarray(np.column_stack([children_left, children_right]).ravel())
+
+    @classmethod
+    def from_estimator(cls, model):
+        kind = "iforest" if hasattr(model, "offset_") else "classifier"
+        if kind == "classifier":
+            class_idx = int(np.flatnonzero(model.classes_ == 1)[0])
+            tree_features = [None] * len(model.estimators_)
+        else:
+            tree_features = model.estimators_features_
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for est, est_features in zip(model.estimators_, tree_features):
+            tree = est.tree_
+            left = tree.children_left.astype(np.int32)
+            right = tree.children_right.astype(np.int32)
+            is_leaf = left == -1
+            node_ids = np.arange(tree.node_count, dtype=np.int32) + offset
+
+            feat = tree.feature.astype(np.int32)
+            if est_features is not None:
+                feat = np.where(is_leaf, -1, np.asarray(est_features, dtype=np.int32)[np.maximum(feat, 0)])
+            feat[is_leaf] = -1
+
+            depths = _node_depths(left, right)
+            if kind == "classifier":
+                counts = tree.value[:, 0, :]
+                value = counts[:, class_idx] / np.maximum(counts.sum(axis=1), 1e-12)
+            else:
+                value = depths + _average_path_length(tree.n_node_samples)
+
+            roots.append(offset)
+            features.append(feat)
+            thresholds.append(np.where(is_leaf, np.float32(np.inf), _float32_floor(tree.threshold)))
+            lefts.append(np.where(is_leaf, node_ids, left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, node_ids, right + offset).astype(np.int32))
+            values.append(value.astype(np.float64))
+            max_depth = max(max_depth, int(depths.max()))
+            offset += tree.node_count
+
+        return cls(
+            kind=kind,
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds)),
+            children_left=np.ascontiguousarray(np.concatenate(lefts)),
+            children_right=np.ascontiguousarray(np.concatenate(rights)),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+            offset=getattr(model, "offset_", 0.0),
+            max_samples=getattr(model, "_max_samples", 0),
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.children_left,
+                                      self.children_right, self.value, self.roots))
+
+    def apply(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        x_flat = X.ravel()
+        row_base = (np.arange(len(X), dtype=np.int32) * np.int32(X.shape[1]))[:, None]
+        node = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.max_depth):
+            x = np.take(x_flat, row_base + np.take(self._feature_idx, node))
+            node = np.take(self._children, 2 * node + (x > np.take(self.threshold, node)))
+        return node
+
+    def _map_batches(self, X, fn, out, batch_size=BATCH_SIZE):
+        def _batch(start):
+            out[start:start + batch_size] = fn(X[start:start + batch_size])
+
+        starts = range(0, len(X), batch_size)
+        if N_THREADS > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(max_workers=N_THREADS) as pool:
+                list(pool.map(_batch, starts))
+        else:
+            for start in starts:
+                _batch(start)
+        return out
+
+    def _tree_sum(self, X, batch_size=BATCH_SIZE):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.empty(len(X), dtype=np.float64)
+        return self._map_batches(X, lambda Xb: np.take(self.value, self.apply(Xb)).sum(axis=1), out, batch_size)
+
+    def _path_contributions(self, X):
+        # Saabas: cada split atribuye a su feature el cambio de valor entre nodo padre e hijo
+        n = len(X)
+        x_flat = X.ravel()
+        row_base = (np.arange(n, dtype=np.int32) * np.int32(X.shape[1]))[:, None]
+        contrib_base = (np.arange(n, dtype=np.int64) * self.n_features)[:, None]
+        contrib = np.zeros(n * self.n_features, dtype=np.float64)
+        node = np.repeat(self.roots[None, :], n, axis=0)
+        for _ in range(self.max_depth):
+            feat = np.take(self._feature_idx, node)
+            x = np.take(x_flat, row_base + feat)
+            child = np.take(self._children, 2 * node + (x > np.take(self.threshold, node)))
+            delta = np.take(self.value, child) - np.take(self.value, node)
+            contrib += np.bincount((contrib_base + feat).ravel(), weights=delta.ravel(), minlength=len(contrib))
+            node = child
+        return contrib.reshape(n, self.n_features) / self.n_trees
+
+    def contributions(self, X, batch_size=BATCH_SIZE):
+        # expected_root + contributions.sum(axis=1) == media de value en las hojas
+        # (probabilidad en clasificadores, profundidad esperada en isolation forests)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.empty((len(X), self.n_features), dtype=np.float64)
+        return self._map_batches(X, self._path_contributions, out, batch_size)
+
+    @property
+    def expected_root(self):
+        return float(np.take(self.value, self.roots).mean())
+
+    def _depth_to_score(self, mean_depth):
+        denominator = _average_path_length([self.max_samples])[0]
+        if denominator == 0:
+            return -np.ones_like(np.asarray(mean_depth, dtype=np.float64))
+        return -(2 ** (-np.asarray(mean_depth, dtype=np.float64) / denominator))
+
+    @property
+    def expected_value(self):
+        if self.kind == "classifier":
+            return self.expected_root
+        return float(self._depth_to_score(self.expected_root) - self.offset)
+
+    def predict_proba(self, X, batch_size=BATCH_SIZE):
+        if self.kind != "classifier":
+            raise TypeError("predict_proba is only available for compiled classifiers")
+        p1 = self._tree_sum(X, batch_size) / self.n_trees
+        return np.column_stack([1 - p1, p1])
+
+    def score_samples(self, X, batch_size=BATCH_SIZE):
+        if self.kind != "iforest":
+            raise TypeError("score_samples is only available for compiled isolation forests")
+        return self._depth_to_score(self._tree_sum(X, batch_size) / self.n_trees)
+
+    def decision_function(self, X, batch_size=BATCH_SIZE):
+        return self.score_samples(X, batch_size) - self.offset
+
+    def to_arrays(self, prefix):
+        return {
+            f"{prefix}_feature": self.feature,
+            f"{prefix}_threshold": self.threshold,
+            f"{prefix}_children_left": self.children_left,
+            f"{prefix}_children_right": self.children_right,
+            f"{prefix}_value": self.value,
+            f"{prefix}_roots": self.roots,
+            f"{prefix}_meta": np.array(
+                [self.max_depth, self.n_features, self.offset, self.max_samples], dtype=np.float64
+            ),
+            f"{prefix}_kind": np.array(self.kind),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        max_depth, n_features, offset, max_samples = arrays[f"{prefix}_meta"]
+        return cls(
+            kind=str(arrays[f"{prefix}_kind"]),
+            feature=arrays[f"{prefix}_feature"],
+            threshold=arrays[f"{prefix}_threshold"],
+            children_left=arrays[f"{prefix}_children_left"],
+            children_right=arrays[f"{prefix}_children_right"],
+            value=arrays[f"{prefix}_value"],
+            roots=arrays[f"{prefix}_roots"],
+            max_depth=max_depth,
+            n_features=n_features,
+            offset=offset,
+            max_samples=max_samples,
+        )
+
+
+def export_forests(path, **forests):
+    arrays = {}
+    for name, forest in forests.items():
+        arrays.update(forest.to_arrays(name))
+    np.savez(path, **arrays)
+    return Path(path)
+
+
+def load_forests(path, names=None):
+    with np.load(path) as arrays:
+        if names is None:
+            names = [key[:-len("_kind")] for key in arrays.files if key.endswith("_kind")]
+        return {name: CompiledForest.from_arrays(arrays, name) for name in names}
@@ -0,0 +1,105 @@
+import pandas as pd
+import numpy as np
+
+N_BINS = 20
+PSI_EPS = 1e-4
+# Umbrales habituales de PSI: <0.1 estable, 0.1-0.25 vigilar, >0.25 drift
+PSI_WARN = 0.10
+PSI_ALERT = 0.25
+
+
+def _cuts(values, quantiles, n_bins):
+    values = values[np.isfinite(values)]
+    distinct = np.unique(values)
+    if len(distinct) <= n_bins:
+        # Flags y features discretas: un bin por valor (cortes entre valores consecutivos). Con
+        # cuantiles, un flag raro colapsa en un único corte y 0 y 1 caen en el mismo bin
+        return (distinct[:-1] + distinct[1:]) / 2
+    # Cortes en los cuantiles: cada bin de referencia tiene ~1/n_bins de la masa. El corte justo
+    # por encima del mínimo separa el valor más frecuente en features con muchos ceros
+    cuts = quantiles[~np.isnan(quantiles)]
+    return np.unique(np.append(cuts, np.nextafter(distinct[0], np.inf)))
+
+
+class DriftSketch:
+
+    def __init__(self, feature_cols, cuts, counts=None, missing=None, n=0, minimum=None, maximum=None):
+        self.feature_cols = list(feature_cols)
+        self.cuts = [np.asarray(c, dtype=np.float64) for c in cuts]
+        self.counts = counts if counts is not None else [np.zeros(len(c) + 1, dtype=np.int64) for c in self.cuts]
+        self.missing = missing if missing is not None else np.zeros(len(self.cuts), dtype=np.int64)
+        self.n = int(n)
+        self.minimum = minimum if minimum is not None else np.full(len(self.cuts), np.inf)
+        self.maximum = maximum if maximum is not None else np.full(len(self.cuts), -np.inf)
+
+    @classmethod
+    def from_sample(cls, X, feature_cols, n_bins=N_BINS):
+        X = np.asarray(X, dtype=np.float64)
+        quantiles = np.nanquantile(X, np.linspace(0, 1, n_bins + 1)[1:-1], axis=0)
+        return cls(feature_cols, [_cuts(X[:, j], quantiles[:, j], n_bins) for j in range(X.shape[1])])
+
+    def empty(self):
+        return DriftSketch(self.feature_cols, self.cuts)
+
+    def update(self, X, missing=None):
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return self
+        for j, cuts in enumerate(self.cuts):
+            bins = np.searchsorted(cuts, X[:, j], side="right")
+            self.counts[j] += np.bincount(bins, minlength=len(cuts) + 1)
+        if missing is not None:
+            self.missing += np.asarray(missing, dtype=bool).sum(axis=0)
+        self.minimum = np.fmin(self.minimum, np.nanmin(X, axis=0))
+        self.maximum = np.fmax(self.maximum, np.nanmax(X, axis=0))
+        self.n += len(X)
+        return self
+
+    def merge(self, other):
+        for j in range(len(self.cuts)):
+            self.counts[j] += other.counts[j]
+        self.missing += other.missing
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        self.n += other.n
+        return self
+
+    def compare(self, current):
+        rows = []
+        for j, col in enumerate(self.feature_cols):
+            expected = self.counts[j] / max(self.n, 1)
+            actual = current.counts[j] / max(current.n, 1)
+            e = np.clip(expected, PSI_EPS, None)
+            a = np.clip(actual, PSI_EPS, None)
+            psi = float(np.sum((a - e) * np.log(a / e)))
+            # KS sobre las CDF por bins: cota inferior del estadístico exacto
+            ks = float(np.abs(np.cumsum(expected) - np.cumsum(actual)).max())
+            rows.append({
+                "feature": col,
+                "psi": psi,
+                "ks": ks,
+                "missing_ref_pct": self.missing[j] / max(self.n, 1) * 100,
+                "missing_pct": current.missing[j] / max(current.n, 1) * 100,
+                "min": current.minimum[j],
+                "max": current.maximum[j],
+                "status": "drift" if psi > PSI_ALERT else "warning" if psi > PSI_WARN else "ok",
+            })
+        report = pd.DataFrame(rows)
+        report["n_ref"] = self.n
+        report["n"] = current.n
+        return report.sort_values("psi", ascending=False).reset_index(drop=True)
+
+    def to_dict(self):
+        return {
+            "feature_cols": self.feature_cols,
+            "cuts": self.cuts,
+            "counts": self.counts,
+            "missing": self.missing,
+            "n": self.n,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(**state)
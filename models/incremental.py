@@ -0,0 +1,262 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import argparse
+import math
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from processing.feature_store import ensure_store, load_features, source_path
+from models.integrity_scorer import (
+    IntegrityScorer,
+    MLFLOW_AVAILABLE,
+    MODEL_DIR,
+    setup_mlflow,
+    tracked_run,
+    upsert_scores,
+    print_alert_distribution,
+    print_drift_report,
+    save_drift_report,
+    log_scoring_to_mlflow,
+)
+from models.multi_model import (
+    MODEL_SCORES_DIR,
+    REGISTRY_PATH,
+    load_registry,
+    scores_path,
+    merge_saved,
+    run_models,
+)
+
+
+MIN_NEW_TREES = 10
+HOLDOUT_FRACTION = 0.2
+# Caída máxima de AUC en el holdout que se tolera antes de descartar el candidato
+MAX_AUC_DROP = 0.005
+
+
+def _rescale_tree(tree, feature_map, old_mean, old_scale, new_mean, new_scale):
+    # Reexpresa los umbrales del escalado antiguo en el nuevo: misma partición del espacio original
+    internal = tree.children_left != -1
+    feat = feature_map[tree.feature[internal]]
+    raw = tree.threshold[internal] * old_scale[feat] + old_mean[feat]
+    tree.threshold[internal] = (raw - new_mean[feat]) / new_scale[feat]
+
+
+def refresh_scaler(scorer, X_new):
+    old_mean, old_scale = scorer.scaler.mean_.copy(), scorer.scaler.scale_.copy()
+    scorer.scaler.partial_fit(X_new)
+    new_mean, new_scale = scorer.scaler.mean_, scorer.scaler.scale_
+    all_features = np.arange(len(old_mean))
+
+    for est in scorer.random_forest.estimators_:
+        _rescale_tree(est.tree_, all_features, old_mean, old_scale, new_mean, new_scale)
+    for est, est_features in zip(scorer.isolation_forest.estimators_, scorer.isolation_forest.estimators_features_):
+        _rescale_tree(est.tree_, np.asarray(est_features), old_mean, old_scale, new_mean, new_scale)
+
+    # coef·(x - μ)/σ con los parámetros nuevos da el mismo logit
+    coef = scorer.logistic.coef_[0].copy()
+    scorer.logistic.intercept_ = scorer.logistic.intercept_ + np.sum(coef * (new_mean - old_mean) / old_scale)
+    scorer.logistic.coef_ = (coef * new_scale / old_scale)[None, :]
+    return scorer
+
+
+def _trim_forest(model, budget):
+    n_drop = len(model.estimators_) - budget
+    if n_drop <= 0:
+        return 0
+    for attr in ["estimators_", "estimators_features_", "_seeds",
+                 "_average_path_length_per_tree", "_decision_path_lengths"]:
+        if hasattr(model, attr):
+            setattr(model, attr, list(getattr(model, attr))[n_drop:])
+    model.n_estimators = budget
+    return n_drop
+
+
+def grow_forests(scorer, X_scaled, y, n_seen):
+    params = scorer.params
+    share = len(X_scaled) / max(n_seen, 1)
+    report = {"rf_new_trees": 0, "rf_dropped_trees": 0, "iso_new_trees": 0, "iso_dropped_trees": 0}
+
+    rf = scorer.random_forest
+    if len(np.unique(y)) > 1:
+        n_new = min(max(MIN_NEW_TREES, math.ceil(params["rf_n_estimators"] * share)), params["rf_n_estimators"])
+        rf.set_params(warm_start=True, n_estimators=len(rf.estimators_) + n_new)
+        rf.fit(X_scaled, y)
+        report["rf_new_trees"] = n_new
+        report["rf_dropped_trees"] = _trim_forest(rf, params["rf_tree_budget"])
+
+    iso = scorer.isolation_forest
+    if len(X_scaled) >= iso._max_samples:
+        n_new = min(max(MIN_NEW_TREES, math.ceil(params["iso_n_estimators"] * share)), params["iso_n_estimators"])
+        offset = iso.offset_
+        iso.set_params(warm_start=True, max_samples=iso._max_samples, n_estimators=len(iso.estimators_) + n_new)
+        iso.fit(X_scaled)
+        # El offset depende solo de la contaminación sobre el último fit: se conserva el original
+        iso.offset_ = offset
+        report["iso_new_trees"] = n_new
+        report["iso_dropped_trees"] = _trim_forest(iso, params["iso_tree_budget"])
+
+    if hasattr(scorer.logistic, "partial_fit"):
+        scorer.logistic.partial_fit(X_scaled, y)
+    return report
+
+
+def _holdout_auc(scorer, X, y):
+    from sklearn.metrics import roc_auc_score
+
+    if len(np.unique(y)) < 2:
+        return np.nan
+    integrity_score, _, _, _ = scorer.score_matrix(X)
+    return roc_auc_score(y, integrity_score)
+
+
+def log_incremental_to_mlflow(prefix, report):
+    if not MLFLOW_AVAILABLE:
+        return
+
+    with tracked_run(f"incremental_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}") as run:
+        run.log_param("model_prefix", prefix)
+        run.log_param("since", str(report["since"]))
+        run.log_param("promoted", report["promoted"])
+        for name in ["new_rows", "holdout_rows", "rf_new_trees", "rf_dropped_trees", "iso_new_trees",
+                     "iso_dropped_trees", "rf_trees", "iso_trees"]:
+            run.log_metric(name, report[name])
+        for name in ["holdout_auc_previous", "holdout_auc_candidate"]:
+            if pd.notna(report[name]):
+                run.log_metric(name, report[name])
+        print(f"[MLFLOW] Incremental retrain queued for background upload")
+
+
+def incremental_retrain(prefix="fps_leagues", since=None, max_auc_drop=MAX_AUC_DROP, force=False):
+    print("=" * 60)
+    print("FAIR PLAY SHIELD — Reentrenamiento incremental (warm start)")
+    print("=" * 60)
+
+    mlflow_enabled = setup_mlflow()
+
+    if ensure_store("leagues") is None:
+        print(f"[ERROR] No se encontró: {source_path('leagues')}")
+        return None
+    if not (MODEL_DIR / f"{prefix}_scaler.pkl").exists():
+        print(f"[ERROR] Modelo '{prefix}' no encontrado. Ejecuta train_and_score() primero.")
+        return None
+
+    previous = IntegrityScorer()
+    previous.load(prefix, compiled=True)
+    candidate = IntegrityScorer()
+    candidate.load(prefix)
+    if candidate.supervised_name != "random_forest":
+        print(f"[ERROR] El modo incremental requiere random_forest (bundle: {candidate.supervised_name})")
+        return None
+
+    since = pd.Timestamp(since) if since is not None else candidate.trained_until_
+    if since is None:
+        print("[ERROR] El bundle no registra hasta qué fecha se entrenó. Indica --since.")
+        return None
+
+    # Solo se leen los partidos nuevos: el coste depende del periodo nuevo, no del histórico
+    new_df = load_features("leagues", since=since).sort_values("date")
+    print(f"\nDatos nuevos desde {since.date()}: {len(new_df)} partidos")
+    if len(new_df) < 2:
+        print("  Sin datos nuevos suficientes, se mantiene el modelo actual")
+        return None
+
+    # Holdout temporal: el final del periodo nuevo no se usa para entrenar
+    cut = int(len(new_df) * (1 - HOLDOUT_FRACTION))
+    train_df, holdout_df = new_df.iloc[:cut], new_df.iloc[cut:]
+    stats = candidate.label_stats_
+    if stats is None:
+        # Bundles antiguos sin estadísticas de etiquetado: se calculan una vez sobre el histórico
+        history = load_features("leagues")
+        stats = candidate.label_stats(history[history["date"] <= since])
+        del history
+
+    X_train = candidate.prepare_features(train_df, candidate.feature_cols)
+    y_train = candidate.create_synthetic_labels(train_df, X_train, stats=stats).to_numpy()
+    n_seen = int(candidate.scaler.n_samples_seen_)
+
+    refresh_scaler(candidate, X_train)
+    report = grow_forests(candidate, candidate.scaler.transform(X_train), y_train, n_seen)
+
+    # Rango de calibración del IF: el guardado, ampliado con los partidos nuevos
+    X_new = candidate.prepare_features(new_df, candidate.feature_cols)
+    candidate.calibrate_iso(candidate.scaler.transform(X_new), extend=True)
+    if candidate.drift_reference_ is not None:
+        candidate.drift_reference_.update(X_train, candidate.feature_missing(train_df))
+    candidate.compiled_ = None
+
+    X_holdout = candidate.prepare_features(holdout_df, candidate.feature_cols)
+    y_holdout = candidate.create_synthetic_labels(holdout_df, X_holdout, verbose=False, stats=stats).to_numpy()
+    auc_previous = _holdout_auc(previous, X_holdout, y_holdout)
+    auc_candidate = _holdout_auc(candidate, X_holdout, y_holdout)
+
+    report.update({
+        "since": since,
+        "new_rows": len(train_df),
+        "holdout_rows": len(holdout_df),
+        "rf_trees": len(candidate.random_forest.estimators_),
+        "iso_trees": len(candidate.isolation_forest.estimators_),
+        "holdout_auc_previous": auc_previous,
+        "holdout_auc_candidate": auc_candidate,
+    })
+    print(f"\n  Árboles RF: +{report['rf_new_trees']} / -{report['rf_dropped_trees']} → {report['rf_trees']}")
+    print(f"  Árboles IF: +{report['iso_new_trees']} / -{report['iso_dropped_trees']} → {report['iso_trees']}")
+    print(f"  AUC holdout: anterior {auc_previous:.4f} → candidato {auc_candidate:.4f}")
+
+    if np.isnan(auc_candidate) or np.isnan(auc_previous):
+        promoted = force
+        reason = "holdout sin ambas clases"
+    else:
+        promoted = force or auc_candidate >= auc_previous - max_auc_drop
+        reason = f"caída de AUC > {max_auc_drop}"
+    report["promoted"] = promoted
+
+    if promoted:
+        candidate.trained_until_ = train_df["date"].max()
+        candidate.compile()
+        candidate.save(prefix)
+        print("  [PROMOTED] Modelo incremental promovido")
+    else:
+        print(f"  [REJECTED] Se mantiene el modelo anterior ({reason})")
+
+    if mlflow_enabled:
+        log_incremental_to_mlflow(prefix, report)
+
+    if promoted:
+        rescore_new_rows(candidate, new_df, prefix, mlflow_enabled)
+    return report
+
+
+def rescore_new_rows(scorer, new_df, prefix, mlflow_enabled=False):
+    # Puntúa con el modelo promovido solo los partidos del periodo nuevo en el CSV del propio modelo
+    # (data/processed/scores/) y recompone el combinado y el cubo sin puntuar el resto
+    spec = next((s for s in load_registry() if s["prefix"] == prefix), None)
+    if spec is None:
+        raise ValueError(f"El bundle '{prefix}' no está en el registro de modelos ({REGISTRY_PATH})")
+    output_path = scores_path(spec["model_id"])
+    if not output_path.exists():
+        print(f"  Sin scores previos de '{spec['model_id']}': se puntúa su histórico una vez")
+        return run_models(train=False, model_ids=[spec["model_id"]], score_others=False)
+    summary = upsert_scores(scorer, new_df, output_path)
+    print(f"\nPartidos puntuados de nuevo: {len(new_df)} (total del modelo: {summary['n']})")
+    summary["drift"] = scorer.drift_report()
+    print_alert_distribution(summary)
+    print_drift_report(summary["drift"])
+    drift_path = save_drift_report(summary["drift"], MODEL_SCORES_DIR / f"{spec['model_id']}_drift.csv")
+    merged_path = merge_saved([s["model_id"] for s in load_registry()], {spec["model_id"]: summary["cube"]})
+    print(f"[SAVED] Scores actualizados en: {output_path} (combinados en {merged_path})")
+    if mlflow_enabled:
+        log_scoring_to_mlflow(prefix, summary, output_path=output_path, drift_path=drift_path)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Reentrenamiento incremental")
+    parser.add_argument("--prefix", default="fps_leagues", help="Prefijo del bundle de modelos (default: fps_leagues)")
+    parser.add_argument("--since", default=None, help="Fecha desde la que hay datos nuevos (default: la del bundle)")
+    parser.add_argument("--max-auc-drop", type=float, default=MAX_AUC_DROP,
+                        help=f"Caída de AUC tolerada en el holdout (default: {MAX_AUC_DROP})")
+    parser.add_argument("--force", action="store_true", help="Promover aunque no pase la comprobación del holdout")
+    args = parser.parse_args()
+    incremental_retrain(prefix=args.prefix, since=args.since, max_auc_drop=args.max_auc_drop, force=args.force)
@@ -1,101 +1,174 @@
 import pandas as pd
 import numpy as np
-from scipy import stats
-from sklearn.ensemble import IsolationForest, RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, roc_auc_score, precision_score, recall_score, f1_score
 import joblib
 from pathlib import Path
+import argparse
 import sys
 import os
 import warnings
 warnings.filterwarnings("ignore")
 
-try:
-    import mlflow
-    import mlflow.sklearn
-    MLFLOW_AVAILABLE = True
-except ImportError:
-    MLFLOW_AVAILABLE = False
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from config.settings import PROCESSED_DATA_DIR, MATCH_INTEGRITY_THRESHOLDS
+from config.settings import PROCESSED_DATA_DIR, MATCH_INTEGRITY_THRESHOLDS, FEATURE_COLS_LEAGUES, FEATURE_COLS_EL
+from models.compiled_trees import CompiledForest, export_forests, load_forests
+from models.drift import DriftSketch
+from models.tracking import MLFLOW_AVAILABLE, MLFLOW_TRACKING_URI, tracked_run
+from processing.feature_store import load_features, iter_features, ensure_store, store_path, source_path
+from processing.summary_cube import aggregate, merge_cubes, save_cube
 
 MODEL_DIR = Path(__file__).resolve().parent / "trained"
 MODEL_DIR.mkdir(parents=True, exist_ok=True)
 
-MLFLOW_TRACKING_URI = os.environ.get("MLFLOW_TRACKING_URI", "http://localhost:5001")
-MLFLOW_EXPERIMENT_NAME = "fair_play_shield"
-
-
-FEATURE_COLS_LEAGUES = [
-    "odds_movement_abs_max",
-    "result_surprise",
-    "ht_result_changed",
-    "total_goals",
-    "total_cards",
-    "flag_odds_movement",
-    "flag_result_surprise",
-    "flag_streak_break",
-    "flag_goals_anomaly_home",
-    "flag_goals_anomaly_away",
-    "flag_ht_result_changed",
-    "flag_cards_anomaly",
-]
-
-FEATURE_COLS_EL = [
-    "total_goals",
-    "goal_difference",
-    "ht_result_changed",
-    "total_cards",
-    "total_fouls",
-    "total_corners",
-    "home_possession",
-    "away_possession",
-    "home_shots_on_target",
-    "away_shots_on_target",
-]
+
+DEFAULT_PARAMS = {
+    "iso_contamination": 0.04,
+    "iso_n_estimators": 200,
+    "iso_max_samples": "auto",
+    "rf_n_estimators": 200,
+    "rf_max_depth": 10,
+    "rf_min_samples_leaf": 5,
+    "rf_max_features": "sqrt",
+    "supervised_model": "random_forest",
+    "hgb_max_iter": 200,
+    "hgb_learning_rate": 0.1,
+    "hgb_max_leaf_nodes": 31,
+    "hgb_min_samples_leaf": 20,
+    "hgb_l2_regularization": 0.0,
+    "lr_C": 1.0,
+    "lr_max_iter": 1000,
+    "weight_if": 0.35,
+    "weight_rf": 0.40,
+    "weight_lr": 0.25,
+    "rf_tree_budget": 400,
+    "iso_tree_budget": 400,
+}
+
+
+SUPERVISED_MODELS = ["random_forest", "hist_gradient_boosting"]
+
+# Columnas de aportación por feature al MIS en los resultados del scoring
+CONTRIB_PREFIX = "contrib_"
+# Cortes del MIS en niveles de alerta
+ALERT_BINS = [-1, 30, 60, 80, 101]
+ALERT_LEVELS = ["normal", "monitor", "suspicious", "high_alert"]
+
+
+def load_params(prefix="fps"):
+    params_path = MODEL_DIR / f"{prefix}_params.pkl"
+    if not params_path.exists():
+        return dict(DEFAULT_PARAMS)
+    return {**DEFAULT_PARAMS, **joblib.load(params_path)}
+
+
+def save_params(params, prefix="fps"):
+    joblib.dump(dict(params), MODEL_DIR / f"{prefix}_params.pkl")
+
+
+def candidate_params_path(prefix="fps"):
+    # Configuración propuesta por el tuning: no toca el bundle hasta que un reentrenamiento la promueve
+    return MODEL_DIR / f"{prefix}_params_candidate.pkl"
+
+
+def load_candidate_params(prefix="fps"):
+    path = candidate_params_path(prefix)
+    if not path.exists():
+        return None
+    return {**DEFAULT_PARAMS, **joblib.load(path)}
 
 
 class IntegrityScorer:
 
-    def __init__(self):
+    def __init__(self, params=None):
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        # sklearn se importa al construir el modelo: importar el módulo (CLI, DAGs) no lo carga
+        from sklearn.ensemble import IsolationForest, RandomForestClassifier, HistGradientBoostingClassifier
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+
         self.scaler = StandardScaler()
         self.isolation_forest = IsolationForest(
-            contamination=0.04,
-            n_estimators=200,
-            max_samples="auto",
+            contamination=self.params["iso_contamination"],
+            n_estimators=self.params["iso_n_estimators"],
+            max_samples=self.params["iso_max_samples"],
             random_state=42,
         )
-        self.random_forest = RandomForestClassifier(
-            n_estimators=200,
-            max_depth=10,
-            min_samples_leaf=5,
-            random_state=42,
-            class_weight="balanced",
-        )
+        if self.params["supervised_model"] not in SUPERVISED_MODELS:
+            raise ValueError(f"Unknown supervised_model: {self.params['supervised_model']}. Options: {SUPERVISED_MODELS}")
+        self.random_forest = None
+        self.gradient_boosting = None
+        if self.params["supervised_model"] == "random_forest":
+            self.random_forest = RandomForestClassifier(
+                n_estimators=self.params["rf_n_estimators"],
+                max_depth=self.params["rf_max_depth"],
+                min_samples_leaf=self.params["rf_min_samples_leaf"],
+                max_features=self.params["rf_max_features"],
+                random_state=42,
+                class_weight="balanced",
+            )
+        else:
+            self.gradient_boosting = HistGradientBoostingClassifier(
+                max_iter=self.params["hgb_max_iter"],
+                learning_rate=self.params["hgb_learning_rate"],
+                max_leaf_nodes=self.params["hgb_max_leaf_nodes"],
+                min_samples_leaf=self.params["hgb_min_samples_leaf"],
+                l2_regularization=self.params["hgb_l2_regularization"],
+                early_stopping=False,
+                random_state=42,
+                class_weight="balanced",
+            )
         self.logistic = LogisticRegression(
-            max_iter=1000,
+            C=self.params["lr_C"],
+            max_iter=self.params["lr_max_iter"],
             class_weight="balanced",
             random_state=42,
         )
+        self.compiled_ = None
+        self.iso_range_ = None
+        self.drift_reference_ = None
+        self.drift_ = None
+        self.label_stats_ = None
+        self.trained_until_ = None
         self.feature_cols = []
         self.is_fitted = False
 
+    @property
+    def supervised_name(self):
+        return self.params["supervised_model"]
+
+    @property
+    def supervised(self):
+        if self.supervised_name == "random_forest":
+            return self.random_forest
+        return self.gradient_boosting
+
     def prepare_features(self, df, feature_cols):
         available = [c for c in feature_cols if c in df.columns]
         if not available:
             raise ValueError(f"No feature columns available. Tried: {feature_cols}")
         self.feature_cols = available
         X = df[available].copy()
-        X = X.fillna(0)
         for col in X.columns:
-            X[col] = pd.to_numeric(X[col], errors="coerce").fillna(0)
-        return X
+            # Las columnas del feature store ya vienen tipadas: solo se convierten las de CSV
+            if not pd.api.types.is_numeric_dtype(X[col]):
+                X[col] = pd.to_numeric(X[col], errors="coerce")
+        return X.fillna(0).astype(np.float64)
+
+    def feature_missing(self, df):
+        return df[self.feature_cols].isna().to_numpy()
 
-    def create_synthetic_labels(self, df, X):
+    @staticmethod
+    def label_stats(df):
+        stats = {}
+        if "odds_movement_abs_max" in df.columns:
+            stats["odds_q95"] = df["odds_movement_abs_max"].quantile(0.95)
+        if "total_goals" in df.columns:
+            stats["goals_mean"] = df["total_goals"].mean()
+            stats["goals_std"] = df["total_goals"].std()
+        return stats
+
+    def create_synthetic_labels(self, df, X, verbose=True, stats=None):
+        if stats is None:
+            stats = self.label_stats(df)
         labels = pd.Series(0, index=df.index)
 
         if "total_flags" in df.columns:
@@ -107,52 +180,72 @@ class IntegrityScorer:
                 labels[flag_sum >= 3] = 1
 
         if "odds_movement_abs_max" in df.columns:
-            threshold = df["odds_movement_abs_max"].quantile(0.95)
+            threshold = stats["odds_q95"]
             labels[df["odds_movement_abs_max"] > threshold] = 1
 
         if "total_goals" in df.columns:
-            goals_mean = df["total_goals"].mean()
-            goals_std = df["total_goals"].std()
+            goals_mean = stats["goals_mean"]
+            goals_std = stats["goals_std"]
             if goals_std > 0:
                 z_goals = (df["total_goals"] - goals_mean) / goals_std
                 labels[z_goals.abs() > 2.5] = 1
 
-        print(f"  Labels: {(labels == 0).sum()} normal, {(labels == 1).sum()} sospechoso ({labels.mean()*100:.1f}%)")
+        if verbose:
+            print(f"  Labels: {(labels == 0).sum()} normal, {(labels == 1).sum()} sospechoso ({labels.mean()*100:.1f}%)")
         return labels
 
-    def fit(self, df, feature_cols=None, log_to_mlflow=True):
+    def fit(self, df, feature_cols=None, log_to_mlflow=True, verbose=True):
         if feature_cols is None:
             feature_cols = FEATURE_COLS_LEAGUES
         X = self.prepare_features(df, feature_cols)
-        y = self.create_synthetic_labels(df, X)
+        self.label_stats_ = self.label_stats(df)
+        y = self.create_synthetic_labels(df, X, verbose=verbose, stats=self.label_stats_)
+        if "date" in df.columns:
+            self.trained_until_ = pd.to_datetime(df["date"]).max()
+        return self.fit_matrix(X, y, verbose=verbose, missing=self.feature_missing(df))
 
-        print(f"\n  Entrenando con {len(X)} partidos, {len(self.feature_cols)} features...")
+    def fit_matrix(self, X, y, feature_cols=None, verbose=True, missing=None):
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import classification_report, roc_auc_score, precision_score, recall_score, f1_score
+
+        if feature_cols is not None:
+            self.feature_cols = list(feature_cols)
+        y = pd.Series(np.asarray(y))
+
+        if verbose:
+            print(f"\n  Entrenando con {len(X)} partidos, {len(self.feature_cols)} features...")
 
         X_scaled = self.scaler.fit_transform(X)
 
-        print("  [1/3] Isolation Forest...")
+        if verbose:
+            print("  [1/3] Isolation Forest...")
         self.isolation_forest.fit(X_scaled)
-        iso_scores = self.isolation_forest.decision_function(X_scaled)
+        self.calibrate_iso(X_scaled)
         iso_labels = self.isolation_forest.predict(X_scaled)
         iso_anomalies = (iso_labels == -1).sum()
-        print(f"        Anomalías detectadas: {iso_anomalies} ({iso_anomalies/len(X)*100:.1f}%)")
+        if verbose:
+            print(f"        Anomalías detectadas: {iso_anomalies} ({iso_anomalies/len(X)*100:.1f}%)")
 
         X_train, X_test, y_train, y_test = train_test_split(
             X_scaled, y, test_size=0.2, random_state=42, stratify=y
         )
 
-        print("  [2/3] Random Forest...")
-        self.random_forest.fit(X_train, y_train)
-        rf_pred = self.random_forest.predict(X_test)
-        rf_proba = self.random_forest.predict_proba(X_test)[:, 1]
+        if verbose:
+            label = "Random Forest" if self.supervised_name == "random_forest" else "Hist Gradient Boosting"
+            print(f"  [2/3] {label}...")
+        self.supervised.fit(X_train, y_train)
+        rf_pred = self.supervised.predict(X_test)
+        rf_proba = self.supervised.predict_proba(X_test)[:, 1]
         rf_auc = roc_auc_score(y_test, rf_proba) if y_test.nunique() > 1 else 0
         rf_precision = precision_score(y_test, rf_pred, zero_division=0)
         rf_recall = recall_score(y_test, rf_pred, zero_division=0)
         rf_f1 = f1_score(y_test, rf_pred, zero_division=0)
-        print(f"        AUC-ROC: {rf_auc:.4f}")
-        print(classification_report(y_test, rf_pred, target_names=["Normal", "Sospechoso"], zero_division=0))
+        if verbose:
+            print(f"        AUC-ROC: {rf_auc:.4f}")
+            print(classification_report(y_test, rf_pred, target_names=["Normal", "Sospechoso"], zero_division=0))
 
-        print("  [3/3] Logistic Regression...")
+        if verbose:
+            print("  [3/3] Logistic Regression...")
         self.logistic.fit(X_train, y_train)
         lr_pred = self.logistic.predict(X_test)
         lr_proba = self.logistic.predict_proba(X_test)[:, 1]
@@ -160,15 +253,17 @@ class IntegrityScorer:
         lr_precision = precision_score(y_test, lr_pred, zero_division=0)
         lr_recall = recall_score(y_test, lr_pred, zero_division=0)
         lr_f1 = f1_score(y_test, lr_pred, zero_division=0)
-        print(f"        AUC-ROC: {lr_auc:.4f}")
+        if verbose:
+            print(f"        AUC-ROC: {lr_auc:.4f}")
 
-        print("\n  Feature Importance (Random Forest):")
         importances = pd.Series(
-            self.random_forest.feature_importances_, index=self.feature_cols
+            self.supervised_importances(X_test, y_test), index=self.feature_cols
         ).sort_values(ascending=False)
-        for feat, imp in importances.items():
-            bar = "█" * int(imp * 50)
-            print(f"    {feat:35s} {imp:.4f} {bar}")
+        if verbose:
+            print(f"\n  Feature Importance ({self.supervised_name}):")
+            for feat, imp in importances.items():
+                bar = "█" * int(imp * 50)
+                print(f"    {feat:35s} {imp:.4f} {bar}")
 
         self.metrics_ = {
             "iso_anomalies_pct": iso_anomalies / len(X) * 100,
@@ -185,35 +280,105 @@ class IntegrityScorer:
             "suspicious_pct": y.mean() * 100,
         }
         self.feature_importances_ = importances.to_dict()
+        self.drift_reference_ = DriftSketch.from_sample(X, self.feature_cols).update(X, missing)
+        self.drift_ = None
 
+        self.compiled_ = None
         self.is_fitted = True
         return self
 
-    def score(self, df):
-        if not self.is_fitted:
-            raise RuntimeError("Model not fitted. Call fit() first.")
-
-        X = self.prepare_features(df, self.feature_cols)
-        X_scaled = self.scaler.transform(X)
-
+    def calibrate_iso(self, X_scaled, extend=False):
+        # extend: amplía el rango guardado con los datos nuevos en lugar de recalcularlo sobre todo el histórico
         iso_scores_raw = self.isolation_forest.decision_function(X_scaled)
-        iso_norm = 1 - (iso_scores_raw - iso_scores_raw.min()) / (iso_scores_raw.max() - iso_scores_raw.min() + 1e-8)
-
-        rf_proba = self.random_forest.predict_proba(X_scaled)[:, 1]
+        low, high = float(iso_scores_raw.min()), float(iso_scores_raw.max())
+        if extend and self.iso_range_ is not None:
+            low, high = min(low, self.iso_range_[0]), max(high, self.iso_range_[1])
+        self.iso_range_ = (low, high)
+        return self
 
-        lr_proba = self.logistic.predict_proba(X_scaled)[:, 1]
+    def supervised_importances(self, X_test, y_test):
+        if hasattr(self.supervised, "feature_importances_"):
+            return self.supervised.feature_importances_
+        if len(np.unique(y_test)) < 2:
+            return np.full(len(self.feature_cols), 1 / len(self.feature_cols))
+        from sklearn.inspection import permutation_importance
+        result = permutation_importance(
+            self.supervised, X_test, y_test, scoring="roc_auc", n_repeats=5, random_state=42,
+        )
+        importances = np.clip(result.importances_mean, 0, None)
+        total = importances.sum()
+        return importances / total if total > 0 else importances
+
+    def compile(self):
+        self.compiled_ = {"isolation_forest": CompiledForest.from_estimator(self.isolation_forest)}
+        if self.random_forest is not None:
+            self.compiled_["random_forest"] = CompiledForest.from_estimator(self.random_forest)
+        return self
 
-        combined = (0.35 * iso_norm + 0.40 * rf_proba + 0.25 * lr_proba)
+    def score(self, df, explain=True, buffer=None):
+        if not self.is_fitted:
+            raise RuntimeError("Model not fitted. Call fit() first.")
 
-        integrity_score = (combined * 100).clip(0, 100)
+        X_scaled = self.transform_block(df, buffer)
+        integrity_score, iso_norm, rf_proba, lr_proba = self.score_scaled(X_scaled)
+        results = self.build_results(df, integrity_score, iso_norm, rf_proba, lr_proba)
+        if explain:
+            contributions = self.explain_scaled(X_scaled, iso_norm, lr_proba)
+            for j, col in enumerate(self.feature_cols):
+                results[f"{CONTRIB_PREFIX}{col}"] = contributions[:, j].round(2)
+        return results
 
-        alert_levels = pd.cut(
-            integrity_score,
-            bins=[-1, 30, 60, 80, 101],
-            labels=["normal", "monitor", "suspicious", "high_alert"],
-        )
+    def transform_block(self, df, buffer=None):
+        # Features escaladas en float32, escritas en buffer (preasignado y reutilizable entre bloques)
+        n = len(df)
+        if buffer is None:
+            buffer = np.empty((n, len(self.feature_cols)), dtype=np.float32)
+        X = buffer[:n]
+        for j, col in enumerate(self.feature_cols):
+            if col not in df.columns:
+                X[:, j] = np.nan
+                continue
+            values = df[col]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values, errors="coerce")
+            X[:, j] = values.to_numpy(dtype=np.float32, na_value=np.nan)
+        missing = np.isnan(X)
+        X[missing] = 0
+        new = self.unseen_rows(df)
+        self.track_drift(X[new], missing[new])
+        # El escalado se calcula en float64 y se redondea una vez: mismos valores que scaler.transform
+        np.divide(X - self.scaler.mean_, self.scaler.scale_, out=X, casting="same_kind")
+        return X
 
-        results = df[["date", "home_team", "away_team"]].copy() if all(c in df.columns for c in ["date", "home_team", "away_team"]) else df.iloc[:, :3].copy()
+    def unseen_rows(self, df):
+        # Partidos posteriores al entrenamiento: el drift se mide solo sobre ellos. Si se mezclara
+        # el histórico reescoreado, unos pocos partidos nuevos quedarían diluidos
+        if self.trained_until_ is None or "date" not in df.columns:
+            return np.ones(len(df), dtype=bool)
+        return (pd.to_datetime(df["date"], errors="coerce") > pd.Timestamp(self.trained_until_)).to_numpy()
+
+    def track_drift(self, X, missing=None):
+        # Acumula los datos puntuados desde el último reset_drift(), en memoria constante
+        if self.drift_reference_ is None or len(X) == 0:
+            return
+        if self.drift_ is None:
+            self.drift_ = self.drift_reference_.empty()
+        self.drift_.update(X, missing)
+
+    def reset_drift(self):
+        self.drift_ = None
+
+    def drift_report(self):
+        # None si no se ha puntuado ningún partido posterior al entrenamiento
+        if self.drift_reference_ is None or self.drift_ is None or self.drift_.n == 0:
+            return None
+        return self.drift_reference_.compare(self.drift_)
+
+    def build_results(self, df, integrity_score, iso_norm, rf_proba, lr_proba):
+        alert_levels = pd.cut(integrity_score, bins=ALERT_BINS, labels=ALERT_LEVELS)
+
+        id_cols = ["match_id", "date", "home_team", "away_team"] if "match_id" in df.columns else ["date", "home_team", "away_team"]
+        results = df[id_cols].copy() if all(c in df.columns for c in ["date", "home_team", "away_team"]) else df.iloc[:, :3].copy()
         results["integrity_score"] = integrity_score.round(2)
         results["alert_level"] = alert_levels
         results["iso_score"] = (iso_norm * 100).round(2)
@@ -232,114 +397,342 @@ class IntegrityScorer:
 
         return results
 
+    def score_matrix(self, X):
+        if not self.is_fitted:
+            raise RuntimeError("Model not fitted. Call fit() first.")
+
+        return self.score_scaled(self.scaler.transform(X))
+
+    def score_scaled(self, X_scaled):
+        iso_model = self.compiled_["isolation_forest"] if self.compiled_ else self.isolation_forest
+        rf_model = (self.compiled_ or {}).get("random_forest", self.supervised)
+
+        iso_scores_raw = iso_model.decision_function(X_scaled)
+        iso_norm = self.normalize_iso(iso_scores_raw, self.iso_range_ or (iso_scores_raw.min(), iso_scores_raw.max()))
+
+        rf_proba = rf_model.predict_proba(X_scaled)[:, 1]
+
+        lr_proba = self.logistic.predict_proba(X_scaled)[:, 1]
+
+        integrity_score = self.combine(iso_norm, rf_proba, lr_proba)
+        return integrity_score, iso_norm, rf_proba, lr_proba
+
+    @staticmethod
+    def normalize_iso(iso_scores_raw, iso_range):
+        iso_min, iso_max = iso_range
+        return np.clip(1 - (iso_scores_raw - iso_min) / (iso_max - iso_min + 1e-8), 0, 1)
+
+    def explain_scaled(self, X_scaled, iso_norm, lr_proba):
+        # Aportación de cada feature al MIS, en puntos. RF: contribuciones por camino
+        # (Saabas), exactas. LR: términos lineales coef·x. IF: acortamiento del camino
+        # esperado en cada split. LR e IF se reparten en proporción sobre la desviación
+        # de cada modelo respecto a su valor de referencia. Con HGB el término
+        # supervisado no se descompone.
+        if self.compiled_ is None:
+            self.compile()
+        X_scaled = np.asarray(X_scaled, dtype=np.float64)
+
+        iso = self.compiled_["isolation_forest"]
+        iso_paths = -iso.contributions(X_scaled)
+        iso_range = self.iso_range_
+        if iso_range is None:
+            iso_scores_raw = iso.decision_function(X_scaled)
+            iso_range = (iso_scores_raw.min(), iso_scores_raw.max())
+        iso_ref = self.normalize_iso(iso.expected_value, iso_range)
+        iso_contrib = _distribute(iso_paths, iso_norm - iso_ref)
+
+        linear_terms = X_scaled * self.logistic.coef_[0]
+        lr_ref = 1 / (1 + np.exp(-self.logistic.intercept_[0]))
+        lr_contrib = _distribute(linear_terms, lr_proba - lr_ref)
+
+        contrib = self.params["weight_if"] * iso_contrib + self.params["weight_lr"] * lr_contrib
+        if "random_forest" in self.compiled_:
+            contrib += self.params["weight_rf"] * self.compiled_["random_forest"].contributions(X_scaled)
+        return contrib * 100
+
+    def combine(self, iso_norm, rf_proba, lr_proba):
+        combined = (
+            self.params["weight_if"] * iso_norm
+            + self.params["weight_rf"] * rf_proba
+            + self.params["weight_lr"] * lr_proba
+        )
+        return (combined * 100).clip(0, 100)
+
     def save(self, prefix="fps"):
         joblib.dump(self.scaler, MODEL_DIR / f"{prefix}_scaler.pkl")
         joblib.dump(self.isolation_forest, MODEL_DIR / f"{prefix}_isolation_forest.pkl")
-        joblib.dump(self.random_forest, MODEL_DIR / f"{prefix}_random_forest.pkl")
+        joblib.dump(self.supervised, MODEL_DIR / f"{prefix}_{self.supervised_name}.pkl")
         joblib.dump(self.logistic, MODEL_DIR / f"{prefix}_logistic.pkl")
         joblib.dump(self.feature_cols, MODEL_DIR / f"{prefix}_feature_cols.pkl")
+        save_params(self.params, prefix)
+        joblib.dump({
+            "iso_range": self.iso_range_,
+            "drift_reference": self.drift_reference_.to_dict() if self.drift_reference_ is not None else None,
+            "label_stats": self.label_stats_,
+            "trained_until": self.trained_until_,
+        }, MODEL_DIR / f"{prefix}_meta.pkl")
+        if self.compiled_ is None:
+            self.compile()
+        export_forests(MODEL_DIR / f"{prefix}_compiled_trees.npz", **self.compiled_)
         print(f"  [SAVED] Modelos guardados en {MODEL_DIR}/")
 
-    def load(self, prefix="fps"):
+    def load(self, prefix="fps", compiled=False):
+        compiled_path = MODEL_DIR / f"{prefix}_compiled_trees.npz"
+        self.params = load_params(prefix)
+        self.random_forest = None
+        self.gradient_boosting = None
         self.scaler = joblib.load(MODEL_DIR / f"{prefix}_scaler.pkl")
-        self.isolation_forest = joblib.load(MODEL_DIR / f"{prefix}_isolation_forest.pkl")
-        self.random_forest = joblib.load(MODEL_DIR / f"{prefix}_random_forest.pkl")
+        if compiled and compiled_path.exists():
+            self.compiled_ = load_forests(compiled_path)
+            self.isolation_forest = None
+        else:
+            self.compiled_ = None
+            self.isolation_forest = joblib.load(MODEL_DIR / f"{prefix}_isolation_forest.pkl")
+        if "random_forest" not in (self.compiled_ or {}):
+            supervised = joblib.load(MODEL_DIR / f"{prefix}_{self.supervised_name}.pkl")
+            if self.supervised_name == "random_forest":
+                self.random_forest = supervised
+            else:
+                self.gradient_boosting = supervised
         self.logistic = joblib.load(MODEL_DIR / f"{prefix}_logistic.pkl")
         self.feature_cols = joblib.load(MODEL_DIR / f"{prefix}_feature_cols.pkl")
+        meta_path = MODEL_DIR / f"{prefix}_meta.pkl"
+        meta = joblib.load(meta_path) if meta_path.exists() else {}
+        self.iso_range_ = meta.get("iso_range")
+        drift_state = meta.get("drift_reference")
+        self.drift_reference_ = DriftSketch.from_dict(drift_state) if drift_state else None
+        self.drift_ = None
+        self.label_stats_ = meta.get("label_stats")
+        self.trained_until_ = meta.get("trained_until")
         self.is_fitted = True
         print(f"  [LOADED] Modelos cargados ({len(self.feature_cols)} features)")
 
 
+def _distribute(parts, total):
+    # Reparte total entre las columnas de parts en proporción a su aportación
+    parts_sum = parts.sum(axis=1, keepdims=True)
+    nonzero = np.abs(parts_sum) > 1e-12
+    scale = np.divide(total[:, None], parts_sum, out=np.zeros_like(parts_sum), where=nonzero)
+    return parts * scale
+
+
 def setup_mlflow():
     if not MLFLOW_AVAILABLE:
         print("[MLFLOW] MLflow no disponible, continuando sin tracking")
         return False
-    try:
-        mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
-        mlflow.set_experiment(MLFLOW_EXPERIMENT_NAME)
-        print(f"[MLFLOW] Conectado a {MLFLOW_TRACKING_URI}")
-        return True
-    except Exception as e:
-        print(f"[MLFLOW] Error conectando: {e}")
-        return False
+    # No se contacta al servidor aquí: los runs se envían en segundo plano (models/tracking.py)
+    print(f"[MLFLOW] Tracking en {MLFLOW_TRACKING_URI} (envío asíncrono)")
+    return True
+
+
+SCORE_CHUNK_SIZE = 20_000
+ALERT_EMOJIS = {"normal": "🟢", "monitor": "🟡", "suspicious": "🟠", "high_alert": "🔴"}
+
+
+def summarize_results(results, summary=None, top_n=20):
+    if summary is None:
+        summary = {
+            "n": 0,
+            "alerts": dict.fromkeys(ALERT_LEVELS, 0),
+            "score_sum": 0.0,
+            "score_max": 0.0,
+            "top": None,
+            "leagues": None,
+            "cube": None,
+        }
+    if results.empty:
+        return summary
+
+    alert_dist = results["alert_level"].value_counts()
+    for level in ALERT_LEVELS:
+        summary["alerts"][level] += int(alert_dist.get(level, 0))
+    summary["n"] += len(results)
+    summary["score_sum"] += float(results["integrity_score"].sum())
+    summary["score_max"] = max(summary["score_max"], float(results["integrity_score"].max()))
+
+    top = results.nlargest(top_n, "integrity_score")
+    if summary["top"] is not None:
+        top = pd.concat([summary["top"], top]).nlargest(top_n, "integrity_score")
+    summary["top"] = top
+
+    if "league_name" in results.columns:
+        leagues = results.groupby("league_name")["integrity_score"].agg(["sum", "max", "count"])
+        if summary["leagues"] is not None:
+            leagues = pd.concat([summary["leagues"], leagues]).groupby(level=0).agg(
+                {"sum": "sum", "max": "max", "count": "sum"}
+            )
+        summary["leagues"] = leagues
+    summary["cube"] = merge_cubes([summary["cube"], aggregate(results)])
+    return summary
+
+
+def score_to_csv(scorer, chunks, output_path, chunksize=SCORE_CHUNK_SIZE, explain=True, model_id=None):
+    # Puntúa bloque a bloque con un único buffer float32 y escribe cada bloque al CSV:
+    # la memoria pico depende de chunksize, no del histórico. model_id: columna final, como en merge_scores
+    buffer = np.empty((chunksize, len(scorer.feature_cols)), dtype=np.float32)
+    summary = summarize_results(pd.DataFrame())
+    tmp_path = Path(output_path).with_suffix(".tmp")
+    first = True
+    scorer.reset_drift()
+    for chunk in chunks:
+        for start in range(0, len(chunk), chunksize):
+            results = scorer.score(chunk.iloc[start:start + chunksize], explain=explain, buffer=buffer)
+            if model_id is not None:
+                results["model_id"] = model_id
+            results.to_csv(tmp_path, mode="w" if first else "a", header=first, index=False)
+            summary = summarize_results(results, summary)
+            first = False
+    if not first:
+        os.replace(tmp_path, output_path)
+    return summary
+
+
+def upsert_scores(scorer, df, output_path, chunksize=SCORE_CHUNK_SIZE, explain=True):
+    # Puntúa solo df y lo sustituye (por match_id) o añade en el CSV existente. El resto de filas
+    # se copian por bloques sin volver a puntuar; el resumen (y el cubo) cubre el fichero completo
+    output_path = Path(output_path)
+    scorer.reset_drift()
+    results = pd.concat(
+        [scorer.score(df.iloc[start:start + chunksize], explain=explain) for start in range(0, len(df), chunksize)],
+        ignore_index=True,
+    )
+    summary = summarize_results(pd.DataFrame())
+    tmp_path = output_path.with_suffix(".tmp")
+    first = True
+    chunks = []
+    if output_path.exists():
+        header = pd.read_csv(output_path, nrows=0).columns.tolist()
+        if sorted(header) != sorted(results.columns):
+            missing = sorted(set(results.columns) - set(header))
+            extra = sorted(set(header) - set(results.columns))
+            raise ValueError(f"{output_path.name} no tiene las columnas del modelo "
+                             f"(faltan: {missing}, sobran: {extra}); puntúa el modelo completo")
+        results = results[header]
+        chunks = pd.read_csv(output_path, chunksize=chunksize, low_memory=False)
+    new_ids = results["match_id"].to_numpy()
+    for chunk in chunks:
+        kept = chunk[~chunk["match_id"].isin(new_ids)]
+        kept.to_csv(tmp_path, mode="w" if first else "a", header=first, index=False)
+        summary = summarize_results(kept, summary)
+        first = False
+    results.to_csv(tmp_path, mode="w" if first else "a", header=first, index=False)
+    os.replace(tmp_path, output_path)
+    return summarize_results(results, summary)
+
+
+def print_alert_distribution(summary):
+    print("\n--- Distribución de alertas ---")
+    for level in ALERT_LEVELS:
+        count = summary["alerts"][level]
+        pct = count / max(summary["n"], 1) * 100
+        print(f"  {ALERT_EMOJIS[level]} {level:15s}: {count:5d} ({pct:.1f}%)")
 
 
-def log_to_mlflow(scorer, results, df):
+def print_drift_report(report, top_n=5):
+    if report is None:
+        return
+    print(f"\n--- Drift de features (PSI / KS vs entrenamiento, {int(report['n'].iloc[0])} partidos nuevos) ---")
+    shown = report.head(top_n)
+    print(shown[["feature", "psi", "ks", "missing_ref_pct", "missing_pct", "status"]].to_string(
+        index=False, float_format=lambda v: f"{v:.3f}"))
+    drifted = report[report["status"] == "drift"]["feature"].tolist()
+    if drifted:
+        print(f"  [DRIFT] {len(drifted)} features con PSI > 0.25: {', '.join(drifted)}")
+
+
+def save_drift_report(report, output_path=None):
+    if report is None:
+        return None
+    output_path = output_path or PROCESSED_DATA_DIR / "drift_report.csv"
+    report.assign(scored_at=pd.Timestamp.now()).to_csv(output_path, index=False)
+    return output_path
+
+
+def log_drift_metrics(run, report):
+    if report is None:
+        return
+    for _, row in report.iterrows():
+        run.log_metric(f"psi_{row['feature']}", float(row["psi"]))
+        run.log_metric(f"ks_{row['feature']}", float(row["ks"]))
+        run.log_metric(f"missing_pct_{row['feature']}", float(row["missing_pct"]))
+    run.log_metric("drift_max_psi", float(report["psi"].max()))
+    run.log_metric("drift_features_count", int((report["status"] == "drift").sum()))
+
+
+def log_to_mlflow(scorer, summary, model_id=None):
     if not MLFLOW_AVAILABLE:
         return
 
-    with mlflow.start_run(run_name=f"training_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}"):
-        mlflow.log_param("isolation_forest_contamination", float(getattr(scorer.isolation_forest, "contamination", 0)))
-        mlflow.log_param("isolation_forest_n_estimators", 200)
-        mlflow.log_param("random_forest_n_estimators", 200)
-        mlflow.log_param("random_forest_max_depth", 10)
-        mlflow.log_param("random_forest_min_samples_leaf", 5)
-        mlflow.log_param("logistic_max_iter", 1000)
-        mlflow.log_param("ensemble_weight_if", 0.35)
-        mlflow.log_param("ensemble_weight_rf", 0.40)
-        mlflow.log_param("ensemble_weight_lr", 0.25)
-        mlflow.log_param("n_features", len(scorer.feature_cols))
-        mlflow.log_param("features", ",".join(scorer.feature_cols))
-        mlflow.log_param("total_matches", len(df))
+    with tracked_run(f"training_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}") as run:
+        if model_id is not None:
+            run.log_param("model_id", model_id)
+        for param_name, param_value in scorer.params.items():
+            run.log_param(param_name, param_value)
+        run.log_param("n_features", len(scorer.feature_cols))
+        run.log_param("features", ",".join(scorer.feature_cols))
+        run.log_param("total_matches", summary["n"])
 
         for metric_name, metric_value in scorer.metrics_.items():
-            mlflow.log_metric(metric_name, metric_value)
+            run.log_metric(metric_name, metric_value)
 
-        alert_dist = results["alert_level"].value_counts()
-        for level in ["normal", "monitor", "suspicious", "high_alert"]:
-            count = alert_dist.get(level, 0)
-            mlflow.log_metric(f"alert_{level}_count", count)
-            mlflow.log_metric(f"alert_{level}_pct", count / len(results) * 100)
+        for level in ALERT_LEVELS:
+            count = summary["alerts"][level]
+            run.log_metric(f"alert_{level}_count", count)
+            run.log_metric(f"alert_{level}_pct", count / max(summary["n"], 1) * 100)
 
-        mlflow.log_metric("avg_integrity_score", results["integrity_score"].mean())
-        mlflow.log_metric("max_integrity_score", results["integrity_score"].max())
+        run.log_metric("avg_integrity_score", summary["score_sum"] / max(summary["n"], 1))
+        run.log_metric("max_integrity_score", summary["score_max"])
+        log_drift_metrics(run, summary.get("drift"))
 
-        mlflow.sklearn.log_model(scorer.isolation_forest, "isolation_forest")
-        mlflow.sklearn.log_model(scorer.random_forest, "random_forest")
-        mlflow.sklearn.log_model(scorer.logistic, "logistic_regression")
+        run.log_model(scorer.isolation_forest, "isolation_forest")
+        run.log_model(scorer.supervised, scorer.supervised_name)
+        run.log_model(scorer.logistic, "logistic_regression")
 
         importance_df = pd.DataFrame([scorer.feature_importances_]).T
         importance_df.columns = ["importance"]
         importance_df = importance_df.sort_values("importance", ascending=False)
         importance_path = MODEL_DIR / "feature_importance.csv"
         importance_df.to_csv(importance_path)
-        mlflow.log_artifact(str(importance_path))
+        run.log_artifact(str(importance_path))
 
-        print(f"[MLFLOW] Run logged successfully")
+        print(f"[MLFLOW] Run queued for background upload")
 
 
-def log_scoring_to_mlflow(prefix, results, df):
+def log_scoring_to_mlflow(prefix, summary, output_path=None, drift_path=None):
     if not MLFLOW_AVAILABLE:
         return
 
-    with mlflow.start_run(run_name=f"scoring_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}"):
-        mlflow.log_param("model_prefix", prefix)
-        mlflow.log_param("total_matches", len(df))
+    with tracked_run(f"scoring_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}") as run:
+        run.log_param("model_prefix", prefix)
+        run.log_param("total_matches", summary["n"])
 
-        alert_dist = results["alert_level"].value_counts()
-        for level in ["normal", "monitor", "suspicious", "high_alert"]:
-            count = int(alert_dist.get(level, 0))
-            mlflow.log_metric(f"alert_{level}_count", count)
-            mlflow.log_metric(f"alert_{level}_pct", count / max(len(results), 1) * 100)
+        for level in ALERT_LEVELS:
+            count = summary["alerts"][level]
+            run.log_metric(f"alert_{level}_count", count)
+            run.log_metric(f"alert_{level}_pct", count / max(summary["n"], 1) * 100)
 
-        mlflow.log_metric("avg_integrity_score", float(results["integrity_score"].mean()))
-        mlflow.log_metric("max_integrity_score", float(results["integrity_score"].max()))
+        run.log_metric("avg_integrity_score", summary["score_sum"] / max(summary["n"], 1))
+        run.log_metric("max_integrity_score", summary["score_max"])
 
-        output_path = PROCESSED_DATA_DIR / "integrity_scores.csv"
+        log_drift_metrics(run, summary.get("drift"))
+        drift_path = drift_path or PROCESSED_DATA_DIR / "drift_report.csv"
+        if summary.get("drift") is not None and drift_path.exists():
+            run.log_artifact(str(drift_path))
+
+        output_path = output_path or PROCESSED_DATA_DIR / "integrity_scores.csv"
         if output_path.exists():
-            mlflow.log_artifact(str(output_path))
+            run.log_artifact(str(output_path))
 
 
-def score_only(prefix="fps_leagues"):
+def score_only(prefix="fps_leagues", chunksize=SCORE_CHUNK_SIZE):
     print("=" * 60)
     print("FAIR PLAY SHIELD — Scoring con modelo existente")
     print("=" * 60)
 
     mlflow_enabled = setup_mlflow()
 
-    leagues_path = PROCESSED_DATA_DIR / "european_leagues_with_odds_processed.csv"
-    if not leagues_path.exists():
-        print(f"[ERROR] No se encontró: {leagues_path}")
+    if not store_path("leagues").exists() and not source_path("leagues").exists():
+        print(f"[ERROR] No se encontró: {source_path('leagues')}")
         return None
 
     model_path = MODEL_DIR / f"{prefix}_scaler.pkl"
@@ -347,87 +740,123 @@ def score_only(prefix="fps_leagues"):
         print(f"[ERROR] Modelo '{prefix}' no encontrado. Ejecuta train_and_score() primero.")
         return None
 
-    df = pd.read_csv(leagues_path, parse_dates=["date"], low_memory=False)
-    print(f"\nDatos cargados: {len(df)} partidos")
-
     scorer = IntegrityScorer()
-    scorer.load(prefix)
-
-    results = scorer.score(df)
-
-    print("\n--- Distribución de alertas ---")
-    alert_dist = results["alert_level"].value_counts()
-    for level in ["normal", "monitor", "suspicious", "high_alert"]:
-        count = alert_dist.get(level, 0)
-        pct = count / len(results) * 100
-        emoji = {"normal": "🟢", "monitor": "🟡", "suspicious": "🟠", "high_alert": "🔴"}.get(level, "")
-        print(f"  {emoji} {level:15s}: {count:5d} ({pct:.1f}%)")
+    scorer.load(prefix, compiled=True)
 
     output_path = PROCESSED_DATA_DIR / "integrity_scores.csv"
-    results.to_csv(output_path, index=False)
+    summary = score_to_csv(scorer, iter_features("leagues", chunksize), output_path, chunksize=chunksize,
+                           model_id="leagues")
+    print(f"\nPartidos puntuados: {summary['n']}")
+    summary["drift"] = scorer.drift_report()
+    print_alert_distribution(summary)
+    print_drift_report(summary["drift"])
+    save_drift_report(summary["drift"])
+    save_cube(summary["cube"])
     print(f"\n[SAVED] Scores guardados en: {output_path}")
 
     if mlflow_enabled:
-        log_scoring_to_mlflow(prefix, results, df)
+        log_scoring_to_mlflow(prefix, summary)
 
-    return results
+    return summary
 
 
-def train_and_score():
+def train_and_score(supervised_model=None, out_of_core=False, chunksize=None, prefix="fps_leagues", candidate=False):
     print("=" * 60)
     print("FAIR PLAY SHIELD — Entrenamiento de modelos")
     print("=" * 60)
 
     mlflow_enabled = setup_mlflow()
 
-    leagues_path = PROCESSED_DATA_DIR / "european_leagues_with_odds_processed.csv"
-    if not leagues_path.exists():
-        print(f"[ERROR] No se encontró: {leagues_path}")
+    if not store_path("leagues").exists() and not source_path("leagues").exists():
+        print(f"[ERROR] No se encontró: {source_path('leagues')}")
         return None, None
 
-    df = pd.read_csv(leagues_path, parse_dates=["date"], low_memory=False)
-    print(f"\nDatos cargados: {len(df)} partidos")
-
-    scorer = IntegrityScorer()
-    scorer.fit(df, feature_cols=FEATURE_COLS_LEAGUES)
-    scorer.save("fps_leagues")
+    if candidate:
+        params = load_candidate_params(prefix)
+        if params is None:
+            print(f"[ERROR] No hay configuración candidata: {candidate_params_path(prefix)}")
+            return None, None
+        print(f"  Configuración candidata: {candidate_params_path(prefix)}")
+    else:
+        params = load_params(prefix)
+    if supervised_model is not None:
+        params["supervised_model"] = supervised_model
+    scorer = IntegrityScorer(params=params)
+    output_path = PROCESSED_DATA_DIR / "integrity_scores.csv"
 
-    results = scorer.score(df)
+    if out_of_core:
+        from models.out_of_core import fit_out_of_core, CHUNK_SIZE
+        fit_out_of_core(scorer, ensure_store("leagues"), feature_cols=FEATURE_COLS_LEAGUES, chunksize=chunksize or CHUNK_SIZE)
+        scorer.compile()
+        scorer.save(prefix)
+        chunks = iter_features("leagues", chunksize or SCORE_CHUNK_SIZE)
+    else:
+        df = load_features("leagues")
+        print(f"\nDatos cargados: {len(df)} partidos")
+        scorer.fit(df, feature_cols=FEATURE_COLS_LEAGUES)
+        scorer.compile()
+        scorer.save(prefix)
+        chunks = [df]
+    if candidate:
+        # El bundle ya se guardó con estos params: la candidata queda promovida
+        candidate_params_path(prefix).unlink(missing_ok=True)
+        print(f"  [PROMOTED] Configuración candidata aplicada al bundle '{prefix}'")
+    summary = score_to_csv(scorer, chunks, output_path, chunksize=chunksize or SCORE_CHUNK_SIZE,
+                           model_id="leagues")
 
     print("\n" + "=" * 60)
     print("RESULTADOS DEL SCORING")
     print("=" * 60)
 
-    print("\n--- Distribución de alertas ---")
-    alert_dist = results["alert_level"].value_counts()
-    for level in ["normal", "monitor", "suspicious", "high_alert"]:
-        count = alert_dist.get(level, 0)
-        pct = count / len(results) * 100
-        emoji = {"normal": "🟢", "monitor": "🟡", "suspicious": "🟠", "high_alert": "🔴"}.get(level, "")
-        print(f"  {emoji} {level:15s}: {count:5d} ({pct:.1f}%)")
+    summary["drift"] = scorer.drift_report()
+    print_alert_distribution(summary)
+    print_drift_report(summary["drift"])
+    save_drift_report(summary["drift"])
 
     print("\n--- Top 20 partidos más sospechosos ---")
-    top = results.sort_values("integrity_score", ascending=False).head(20)
+    top = summary["top"].sort_values("integrity_score", ascending=False)
     display_cols = ["date", "home_team", "away_team", "home_goals", "away_goals",
                     "result", "integrity_score", "alert_level"]
     available = [c for c in display_cols if c in top.columns]
     print(top[available].to_string(index=False))
 
-    output_path = PROCESSED_DATA_DIR / "integrity_scores.csv"
-    results.to_csv(output_path, index=False)
+    save_cube(summary["cube"])
     print(f"\n[SAVED] Scores guardados en: {output_path}")
 
-    if "league_name" in results.columns:
+    if summary["leagues"] is not None:
         print("\n--- Sospecha promedio por liga ---")
-        league_avg = results.groupby("league_name")["integrity_score"].agg(["mean", "max", "count"])
+        league_avg = summary["leagues"].assign(mean=lambda t: t["sum"] / t["count"])[["mean", "max", "count"]]
         league_avg = league_avg.sort_values("mean", ascending=False)
         print(league_avg.to_string())
 
     if mlflow_enabled:
-        log_to_mlflow(scorer, results, df)
+        log_to_mlflow(scorer, summary)
 
-    return scorer, results
+    return scorer, summary
 
 
 if __name__ == "__main__":
-    scorer, results = train_and_score()
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Entrenamiento y scoring")
+    parser.add_argument(
+        "--supervised",
+        choices=SUPERVISED_MODELS,
+        default=None,
+        help="Modelo supervisado del ensemble (default: el del bundle, o random_forest)",
+    )
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="Entrenar leyendo el CSV por bloques, con memoria acotada",
+    )
+    parser.add_argument("--chunksize", type=int, default=None, help="Filas por bloque en modo out-of-core")
+    parser.add_argument("--prefix", default="fps_leagues", help="Prefijo del bundle de modelos (default: fps_leagues)")
+    parser.add_argument(
+        "--candidate",
+        action="store_true",
+        help="Entrenar con la configuración candidata del tuning y promoverla al bundle",
+    )
+    args = parser.parse_args()
+    scorer, summary = train_and_score(
+        supervised_model=args.supervised, out_of_core=args.out_of_core, chunksize=args.chunksize,
+        prefix=args.prefix, candidate=args.candidate,
+    )
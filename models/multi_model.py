@@ -0,0 +1,266 @@
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import unicodedata
+import argparse
+import joblib
+import time
+import re
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import PROCESSED_DATA_DIR
+from processing.feature_store import update_feature_store, iter_features, load_features, store_path
+from processing.summary_cube import aggregate, merge_cubes, save_cube
+from models import compiled_trees
+from models.integrity_scorer import (
+    IntegrityScorer,
+    FEATURE_COLS_LEAGUES,
+    FEATURE_COLS_EL,
+    MODEL_DIR,
+    SCORE_CHUNK_SIZE,
+    load_params,
+    setup_mlflow,
+    score_to_csv,
+    print_alert_distribution,
+    save_drift_report,
+    log_to_mlflow,
+    log_scoring_to_mlflow,
+)
+
+MODEL_SCORES_DIR = PROCESSED_DATA_DIR / "scores"
+REGISTRY_PATH = MODEL_DIR / "model_registry.pkl"
+
+_WORKER_STATE = {}
+
+
+def _slug(name):
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "_", ascii_name.lower()).strip("_")
+
+
+def model_specs(per_league=False):
+    specs = []
+    leagues_df = load_features("leagues", columns=["league_name"]) if per_league else None
+    if leagues_df is not None:
+        leagues = leagues_df["league_name"].dropna().unique()
+        for league in sorted(leagues):
+            slug = _slug(league)
+            specs.append({
+                "model_id": f"league_{slug}",
+                "prefix": f"fps_league_{slug}",
+                "feature_set": "leagues",
+                "feature_cols": FEATURE_COLS_LEAGUES,
+                "league": league,
+            })
+    else:
+        specs.append({
+            "model_id": "leagues",
+            "prefix": "fps_leagues",
+            "feature_set": "leagues",
+            "feature_cols": FEATURE_COLS_LEAGUES,
+            "league": None,
+        })
+    specs.append({
+        "model_id": "europa_league",
+        "prefix": "fps_el",
+        "feature_set": "europa_league",
+        "feature_cols": FEATURE_COLS_EL,
+        "league": "Europa League",
+    })
+    return specs
+
+
+def load_registry():
+    if REGISTRY_PATH.exists():
+        return joblib.load(REGISTRY_PATH)
+    return model_specs()
+
+
+def scores_path(model_id):
+    return MODEL_SCORES_DIR / f"{model_id}.csv"
+
+
+def _spec_league(spec):
+    # El store de Europa League ya lleva league_name; en ligas se filtra por la liga del modelo
+    return spec["league"] if spec["feature_set"] == "leagues" else None
+
+
+def _competition_chunks(spec, chunksize=SCORE_CHUNK_SIZE):
+    return iter_features(spec["feature_set"], chunksize, league=_spec_league(spec))
+
+
+def _spec_frame(spec, frame):
+    league = _spec_league(spec)
+    if league is None:
+        return frame
+    return frame[frame["league_name"] == league]
+
+
+def _init_worker(n_threads):
+    # Cada proceso usa una parte de los núcleos para recorrer los árboles compilados
+    compiled_trees.N_THREADS = n_threads
+    _WORKER_STATE["mlflow"] = setup_mlflow()
+
+
+def _run_model(spec, train, frame=None):
+    # frame: features ya en memoria (pipeline de main.py); si no, se leen del store
+    t0 = time.perf_counter()
+    if frame is None and not store_path(spec["feature_set"]).exists():
+        return {"model_id": spec["model_id"], "status": "sin datos"}
+
+    scorer = IntegrityScorer(params=load_params(spec["prefix"]))
+    if train:
+        df = load_features(spec["feature_set"], league=_spec_league(spec)) if frame is None else frame
+        if df.empty:
+            return {"model_id": spec["model_id"], "status": "sin datos"}
+        scorer.fit(df, feature_cols=spec["feature_cols"], verbose=False)
+        scorer.compile()
+        scorer.save(spec["prefix"])
+        del df
+    elif (MODEL_DIR / f"{spec['prefix']}_scaler.pkl").exists():
+        scorer.load(spec["prefix"], compiled=True)
+    else:
+        return {"model_id": spec["model_id"], "status": "sin modelo"}
+
+    MODEL_SCORES_DIR.mkdir(parents=True, exist_ok=True)
+    output_path = scores_path(spec["model_id"])
+    chunks = _competition_chunks(spec) if frame is None else [frame]
+    summary = score_to_csv(scorer, chunks, output_path)
+    summary["drift"] = scorer.drift_report()
+    drift_path = save_drift_report(summary["drift"], MODEL_SCORES_DIR / f"{spec['model_id']}_drift.csv")
+
+    if _WORKER_STATE.get("mlflow"):
+        if train:
+            log_to_mlflow(scorer, summary, model_id=spec["model_id"])
+        else:
+            log_scoring_to_mlflow(spec["prefix"], summary, output_path=output_path, drift_path=drift_path)
+
+    return {
+        "model_id": spec["model_id"],
+        "status": "entrenado" if train else "puntuado",
+        "summary": summary,
+        "metrics": getattr(scorer, "metrics_", {}) if train else {},
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def merge_scores(model_ids, output_path=None):
+    output_path = output_path or PROCESSED_DATA_DIR / "integrity_scores.csv"
+    paths = [(model_id, scores_path(model_id)) for model_id in model_ids if scores_path(model_id).exists()]
+    columns = []
+    for _, path in paths:
+        for col in pd.read_csv(path, nrows=0).columns:
+            if col not in columns:
+                columns.append(col)
+    columns.append("model_id")
+
+    tmp_path = Path(output_path).with_suffix(".tmp")
+    first = True
+    for model_id, path in paths:
+        for chunk in pd.read_csv(path, chunksize=SCORE_CHUNK_SIZE, low_memory=False):
+            chunk["model_id"] = model_id
+            chunk.reindex(columns=columns).to_csv(tmp_path, mode="w" if first else "a", header=first, index=False)
+            first = False
+    if not first:
+        os.replace(tmp_path, output_path)
+    return output_path
+
+
+def run_models(train=True, per_league=False, model_ids=None, n_jobs=None, score_others=True):
+    print("=" * 60)
+    print(f"FAIR PLAY SHIELD — {'Entrenamiento' if train else 'Scoring'} multi-modelo")
+    print("=" * 60)
+
+    if train and model_ids is None:
+        specs = model_specs(per_league=per_league)
+    else:
+        specs = load_registry()
+        known = {s["model_id"] for s in specs}
+        specs += [s for s in model_specs(per_league=per_league)
+                  if s["model_id"] in (model_ids or []) and s["model_id"] not in known]
+    # model_ids limita qué se entrena; el resto de modelos registrados se puntúa con su bundle o, con
+    # score_others=False, se combina con los scores que ya tenga escritos
+    selected = [model_ids is None or s["model_id"] in model_ids for s in specs]
+    reused = [s["model_id"] for s, sel in zip(specs, selected)
+              if not sel and not score_others and scores_path(s["model_id"]).exists()]
+    run_specs = [s for s in specs if s["model_id"] not in reused]
+    trains = [train and (model_ids is None or s["model_id"] in model_ids) for s in run_specs]
+
+    # Los stores se actualizan antes del pool para que los procesos solo lean
+    for feature_set in sorted({s["feature_set"] for s in run_specs}):
+        update_feature_store(feature_set, verbose=False)
+
+    n_jobs = n_jobs or min(len(run_specs), os.cpu_count() or 1)
+    n_threads = max(1, (os.cpu_count() or 1) // n_jobs)
+    reused_info = f" ({len(reused)} con sus scores actuales)" if reused else ""
+    print(f"\n  {len(run_specs)} modelos{reused_info}, {n_jobs} procesos × {n_threads} hilos")
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(n_threads,)) as pool:
+        runs = list(pool.map(_run_model, run_specs, trains))
+    return _report_runs(runs, specs, train, reused=reused)
+
+
+def score_frames(frames):
+    # Scoring en el propio proceso con los DataFrames del store ya cargados (sin releer el Parquet)
+    print("=" * 60)
+    print("FAIR PLAY SHIELD — Scoring multi-modelo (en memoria)")
+    print("=" * 60)
+
+    specs = load_registry()
+    _WORKER_STATE["mlflow"] = setup_mlflow()
+    runs = []
+    for spec in specs:
+        frame = frames.get(spec["feature_set"])
+        if frame is None:
+            runs.append({"model_id": spec["model_id"], "status": "sin datos"})
+            continue
+        runs.append(_run_model(spec, False, frame=_spec_frame(spec, frame)))
+    return _report_runs(runs, specs, train=False)
+
+
+def _report_runs(runs, specs, train, reused=()):
+    done = [r for r in runs if "summary" in r]
+    for r in runs:
+        if "summary" not in r:
+            print(f"\n  [{r['model_id']}] {r['status']}, se omite")
+            continue
+        auc = r["metrics"].get("rf_auc")
+        auc_info = f", AUC {auc:.4f}" if auc is not None else ""
+        print(f"\n  [{r['model_id']}] {r['status']}: {r['summary']['n']} partidos en {r['seconds']:.1f}s{auc_info}")
+        print_alert_distribution(r["summary"])
+
+    if train:
+        joblib.dump(specs, REGISTRY_PATH)
+    cubes = {r["model_id"]: r["summary"]["cube"] for r in done}
+    output_path = merge_saved([r["model_id"] for r in done] + list(reused), cubes)
+    print(f"\n[SAVED] Scores combinados ({len(done) + len(reused)} modelos) en: {output_path}")
+    return runs
+
+
+def file_cube(path):
+    # Cubo de un CSV de scores ya escrito, leído por bloques
+    cube = None
+    for chunk in pd.read_csv(path, chunksize=SCORE_CHUNK_SIZE, low_memory=False):
+        cube = merge_cubes([cube, aggregate(chunk)])
+    return cube
+
+
+def merge_saved(model_ids, cubes=None):
+    # integrity_scores.csv y cubo combinados a partir de los CSV por modelo; cubes: los ya calculados
+    # al puntuar (el resto se agrega desde su fichero)
+    cubes = cubes or {}
+    model_ids = [m for m in model_ids if scores_path(m).exists()]
+    output_path = merge_scores(model_ids)
+    save_cube(merge_cubes([cubes[m] if m in cubes else file_cube(scores_path(m)) for m in model_ids]))
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Modelos por competición")
+    parser.add_argument("--score", action="store_true", help="Solo puntuar con los bundles existentes")
+    parser.add_argument("--per-league", action="store_true", help="Un modelo por liga doméstica en lugar de uno conjunto")
+    parser.add_argument("--models", nargs="+", default=None, help="model_id a entrenar (el resto solo se puntúa)")
+    parser.add_argument("--jobs", type=int, default=None, help="Modelos en paralelo (default: nº de CPUs)")
+    args = parser.parse_args()
+    run_models(train=not args.score, per_league=args.per_league, model_ids=args.models, n_jobs=args.jobs)
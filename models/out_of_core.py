@@ -0,0 +1,216 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import math
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from models.integrity_scorer import FEATURE_COLS_LEAGUES
+from models.drift import DriftSketch
+from processing.feature_store import iter_parquet
+
+CHUNK_SIZE = 50_000
+SAMPLE_SIZE = 50_000
+HOLDOUT_SIZE = 20_000
+HOLDOUT_FRACTION = 0.2
+LABEL_COLS = ["total_flags", "odds_movement_abs_max", "total_goals"]
+
+
+class _Reservoir:
+
+    def __init__(self, size, seed=42):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.seen = 0
+        self.data = None
+
+    def add(self, rows):
+        if len(rows) == 0:
+            return
+        if self.data is None:
+            self.data = np.empty((0, rows.shape[1]), dtype=rows.dtype)
+        free = self.size - len(self.data)
+        if free > 0:
+            self.data = np.vstack([self.data, rows[:free]])
+            self.seen += min(free, len(rows))
+            rows = rows[free:]
+        if len(rows) == 0:
+            return
+        positions = self.seen + np.arange(len(rows))
+        slots = self.rng.integers(0, positions + 1)
+        keep = slots < self.size
+        self.data[slots[keep]] = rows[keep]
+        self.seen += len(rows)
+
+
+def _is_parquet(path):
+    return Path(path).suffix == ".parquet"
+
+
+def _header(path):
+    import pyarrow.parquet as pq
+    return pq.read_schema(path).names if _is_parquet(path) else list(pd.read_csv(path, nrows=0).columns)
+
+
+def _sample_columns(path, feature_cols):
+    header = _header(path)
+    wanted = set(feature_cols) | set(LABEL_COLS)
+    return [c for c in header if c in wanted or c.startswith("flag_")]
+
+
+def _read_chunks(path, columns, chunksize):
+    if _is_parquet(path):
+        return iter_parquet(path, chunksize, columns=columns)
+    return pd.read_csv(path, usecols=columns, chunksize=chunksize, low_memory=False)
+
+
+def fit_out_of_core(scorer, path, feature_cols=None, chunksize=CHUNK_SIZE, sample_size=SAMPLE_SIZE,
+                    holdout_size=HOLDOUT_SIZE, verbose=True):
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.metrics import roc_auc_score, precision_score, recall_score, f1_score
+
+    if feature_cols is None:
+        feature_cols = FEATURE_COLS_LEAGUES
+    columns = _sample_columns(path, feature_cols)
+    # La fecha solo se lee en la primera pasada: fija trained_until_ (drift y reentrenamiento incremental)
+    first_pass_cols = columns + (["date"] if "date" in _header(path) else [])
+
+    if verbose:
+        print(f"\n  [OOC] Pasada 1: estadísticas del scaler y muestra de {sample_size:,} filas")
+    sample = _Reservoir(sample_size, seed=42)
+    n_rows = 0
+    trained_until = None
+    goals_n, goals_sum, goals_sumsq = 0, 0.0, 0.0
+    for chunk in _read_chunks(path, first_pass_cols, chunksize):
+        if "date" in chunk.columns:
+            last = pd.to_datetime(chunk.pop("date"), errors="coerce").max()
+            if pd.notna(last) and (trained_until is None or last > trained_until):
+                trained_until = last
+        X = scorer.prepare_features(chunk, feature_cols)
+        scorer.scaler.partial_fit(X)
+        if "total_goals" in chunk.columns:
+            goals = pd.to_numeric(chunk["total_goals"], errors="coerce").dropna()
+            goals_n += len(goals)
+            goals_sum += float(goals.sum())
+            goals_sumsq += float((goals ** 2).sum())
+        sample.add(chunk.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64))
+        n_rows += len(chunk)
+
+    sample_df = pd.DataFrame(sample.data, columns=columns)
+    stats = {}
+    if "odds_movement_abs_max" in columns:
+        stats["odds_q95"] = sample_df["odds_movement_abs_max"].quantile(0.95)
+    if goals_n > 1:
+        stats["goals_mean"] = goals_sum / goals_n
+        stats["goals_std"] = math.sqrt(max(goals_sumsq - goals_n * stats["goals_mean"] ** 2, 0) / (goals_n - 1))
+
+    X_sample = scorer.prepare_features(sample_df, feature_cols)
+    y_sample = scorer.create_synthetic_labels(sample_df, X_sample, verbose=verbose, stats=stats)
+    X_sample_scaled = scorer.scaler.transform(X_sample)
+    drift_reference = DriftSketch.from_sample(X_sample, scorer.feature_cols)
+
+    if verbose:
+        print(f"  [1/3] Isolation Forest (muestra de {len(X_sample):,} de {n_rows:,} partidos)...")
+    scorer.isolation_forest.fit(X_sample_scaled)
+    scorer.calibrate_iso(X_sample_scaled)
+    iso_anomalies = int((scorer.isolation_forest.predict(X_sample_scaled) == -1).sum())
+
+    n_pos = max(int(y_sample.sum()), 1)
+    n_neg = max(len(y_sample) - n_pos, 1)
+    class_weight = {0: len(y_sample) / (2 * n_neg), 1: len(y_sample) / (2 * n_pos)}
+
+    linear = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=42)
+    supervised = scorer.supervised
+    incremental_trees = scorer.supervised_name == "random_forest"
+    if incremental_trees:
+        n_chunks = max(1, math.ceil(n_rows / chunksize))
+        trees_per_chunk = max(1, math.ceil(scorer.params["rf_n_estimators"] / n_chunks))
+        supervised.set_params(warm_start=True)
+
+    if verbose:
+        print(f"  [OOC] Pasada 2: entrenamiento incremental ({math.ceil(n_rows / chunksize)} bloques)")
+    holdout = _Reservoir(holdout_size, seed=7)
+    split_rng = np.random.default_rng(123)
+    n_train = 0
+    for i, chunk in enumerate(_read_chunks(path, columns, chunksize)):
+        X = scorer.prepare_features(chunk, feature_cols)
+        y = scorer.create_synthetic_labels(chunk, X, verbose=False, stats=stats).to_numpy()
+        drift_reference.update(X, scorer.feature_missing(chunk))
+        X_scaled = scorer.scaler.transform(X)
+
+        is_holdout = split_rng.random(len(X_scaled)) < HOLDOUT_FRACTION
+        holdout.add(np.column_stack([X_scaled[is_holdout], y[is_holdout]]))
+        X_train, y_train = X_scaled[~is_holdout], y[~is_holdout]
+        if len(y_train) == 0:
+            continue
+        n_train += len(y_train)
+
+        sample_weight = np.where(y_train == 1, class_weight[1], class_weight[0])
+        linear.partial_fit(X_train, y_train, classes=np.array([0, 1]), sample_weight=sample_weight)
+
+        if incremental_trees:
+            if len(np.unique(y_train)) < 2:
+                if verbose:
+                    print(f"        Bloque {i}: una sola clase, sin árboles nuevos")
+                continue
+            n_trees = len(getattr(supervised, "estimators_", []))
+            if n_trees >= scorer.params["rf_n_estimators"]:
+                continue
+            supervised.n_estimators = min(n_trees + trees_per_chunk, scorer.params["rf_n_estimators"])
+            supervised.fit(X_train, y_train)
+
+    if incremental_trees and not hasattr(supervised, "estimators_"):
+        # Ningún bloque tuvo las dos clases: los árboles se entrenan sobre la muestra acotada
+        if verbose:
+            print("        Ningún bloque con las dos clases: árboles sobre la muestra acotada")
+        incremental_trees = False
+        supervised.set_params(warm_start=False, n_estimators=scorer.params["rf_n_estimators"])
+    if not incremental_trees:
+        if len(np.unique(y_sample)) < 2:
+            raise ValueError(f"{scorer.supervised_name}: la muestra de entrenamiento tiene una sola clase "
+                             "(revisa los umbrales de las etiquetas sintéticas)")
+        if verbose:
+            print(f"  [2/3] {scorer.supervised_name} sobre la muestra acotada...")
+        supervised.fit(X_sample_scaled, y_sample)
+    scorer.logistic = linear
+
+    X_test, y_test = holdout.data[:, :-1], holdout.data[:, -1].astype(int)
+    y_test_s = pd.Series(y_test)
+    rf_pred = supervised.predict(X_test)
+    rf_proba = supervised.predict_proba(X_test)[:, 1]
+    lr_pred = linear.predict(X_test)
+    lr_proba = linear.predict_proba(X_test)[:, 1]
+    both = y_test_s.nunique() > 1
+
+    scorer.metrics_ = {
+        "iso_anomalies_pct": iso_anomalies / len(X_sample) * 100,
+        "rf_auc": roc_auc_score(y_test, rf_proba) if both else 0,
+        "rf_precision": precision_score(y_test, rf_pred, zero_division=0),
+        "rf_recall": recall_score(y_test, rf_pred, zero_division=0),
+        "rf_f1": f1_score(y_test, rf_pred, zero_division=0),
+        "lr_auc": roc_auc_score(y_test, lr_proba) if both else 0,
+        "lr_precision": precision_score(y_test, lr_pred, zero_division=0),
+        "lr_recall": recall_score(y_test, lr_pred, zero_division=0),
+        "lr_f1": f1_score(y_test, lr_pred, zero_division=0),
+        "train_samples": n_train,
+        "test_samples": len(y_test),
+        "suspicious_pct": float(y_sample.mean() * 100),
+    }
+    scorer.feature_importances_ = pd.Series(
+        scorer.supervised_importances(X_test, y_test_s), index=scorer.feature_cols
+    ).sort_values(ascending=False).to_dict()
+
+    if verbose:
+        n_trees = len(getattr(supervised, "estimators_", [])) if incremental_trees else None
+        trees_info = f", {n_trees} árboles" if n_trees else ""
+        print(f"        {scorer.supervised_name}: AUC-ROC {scorer.metrics_['rf_auc']:.4f}{trees_info}")
+        print(f"        SGD logístico: AUC-ROC {scorer.metrics_['lr_auc']:.4f}")
+
+    scorer.drift_reference_ = drift_reference
+    scorer.label_stats_ = stats
+    scorer.trained_until_ = trained_until
+    scorer.drift_ = None
+    scorer.compiled_ = None
+    scorer.is_fitted = True
+    return scorer
+
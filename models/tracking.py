@@ -0,0 +1,323 @@
+from contextlib import contextmanager
+from collections import deque
+from multiprocessing import util as mp_util
+from pathlib import Path
+import importlib.util
+import threading
+import argparse
+import tempfile
+import shutil
+import atexit
+import json
+import time
+import uuid
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import DATA_DIR
+
+MLFLOW_AVAILABLE = importlib.util.find_spec("mlflow") is not None
+MLFLOW_TRACKING_URI = os.environ.get("MLFLOW_TRACKING_URI", "http://localhost:5001")
+MLFLOW_EXPERIMENT_NAME = "fair_play_shield"
+
+SPOOL_DIR = DATA_DIR / "mlflow_spool"
+QUEUE_SIZE = 32
+# Espera máxima al salir del proceso antes de dejar en el spool lo que no se haya enviado
+FLUSH_TIMEOUT = float(os.environ.get("MLFLOW_FLUSH_TIMEOUT", "10"))
+STALE_LOCK_SECONDS = 3600
+# Límites por llamada de log_batch en MLflow
+MAX_PARAMS_PER_BATCH = 100
+MAX_METRICS_PER_BATCH = 1000
+
+# Con el servidor caído se falla rápido: el reintento real es replay_spool()
+os.environ.setdefault("MLFLOW_HTTP_REQUEST_TIMEOUT", "10")
+os.environ.setdefault("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "1")
+
+_SPOOL_LOCK = threading.Lock()
+_LOGGER = None
+
+
+class RunRecord:
+
+    def __init__(self, run_name, record_id=None):
+        self.run_name = run_name
+        self.record_id = record_id or f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.params = {}
+        self.metrics = []
+        self.artifacts = []
+        self.models = {}
+        self.spooled = False
+        self.sent = False
+
+    @property
+    def path(self):
+        return SPOOL_DIR / self.record_id
+
+    def log_param(self, key, value):
+        self.params[key] = str(value)
+
+    def log_params(self, params):
+        for key, value in params.items():
+            self.log_param(key, value)
+
+    def log_metric(self, key, value, step=0):
+        self.metrics.append((key, float(value), int(time.time() * 1000), int(step)))
+
+    def log_artifact(self, local_path):
+        # Sin copiar en el hilo del pipeline: un hard link fija la versión actual de los ficheros que se
+        # reescriben con os.replace. Si no se puede enlazar (otro sistema de ficheros) se guarda la ruta
+        # y el worker la sube directamente o la copia al spool
+        artifacts_dir = self.path / "artifacts"
+        artifacts_dir.mkdir(parents=True, exist_ok=True)
+        target = artifacts_dir / Path(local_path).name
+        target.unlink(missing_ok=True)
+        try:
+            os.link(local_path, target)
+        except OSError:
+            target = Path(local_path).resolve()
+        self.artifacts.append(str(target))
+
+    def log_model(self, model, name):
+        self.models[name] = model
+
+    def to_dict(self):
+        return {
+            "run_name": self.run_name,
+            "record_id": self.record_id,
+            "params": self.params,
+            "metrics": self.metrics,
+            "artifacts": [Path(p).name for p in self.artifacts],
+            "models": list(self.models),
+        }
+
+    @classmethod
+    def from_dir(cls, path):
+        state = json.loads((path / "record.json").read_text())
+        record = cls(state["run_name"], record_id=path.name)
+        record.params = state["params"]
+        record.metrics = [tuple(m) for m in state["metrics"]]
+        record.artifacts = [str(path / "artifacts" / name) for name in state["artifacts"]]
+        record.models = {name: path / "models" / f"{name}.pkl" for name in state["models"]}
+        record.spooled = True
+        return record
+
+
+def _experiment_id(client):
+    experiment = client.get_experiment_by_name(MLFLOW_EXPERIMENT_NAME)
+    if experiment is not None:
+        return experiment.experiment_id
+    return client.create_experiment(MLFLOW_EXPERIMENT_NAME)
+
+
+def send_record(record):
+    from mlflow.tracking import MlflowClient
+    from mlflow.entities import Metric, Param
+    import mlflow.sklearn
+    import joblib
+
+    client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
+    run_id = client.create_run(_experiment_id(client), run_name=record.run_name).info.run_id
+    try:
+        params = [Param(key, value) for key, value in record.params.items()]
+        metrics = [Metric(key, value, timestamp, step) for key, value, timestamp, step in record.metrics]
+        for i in range(0, len(params), MAX_PARAMS_PER_BATCH):
+            client.log_batch(run_id, params=params[i:i + MAX_PARAMS_PER_BATCH])
+        for i in range(0, len(metrics), MAX_METRICS_PER_BATCH):
+            client.log_batch(run_id, metrics=metrics[i:i + MAX_METRICS_PER_BATCH])
+        for path in record.artifacts:
+            client.log_artifact(run_id, path)
+        for name, model in record.models.items():
+            if isinstance(model, Path):
+                model = joblib.load(model)
+            with tempfile.TemporaryDirectory() as tmp:
+                mlflow.sklearn.save_model(model, Path(tmp) / name)
+                client.log_artifacts(run_id, str(Path(tmp) / name), artifact_path=name)
+    except Exception:
+        client.set_terminated(run_id, status="FAILED")
+        raise
+    client.set_terminated(run_id)
+    return run_id
+
+
+def discard_record(record):
+    # Run enviado: se borra su directorio (enlaces de artefactos y el spool si shutdown() llegó a escribirlo).
+    # Mismo lock que spool_record: nunca se borra un spool a medio escribir ni se guarda un run ya enviado
+    with _SPOOL_LOCK:
+        record.sent = True
+        shutil.rmtree(record.path, ignore_errors=True)
+
+
+def spool_record(record):
+    import joblib
+
+    with _SPOOL_LOCK:
+        if record.spooled or record.sent:
+            return
+        record.spooled = True
+        path = record.path
+        (path / "models").mkdir(parents=True, exist_ok=True)
+        (path / "artifacts").mkdir(parents=True, exist_ok=True)
+        for name, model in record.models.items():
+            joblib.dump(model, path / "models" / f"{name}.pkl")
+        # Artefactos guardados solo como ruta: se copian ahora, fuera del pipeline
+        artifacts = []
+        for artifact in map(Path, record.artifacts):
+            if artifact.parent != path / "artifacts" and artifact.exists():
+                shutil.copy2(artifact, path / "artifacts" / artifact.name)
+                artifact = path / "artifacts" / artifact.name
+            artifacts.append(str(artifact))
+        record.artifacts = artifacts
+        # record.json se escribe al final: solo cuenta como pendiente cuando el spool está completo
+        tmp_path = path / "record.json.tmp"
+        tmp_path.write_text(json.dumps(record.to_dict()))
+        os.replace(tmp_path, path / "record.json")
+
+
+def _claim(path):
+    lock = path / ".lock"
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if time.time() - lock.stat().st_mtime < STALE_LOCK_SECONDS:
+            return False
+        lock.touch()
+        return True
+    os.close(fd)
+    return True
+
+
+def pending_records():
+    if not SPOOL_DIR.exists():
+        return []
+    return sorted(p for p in SPOOL_DIR.iterdir() if (p / "record.json").exists())
+
+
+def replay_spool(verbose=True):
+    # Reenvía en orden los runs que no pudieron subirse; se detiene al primer fallo (servidor caído)
+    sent = 0
+    for path in pending_records():
+        if not _claim(path):
+            continue
+        try:
+            record = RunRecord.from_dir(path)
+            send_record(record)
+            discard_record(record)
+            sent += 1
+        except Exception as e:
+            (path / ".lock").unlink(missing_ok=True)
+            if verbose:
+                print(f"[MLFLOW] Replay detenido ({e}); quedan {len(pending_records())} runs en {SPOOL_DIR}")
+            break
+    if verbose and sent:
+        print(f"[MLFLOW] {sent} runs del spool enviados")
+    return sent
+
+
+class AsyncLogger:
+
+    def __init__(self, maxsize=QUEUE_SIZE, flush_timeout=FLUSH_TIMEOUT):
+        # Cola y run en curso cambian bajo la misma condición: shutdown() ve cada run pendiente en uno
+        # de los dos sitios, nunca en tránsito entre ambos
+        self.pending = deque()
+        self.maxsize = maxsize
+        self.cond = threading.Condition()
+        self.flush_timeout = flush_timeout
+        self.pid = os.getpid()
+        self.current = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._worker, name="mlflow-logger", daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+        # Los procesos de un pool no ejecutan atexit, pero sí los finalizadores de multiprocessing
+        mp_util.Finalize(self, self.shutdown, exitpriority=10)
+
+    def _worker(self):
+        replay_spool(verbose=False)
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                record = self.current = self.pending.popleft()
+            try:
+                send_record(record)
+            except Exception as e:
+                print(f"[MLFLOW] Envío fallido ({type(e).__name__}); run '{record.run_name}' guardado en {SPOOL_DIR}")
+                spool_record(record)
+            else:
+                discard_record(record)
+            finally:
+                with self.cond:
+                    self.current = None
+                    self.cond.notify_all()
+
+    def submit(self, record):
+        with self.cond:
+            full = len(self.pending) >= self.maxsize
+            if not self.closed and not full:
+                self.pending.append(record)
+                self.cond.notify_all()
+                return
+        if full:
+            print(f"[MLFLOW] Cola llena; run '{record.run_name}' guardado en {SPOOL_DIR}")
+        spool_record(record)
+
+    def flush(self, timeout=None):
+        deadline = time.monotonic() + (self.flush_timeout if timeout is None else timeout)
+        with self.cond:
+            while self.pending or self.current is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=None):
+        if os.getpid() != self.pid:
+            return
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        if self.flush(timeout):
+            return
+        # Lo que no se ha enviado a tiempo queda en el spool para el próximo replay. El run en curso
+        # también: si su envío termina después, discard_record borra el spool y no se duplica
+        with self.cond:
+            pending = ([self.current] if self.current is not None else []) + list(self.pending)
+            self.pending.clear()
+        for record in pending:
+            spool_record(record)
+        print(f"[MLFLOW] {len(pending)} runs pendientes guardados en {SPOOL_DIR}")
+
+
+def get_logger():
+    global _LOGGER
+    # Tras un fork el hilo del padre no existe en el hijo: cada proceso tiene su propio logger
+    if _LOGGER is None or _LOGGER.pid != os.getpid():
+        _LOGGER = AsyncLogger()
+    return _LOGGER
+
+
+@contextmanager
+def tracked_run(run_name):
+    record = RunRecord(run_name)
+    yield record
+    get_logger().submit(record)
+
+
+def flush_logging(timeout=None):
+    if _LOGGER is not None and _LOGGER.pid == os.getpid():
+        _LOGGER.shutdown(timeout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Runs de MLflow pendientes")
+    parser.add_argument("--replay", action="store_true", help="Reenviar al servidor los runs del spool")
+    args = parser.parse_args()
+    print(f"Runs pendientes en {SPOOL_DIR}: {len(pending_records())}")
+    if args.replay and MLFLOW_AVAILABLE:
+        replay_spool()
@@ -0,0 +1,257 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import joblib
+import math
+import time
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import PROCESSED_DATA_DIR, CACHE_DIR
+from processing.feature_store import ensure_store, load_features, source_path
+from models.integrity_scorer import (
+    IntegrityScorer,
+    FEATURE_COLS_LEAGUES,
+    DEFAULT_PARAMS,
+    MLFLOW_AVAILABLE,
+    MODEL_DIR,
+    load_params,
+    candidate_params_path,
+    setup_mlflow,
+    tracked_run,
+)
+from models.backtesting import _data_fingerprint
+
+
+TUNING_CACHE_DIR = CACHE_DIR / "tuning"
+
+SEARCH_SPACE = {
+    "iso_n_estimators": [100, 200, 300],
+    "iso_max_samples": ["auto", 128, 512],
+    "iso_contamination": [0.02, 0.04, 0.06],
+    "rf_n_estimators": [100, 200, 400],
+    "rf_max_depth": [6, 8, 10, 14, None],
+    "rf_min_samples_leaf": [1, 3, 5, 10],
+    "rf_max_features": ["sqrt", 0.5, 1.0],
+    "supervised_model": ["random_forest", "hist_gradient_boosting"],
+    "hgb_learning_rate": (0.02, 0.3),
+    "hgb_max_leaf_nodes": [15, 31, 63],
+    "lr_C": (0.01, 10.0),
+}
+
+_WORKER_DATA = {}
+
+
+def sample_configs(n_configs, seed=42):
+    rng = np.random.default_rng(seed)
+    configs = [dict(DEFAULT_PARAMS)]
+    while len(configs) < n_configs:
+        config = dict(DEFAULT_PARAMS)
+        for name, space in SEARCH_SPACE.items():
+            if isinstance(space, tuple):
+                low, high = np.log(space[0]), np.log(space[1])
+                config[name] = float(f"{np.exp(rng.uniform(low, high)):.4g}")
+            else:
+                config[name] = space[rng.integers(len(space))]
+        w_if, w_rf, w_lr = rng.dirichlet([2.0, 2.0, 2.0])
+        config["weight_if"] = round(float(w_if), 3)
+        config["weight_rf"] = round(float(w_rf), 3)
+        config["weight_lr"] = round(1 - config["weight_if"] - config["weight_rf"], 3)
+        configs.append(config)
+    return configs
+
+
+def prepare_tuning_matrices(df, feature_cols=None, cache_dir=TUNING_CACHE_DIR):
+    if feature_cols is None:
+        feature_cols = FEATURE_COLS_LEAGUES
+
+    key = _data_fingerprint(df, feature_cols)
+    matrix_dir = Path(cache_dir) / key
+    if (matrix_dir / "y_valid.npy").exists():
+        print(f"  [CACHE] Matrices pre-escaladas: {matrix_dir}")
+        return matrix_dir
+
+    if "season" in df.columns and df["season"].nunique() > 1:
+        valid_season = sorted(df["season"].dropna().unique())[-1]
+        train_df = df[df["season"] != valid_season]
+        valid_df = df[df["season"] == valid_season]
+        print(f"  Validación: temporada {valid_season}")
+    else:
+        cut = int(len(df) * 0.8)
+        train_df, valid_df = df.iloc[:cut], df.iloc[cut:]
+
+    scorer = IntegrityScorer()
+    X_train = scorer.prepare_features(train_df, feature_cols)
+    y_train = scorer.create_synthetic_labels(train_df, X_train, verbose=False)
+    X_valid = scorer.prepare_features(valid_df, feature_cols)
+    y_valid = scorer.create_synthetic_labels(valid_df, X_valid, verbose=False)
+    scorer.scaler.fit(X_train)
+
+    matrix_dir.mkdir(parents=True, exist_ok=True)
+    np.save(matrix_dir / "X_train.npy", scorer.scaler.transform(X_train))
+    np.save(matrix_dir / "y_train.npy", y_train.to_numpy(dtype=np.int8))
+    np.save(matrix_dir / "X_valid.npy", scorer.scaler.transform(X_valid))
+    joblib.dump(scorer.feature_cols, matrix_dir / "feature_cols.pkl")
+    np.save(matrix_dir / "y_valid.npy", y_valid.to_numpy(dtype=np.int8))
+    print(f"  [BUILD] Matrices pre-escaladas: {len(X_train)} train / {len(X_valid)} validación")
+    return matrix_dir
+
+
+def _init_worker(matrix_dir):
+    matrix_dir = Path(matrix_dir)
+    for name in ["X_train", "y_train", "X_valid", "y_valid"]:
+        _WORKER_DATA[name] = np.load(matrix_dir / f"{name}.npy", mmap_mode="r")
+
+
+def _evaluate_config(trial_id, config, resource):
+    from sklearn.metrics import roc_auc_score
+
+    t0 = time.perf_counter()
+    X_train, y_train = _WORKER_DATA["X_train"], _WORKER_DATA["y_train"]
+    X_valid, y_valid = _WORKER_DATA["X_valid"], _WORKER_DATA["y_valid"]
+
+    n = max(int(len(y_train) * resource), 50)
+    rng = np.random.default_rng(trial_id)
+    idx = np.sort(rng.choice(len(y_train), size=min(n, len(y_train)), replace=False))
+    X_sub, y_sub = np.asarray(X_train[idx]), np.asarray(y_train[idx])
+
+    scorer = IntegrityScorer(params=config)
+    scorer.isolation_forest.fit(X_sub)
+    # Mismo escalado del IF que en producción (rango del entrenamiento, con recorte), no el min/max de validación
+    scorer.calibrate_iso(X_sub)
+    if len(np.unique(y_sub)) < 2:
+        return {"trial_id": trial_id, "resource": resource, "auc": np.nan,
+                "seconds": time.perf_counter() - t0}
+    scorer.supervised.fit(X_sub, y_sub)
+    scorer.logistic.fit(X_sub, y_sub)
+
+    integrity_score, _, _, _ = scorer.score_scaled(np.asarray(X_valid))
+    auc = roc_auc_score(y_valid, integrity_score) if len(np.unique(y_valid)) > 1 else np.nan
+    return {"trial_id": trial_id, "resource": resource, "auc": auc,
+            "seconds": time.perf_counter() - t0}
+
+
+def successive_halving(configs, matrix_dir, eta=3, min_resource=None, n_jobs=None):
+    n_rungs = max(1, int(math.floor(math.log(len(configs), eta))) + 1)
+    if min_resource is None:
+        min_resource = max(1 / eta ** (n_rungs - 1), 1 / 27)
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    trials = []
+    alive = list(range(len(configs)))
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(str(matrix_dir),)) as pool:
+        for rung in range(n_rungs):
+            resource = min(1.0, min_resource * eta ** rung)
+            t0 = time.perf_counter()
+            results = list(pool.map(
+                _evaluate_config,
+                alive,
+                [configs[i] for i in alive],
+                [resource] * len(alive),
+            ))
+            for r in results:
+                r["rung"] = rung
+            trials.extend(results)
+
+            ranked = sorted(results, key=lambda r: -np.nan_to_num(r["auc"], nan=-1))
+            best_auc = ranked[0]["auc"]
+            print(f"  Rung {rung}: {len(alive):4d} configs × {resource:.0%} datos "
+                  f"→ mejor AUC {best_auc:.4f} ({time.perf_counter() - t0:.1f}s)")
+
+            n_keep = max(1, len(alive) // eta)
+            if rung == n_rungs - 1:
+                n_keep = 1
+            alive = [r["trial_id"] for r in ranked[:n_keep]]
+
+    trials_df = pd.DataFrame(trials)
+    params_df = pd.DataFrame(configs)
+    params_df["trial_id"] = range(len(configs))
+    trials_df = trials_df.merge(params_df, on="trial_id", how="left")
+    return configs[alive[0]], trials_df
+
+
+def log_tuning_to_mlflow(best_config, trials_df, prefix):
+    if not MLFLOW_AVAILABLE:
+        return
+
+    with tracked_run(f"tuning_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}") as run:
+        run.log_param("model_prefix", prefix)
+        run.log_param("search", "successive_halving")
+        run.log_param("n_configs", int(trials_df["trial_id"].nunique()))
+        run.log_param("n_rungs", int(trials_df["rung"].nunique()))
+        for param_name, param_value in best_config.items():
+            run.log_param(f"best_{param_name}", param_value)
+
+        for rung, rung_df in trials_df.groupby("rung"):
+            run.log_metric("rung_best_auc", float(rung_df["auc"].max()), step=int(rung))
+            run.log_metric("rung_median_auc", float(rung_df["auc"].median()), step=int(rung))
+            run.log_metric("rung_seconds", float(rung_df["seconds"].sum()), step=int(rung))
+
+        final = trials_df[trials_df["rung"] == trials_df["rung"].max()]
+        run.log_metric("best_auc", float(final["auc"].max()))
+
+        trials_path = MODEL_DIR / f"{prefix}_tuning_trials.csv"
+        trials_df.to_csv(trials_path, index=False)
+        run.log_artifact(str(trials_path))
+
+        print(f"[MLFLOW] Tuning queued for background upload")
+
+
+def tune(prefix="fps_leagues", n_configs=243, eta=3, n_jobs=None, seed=42):
+    print("=" * 60)
+    print("FAIR PLAY SHIELD — Búsqueda de hiperparámetros (successive halving)")
+    print("=" * 60)
+
+    mlflow_enabled = setup_mlflow()
+
+    if ensure_store("leagues") is None:
+        print(f"[ERROR] No se encontró: {source_path('leagues')}")
+        return None, None
+
+    df = load_features("leagues")
+    print(f"\nDatos cargados: {len(df)} partidos")
+
+    matrix_dir = prepare_tuning_matrices(df, feature_cols=FEATURE_COLS_LEAGUES)
+    configs = sample_configs(n_configs, seed=seed)
+    print(f"\n  {len(configs)} configuraciones, eta={eta}")
+
+    best_config, trials_df = successive_halving(configs, matrix_dir, eta=eta, n_jobs=n_jobs)
+
+    baseline = load_params(prefix)
+    print("\n--- Mejor configuración ---")
+    for name, value in best_config.items():
+        marker = "" if baseline.get(name) == value else f"  (antes: {baseline.get(name)})"
+        print(f"  {name:22s}: {value}{marker}")
+
+    # Los modelos guardados se entrenaron con otros params: la configuración queda como candidata
+    # y solo pasa al bundle al reentrenar (--retrain, o integrity_scorer.py --candidate)
+    candidate_path = candidate_params_path(prefix)
+    joblib.dump(dict(best_config), candidate_path)
+    print(f"\n[SAVED] Configuración candidata guardada en: {candidate_path}")
+
+    output_path = PROCESSED_DATA_DIR / f"{prefix}_tuning_trials.csv"
+    trials_df.to_csv(output_path, index=False)
+    print(f"[SAVED] Trials guardados en: {output_path}")
+
+    if mlflow_enabled:
+        log_tuning_to_mlflow(best_config, trials_df, prefix)
+
+    return best_config, trials_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Búsqueda de hiperparámetros del ensemble")
+    parser.add_argument("--prefix", default="fps_leagues", help="Prefijo del bundle de modelos (default: fps_leagues)")
+    parser.add_argument("--configs", type=int, default=243, help="Configuraciones iniciales (default: 243)")
+    parser.add_argument("--eta", type=int, default=3, help="Factor de reducción por rung (default: 3)")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos en paralelo (default: nº de CPUs)")
+    parser.add_argument("--retrain", action="store_true", help="Reentrenar el bundle con la mejor configuración y promoverla")
+    args = parser.parse_args()
+
+    best_config, _ = tune(prefix=args.prefix, n_configs=args.configs, eta=args.eta, n_jobs=args.jobs)
+    if best_config is not None and args.retrain:
+        from models.integrity_scorer import train_and_score
+        train_and_score(prefix=args.prefix, candidate=True)
@@ -180,16 +180,24 @@ def flag_anomalies(df):
     return df
 
 
-def process_and_save(input_file="europa_league_complete.csv", output_file="europa_league_processed.csv"):
-    df = load_raw_data(input_file)
+def process_frame(df):
     df = clean_matches(df)
     df = compute_team_form(df)
-    df = flag_anomalies(df)
+    return flag_anomalies(df)
+
+
+def process_and_save(input_file="europa_league_complete.csv", output_file="europa_league_processed.csv"):
+    df = process_frame(load_raw_data(input_file))
 
     PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
     output_path = PROCESSED_DATA_DIR / output_file
     df.to_csv(output_path, index=False)
     print(f"\n[SAVED] Datos procesados guardados en: {output_path}")
+    print_processing_summary(df)
+    return df, output_path
+
+
+def print_processing_summary(df):
     print(f"  Filas: {len(df)}")
     print(f"  Columnas: {len(df.columns)}")
 
@@ -201,8 +209,6 @@ def process_and_save(input_file="europa_league_complete.csv", output_file="europ
             pct = count / len(df) * 100
             print(f"  {col}: {int(count)} ({pct:.1f}%)")
 
-    return df, output_path
-
 
 if __name__ == "__main__":
     df, path = process_and_save()
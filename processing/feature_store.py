@@ -0,0 +1,295 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import hashlib
+import argparse
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import PROCESSED_DATA_DIR, FEATURE_STORE_DIR, FEATURE_COLS_LEAGUES, FEATURE_COLS_EL
+
+# Subir al cambiar cómo se calculan las features (scrapers / data_cleaning): genera un store nuevo
+FEATURE_PIPELINE_VERSION = 1
+ROW_GROUP_SIZE = 50_000
+MATCH_ID_MASK = (1 << 53) - 1
+
+FEATURE_SETS = {
+    "leagues": {
+        "source": "european_leagues_with_odds_processed.csv",
+        "feature_cols": FEATURE_COLS_LEAGUES,
+        "league": None,
+    },
+    "europa_league": {
+        "source": "europa_league_matches_processed.csv",
+        "feature_cols": FEATURE_COLS_EL,
+        "league": "Europa League",
+    },
+}
+
+
+def feature_version(name):
+    spec = FEATURE_SETS[name]
+    key = f"{FEATURE_PIPELINE_VERSION}|{name}|{','.join(spec['feature_cols'])}"
+    return hashlib.sha1(key.encode()).hexdigest()[:10]
+
+
+def store_path(name):
+    return FEATURE_STORE_DIR / f"{name}_{feature_version(name)}.parquet"
+
+
+def source_path(name):
+    return PROCESSED_DATA_DIR / FEATURE_SETS[name]["source"]
+
+
+def match_ids(df):
+    # Identidad del partido: fecha (día) + equipos, estable entre re-procesados del CSV
+    key = pd.DataFrame({
+        "date": pd.to_datetime(df["date"], errors="coerce").dt.strftime("%Y-%m-%d"),
+        "home_team": df["home_team"].astype(str).str.strip(),
+        "away_team": df["away_team"].astype(str).str.strip(),
+    })
+    hashed = pd.util.hash_pandas_object(key, index=False).to_numpy(dtype=np.uint64)
+    # 53 bits: el id viaja como número JSON al dashboard sin perder precisión
+    return (hashed & np.uint64(MATCH_ID_MASK)).astype(np.int64)
+
+
+def _typed(df, feature_cols):
+    # Las features se convierten una sola vez a float32 (NaN = dato ausente); el resto mantiene su tipo
+    df = df.copy()
+    for col in feature_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    for col in df.columns:
+        if col.startswith("flag_") or col == "total_flags":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+        elif df[col].dtype == object:
+            # DataFrames en memoria (sin pasar por CSV) pueden mezclar números y texto en una columna
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _keyed(df, spec, ids=None):
+    if "league_name" not in df.columns and spec["league"] is not None:
+        df["league_name"] = spec["league"]
+    df.insert(0, "match_id", match_ids(df) if ids is None else ids)
+    return df
+
+
+def source_signature(name):
+    # Tamaño y fecha del CSV procesado: si cambian, el store se vuelve a sincronizar
+    path = source_path(name)
+    if not path.exists():
+        return None
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def store_metadata(path):
+    import pyarrow.parquet as pq
+
+    meta = pq.read_metadata(path).metadata or {}
+    return {key.decode(): value.decode() for key, value in meta.items() if key.startswith(b"fps_")}
+
+
+def is_stale(name):
+    signature = source_signature(name)
+    return signature is not None and store_metadata(store_path(name)).get("fps_source") != signature
+
+
+def _hash_frame(h, frame):
+    # Solo los hashes de fila: el digest no depende de cómo se parta la tabla en bloques
+    h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+
+
+def content_digest(name, frames):
+    # Contenido fila a fila (no solo los ids): un partido corregido cambia el digest y el scoring se rehace
+    h = hashlib.sha1(feature_version(name).encode())
+    for frame in frames:
+        _hash_frame(h, frame)
+    return h.hexdigest()
+
+
+def refresh_features(name, df):
+    # Tabla completa del store con las filas de df sustituyendo (por match_id) o añadiéndose a las
+    # guardadas, y nº de filas de df
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    spec = FEATURE_SETS[name]
+    df = _keyed(df.copy(), spec).drop_duplicates("match_id", keep="last")
+    new = pa.Table.from_pandas(_typed(df, spec["feature_cols"]), preserve_index=False)
+    table = new
+    path = store_path(name)
+    if path.exists():
+        stored = pq.read_table(path)
+        rest = stored.filter(pc.invert(pc.is_in(stored.column("match_id"), value_set=new.column("match_id"))))
+        table = pa.concat_tables([rest, new], promote_options="permissive")
+    return table.sort_by([("date", "ascending")]), len(new)
+
+
+def _write_tables(name, schema, tables, signature):
+    # Escritura atómica con la firma del CSV y el digest del contenido en los metadatos del Parquet
+    import pyarrow.parquet as pq
+
+    path = store_path(name)
+    FEATURE_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    # Fichero temporal por proceso: varios workers del dashboard pueden sincronizar a la vez
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    h = hashlib.sha1(feature_version(name).encode())
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for table in tables:
+            writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+            for batch in table.to_batches():
+                _hash_frame(h, batch.to_pandas())
+        writer.add_key_value_metadata({"fps_source": signature or "", "fps_digest": h.hexdigest()})
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_store(name, table):
+    # La firma se toma al escribir: en el pipeline el CSV procesado ya está guardado
+    return _write_tables(name, table.schema, [table], source_signature(name))
+
+
+def _conform(table, schema):
+    # Mismas columnas y tipos en todos los bloques (las que falten, nulas)
+    import pyarrow as pa
+
+    columns = [table.column(f.name) if f.name in table.column_names else pa.nulls(table.num_rows, f.type)
+               for f in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _part(frame, spec, parts_dir, parts):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    frame = _typed(frame, spec["feature_cols"])
+    table = pa.Table.from_pandas(frame, preserve_index=False).replace_schema_metadata(None)
+    # Columnas vacías en este bloque (float64 de read_csv): tipo null, que se unifica con el del resto
+    for i, col in enumerate(frame.columns):
+        if frame[col].dtype == np.float64 and frame[col].isna().all():
+            table = table.set_column(i, col, pa.nulls(len(frame)))
+    path = parts_dir / f"{len(parts):05d}.parquet"
+    pq.write_table(table, path)
+    parts.append(path)
+
+
+def sync_store(name, chunksize=ROW_GROUP_SIZE):
+    # Resincronización completa desde el CSV procesado, que manda: partidos que ya no están en él salen del store.
+    # Leído por bloques: la memoria depende de chunksize (más 8 bytes por partido para los ids), no del histórico.
+    # Devuelve (filas del CSV, filas del store)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import shutil
+
+    spec = FEATURE_SETS[name]
+    source = source_path(name)
+    signature = source_signature(name)
+    # 1ª pasada, solo la identidad del partido: de cada match_id repetido vale la última fila
+    ids = [match_ids(chunk) for chunk in
+           pd.read_csv(source, usecols=["date", "home_team", "away_team"], chunksize=chunksize)]
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    keep = ~pd.Series(ids).duplicated(keep="last").to_numpy()
+
+    path = store_path(name)
+    FEATURE_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    parts_dir = FEATURE_STORE_DIR / f".{name}_{os.getpid()}.parts"
+    parts_dir.mkdir(exist_ok=True)
+    parts = []
+    try:
+        offset = 0
+        for chunk in pd.read_csv(source, parse_dates=["date"], low_memory=False, chunksize=chunksize):
+            block = slice(offset, offset + len(chunk))
+            offset += len(chunk)
+            chunk = _keyed(chunk, spec, ids[block])[keep[block]]
+            if len(chunk):
+                _part(chunk, spec, parts_dir, parts)
+        if not parts:
+            return 0, 0
+        schema = pa.unify_schemas([pq.read_schema(p) for p in parts], promote_options="permissive")
+        tables = (_conform(pq.read_table(p), schema) for p in parts)
+        _write_tables(name, schema, tables, signature)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    return int(keep.sum()), pq.read_metadata(path).num_rows
+
+
+def update_feature_store(name, df=None, verbose=True):
+    import pyarrow.parquet as pq
+
+    # df: partidos ya procesados en memoria; sin df, el store se sincroniza con el CSV si éste cambió
+    path = store_path(name)
+    if df is not None:
+        table, n_rows = refresh_features(name, df)
+        write_store(name, table)
+        if verbose:
+            print(f"[FEATURES] {name}: {n_rows} partidos actualizados → {table.num_rows} en {path.name}")
+        return path
+    if not source_path(name).exists():
+        return None
+    if path.exists() and not is_stale(name):
+        if verbose:
+            n_total = pq.read_metadata(path).num_rows
+            print(f"[FEATURES] {name}: sin cambios en {source_path(name).name} ({n_total} en {path.name})")
+        return path
+    n_rows, n_total = sync_store(name)
+    if verbose:
+        print(f"[FEATURES] {name}: {n_rows} partidos sincronizados → {n_total} en {path.name}")
+    return path
+
+
+def update_all(verbose=True):
+    return {name: update_feature_store(name, verbose=verbose) for name in FEATURE_SETS}
+
+
+def ensure_store(name):
+    # Se construye si falta y se sincroniza si el CSV procesado cambió desde la última escritura
+    path = store_path(name)
+    if not path.exists() or is_stale(name):
+        update_feature_store(name, verbose=False)
+    return path if path.exists() else None
+
+
+def load_features(name, columns=None, league=None, since=None):
+    # since: solo partidos posteriores a esa fecha (el filtro se aplica al leer el Parquet)
+    path = ensure_store(name)
+    if path is None:
+        return None
+    filters = []
+    if league is not None:
+        filters.append(("league_name", "==", league))
+    if since is not None:
+        filters.append(("date", ">", pd.Timestamp(since)))
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+
+def iter_parquet(path, chunksize, columns=None, league=None):
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet")
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    expr = ds.field("league_name") == league if league is not None else None
+    for batch in dataset.to_batches(columns=columns, filter=expr, batch_size=chunksize):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def iter_features(name, chunksize, columns=None, league=None):
+    path = ensure_store(name)
+    if path is None:
+        return iter(())
+    return iter_parquet(path, chunksize, columns=columns, league=league)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Feature store")
+    parser.add_argument("--sets", nargs="+", choices=list(FEATURE_SETS), default=list(FEATURE_SETS),
+                        help="Conjuntos de features a actualizar")
+    args = parser.parse_args()
+    for name in args.sets:
+        if update_feature_store(name) is None:
+            print(f"[WARN] {name}: no existe {source_path(name)}")
@@ -0,0 +1,224 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import time
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import RAW_DATA_DIR, PROCESSED_DATA_DIR
+from processing.feature_store import FEATURE_SETS
+
+# Fuente → CSV crudo; el procesado es el "source" del feature store
+RAW_FILES = {
+    "europa_league": "europa_league_matches.csv",
+    "leagues": "european_leagues_with_odds.csv",
+}
+
+
+class AsyncWriter:
+    # Persiste las salidas de cada etapa en segundo plano mientras la siguiente trabaja en memoria
+
+    def __init__(self, max_workers=2):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="persist")
+        self.pending = []
+        self.callbacks = []
+
+    def submit(self, label, fn, *args):
+        self.pending.append((label, self.pool.submit(fn, *args)))
+
+    def write_csv(self, df, path):
+        self.submit(str(path), _write_csv, df, path)
+
+    def on_success(self, fn, *args):
+        # Se ejecuta en wait() solo si todas las escrituras terminaron bien (p. ej. registrar la caché)
+        self.callbacks.append((fn, args))
+
+    def wait(self):
+        failed = []
+        for label, future in self.pending:
+            try:
+                future.result()
+                print(f"[SAVED] {label}")
+            except Exception as e:
+                print(f"[ERROR] No se pudo guardar {label}: {e}")
+                failed.append(label)
+        if not failed:
+            for fn, args in self.callbacks:
+                fn(*args)
+        self.pending = []
+        self.callbacks = []
+        self.pool.shutdown()
+        return failed
+
+
+def _write_csv(df, path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(path).with_suffix(".tmp")
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _write_processed(df, path, name, table):
+    from processing.feature_store import write_store
+
+    _write_csv(df, path)
+    write_store(name, table)
+
+
+def scrape_stage(seasons, writer):
+    from ingestion.scrapers.europa_league_scraper import run as scrape_europa_league
+    from ingestion.scrapers.european_leagues_scraper import run as scrape_european_leagues
+
+    raw = {}
+    print("\n" + "=" * 60)
+    print("PASO 1A: DESCARGA UEFA EUROPA LEAGUE")
+    print("=" * 60)
+    df_el, _ = scrape_europa_league(seasons_back=seasons, save=False)
+    if df_el is not None:
+        print(f"[OK] Europa League: {len(df_el)} partidos")
+        raw["europa_league"] = df_el
+    else:
+        print("[WARN] No se pudieron obtener datos de Europa League")
+
+    print("\n" + "=" * 60)
+    print("PASO 1B: DESCARGA LIGAS EUROPEAS (con cuotas)")
+    print("=" * 60)
+    df_leagues, _ = scrape_european_leagues(seasons_back=seasons, save=False)
+    if df_leagues is not None:
+        print(f"[OK] Ligas europeas: {len(df_leagues)} partidos")
+        raw["leagues"] = df_leagues
+    else:
+        print("[WARN] No se pudieron obtener datos de ligas europeas")
+
+    for name, df in raw.items():
+        writer.write_csv(df, RAW_DATA_DIR / RAW_FILES[name])
+    return raw
+
+
+def load_raw_stage():
+    from processing.data_cleaning import load_raw_data
+
+    return {name: load_raw_data(filename) for name, filename in RAW_FILES.items()
+            if (RAW_DATA_DIR / filename).exists()}
+
+
+def process_stage(raw, writer, cached, force=False):
+    from processing.data_cleaning import process_frame, print_processing_summary
+    from processing.feature_store import refresh_features, update_feature_store, store_path, source_path
+    from processing.stage_cache import process_key, frame_digest, file_digest, is_cached, record_stage
+
+    print("\n" + "=" * 60)
+    print("PASO 2: LIMPIEZA Y FEATURE ENGINEERING")
+    print("=" * 60)
+    features = {}
+    for name, df in raw.items():
+        stage, key = f"process:{name}", process_key(name, frame_digest(df))
+        if not force and is_cached(stage, key):
+            # Mismos datos crudos, código y configuración: el CSV procesado y el store siguen valiendo
+            print(f"\n  [CACHE] {name}: sin cambios, se reutiliza {store_path(name).name}")
+            cached.add(stage)
+            continue
+        print(f"\n  Procesando: {name}")
+        try:
+            processed = process_frame(df)
+        except Exception as e:
+            print(f"  [ERROR] {e}")
+            continue
+        output_path = PROCESSED_DATA_DIR / FEATURE_SETS[name]["source"]
+        print_processing_summary(processed)
+
+        if "total_flags" in processed.columns:
+            suspicious = processed[processed["total_flags"] >= 2].sort_values("total_flags", ascending=False)
+            if not suspicious.empty:
+                display_cols = ["date", "home_team", "away_team", "home_goals",
+                                "away_goals", "result", "season", "total_flags"]
+                available = [c for c in display_cols if c in suspicious.columns]
+                print(f"\n  Partidos con 2+ anomalías ({len(suspicious)}):")
+                print(f"  {suspicious[available].head(15).to_string(index=False)}")
+
+        # Los partidos procesados sustituyen o se añaden por match_id; CSV y Parquet se escriben en
+        # segundo plano, en la misma tarea para que el store guarde la firma del CSV ya escrito
+        table, n_rows = refresh_features(name, processed)
+        print(f"  [FEATURES] {name}: {n_rows} partidos actualizados → {table.num_rows} en el store")
+        writer.submit(f"{output_path} + {store_path(name).name}", _write_processed, processed, output_path,
+                      name, table)
+        features[name] = table.to_pandas()
+        writer.on_success(record_stage, stage, key, [output_path, store_path(name)])
+
+    # Conjuntos sin CSV crudo en esta ejecución: el store se actualiza desde el procesado existente
+    for name in FEATURE_SETS:
+        if name in raw:
+            continue
+        digest = file_digest(source_path(name))
+        if digest is None:
+            continue
+        stage, key = f"features:{name}", process_key(name, digest)
+        if not force and is_cached(stage, key):
+            cached.add(stage)
+            continue
+        # Sincronización por bloques desde el CSV (solo si cambió): el scoring lee luego el store
+        update_feature_store(name, verbose=False)
+        writer.on_success(record_stage, stage, key, [source_path(name), store_path(name)])
+    return features
+
+
+def score_stage(features, cached, force=False):
+    # features: solo los conjuntos recalculados en esta ejecución; el resto se lee del store si hace falta
+    from models.multi_model import score_frames, REGISTRY_PATH
+    from models.integrity_scorer import MODEL_DIR
+    from processing.feature_store import load_features
+    from processing.stage_cache import score_key, store_digest, is_cached, record_stage
+    from processing.summary_cube import CUBE_PATH
+
+    print("\n" + "=" * 60)
+    print("PASO 3: SCORING")
+    print("=" * 60)
+    if not REGISTRY_PATH.exists() and not (MODEL_DIR / "fps_leagues_scaler.pkl").exists():
+        print("[WARN] No hay modelos entrenados. Ejecuta models/integrity_scorer.py o models/multi_model.py")
+        return None
+
+    digests = {name: store_digest(name, features.get(name)) for name in FEATURE_SETS}
+    key = score_key({name: d for name, d in digests.items() if d is not None})
+    output_path = PROCESSED_DATA_DIR / "integrity_scores.csv"
+    if not force and is_cached("score", key):
+        print(f"  [CACHE] Sin partidos nuevos ni cambios de modelo: se reutiliza {output_path.name}")
+        cached.add("score")
+        return None
+
+    frames = dict(features)
+    for name, digest in digests.items():
+        if name not in frames and digest is not None:
+            frames[name] = load_features(name)
+    runs = score_frames(frames)
+    if any("summary" in r for r in runs):
+        record_stage("score", key, [output_path, CUBE_PATH])
+    return runs
+
+
+def run_pipeline(steps, seasons=5, force=False):
+    # Devuelve el estado de cada etapa (None si alguna aborta); cached: etapas omitidas por la caché
+    t0 = time.perf_counter()
+    writer = AsyncWriter()
+    state = {"raw": None, "features": {}, "runs": None, "cached": set()}
+    try:
+        if "scrape" in steps:
+            state["raw"] = scrape_stage(seasons, writer)
+            if not state["raw"]:
+                print("[FATAL] No se pudieron obtener datos de ninguna fuente. Abortando.")
+                return None
+        if "process" in steps:
+            if state["raw"] is None:
+                state["raw"] = load_raw_stage()
+            if not state["raw"]:
+                print("[FATAL] No hay archivos de datos para procesar.")
+                return None
+            state["features"] = process_stage(state["raw"], writer, state["cached"], force=force)
+        if "score" in steps:
+            state["runs"] = score_stage(state["features"], state["cached"], force=force)
+    finally:
+        # La persistencia pendiente se completa antes de salir aunque una etapa falle
+        failed = writer.wait()
+    skipped = f", {len(state['cached'])} etapas desde caché" if state["cached"] else ""
+    errors = f" ({len(failed)} escrituras fallidas)" if failed else ""
+    print(f"\nPipeline en {time.perf_counter() - t0:.1f}s{skipped}{errors}")
+    return state
@@ -0,0 +1,169 @@
+import pandas as pd
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import (
+    BASE_DIR, CACHE_DIR, MATCH_INTEGRITY_THRESHOLDS, ODDS_MOVEMENT_SUSPICIOUS_PCT,
+    MIN_WIN_STREAK_FOR_UPSET_FLAG, GOALS_ANOMALY_MULTIPLIER, XG_DEVIATION_THRESHOLD,
+)
+from processing.feature_store import FEATURE_SETS, feature_version, store_path, store_metadata, content_digest
+
+# Subir para invalidar todas las entradas del manifiesto
+STAGE_CACHE_VERSION = 1
+MANIFEST_PATH = CACHE_DIR / "stage_manifest.json"
+
+# Código del que depende cada etapa: cualquier cambio en estos ficheros obliga a recalcular
+PROCESS_CODE = ["config/settings.py", "processing/data_cleaning.py", "processing/feature_store.py"]
+SCORE_CODE = ["config/settings.py", "processing/feature_store.py", "processing/summary_cube.py",
+              "models/integrity_scorer.py", "models/multi_model.py", "models/compiled_trees.py",
+              "models/drift.py", "models/tracking.py"]
+
+
+def file_digest(path, block_size=1 << 20):
+    path = Path(path)
+    if not path.exists():
+        return None
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def frame_digest(df):
+    # Contenido del DataFrame (valores y columnas), independiente del índice
+    h = hashlib.sha1()
+    h.update("|".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def code_digest(files):
+    h = hashlib.sha1()
+    for name in files:
+        h.update(name.encode())
+        h.update((file_digest(BASE_DIR / name) or "-").encode())
+    return h.hexdigest()
+
+
+def store_digest(name, df=None):
+    # Contenido del store: un partido corregido (mismo match_id) también invalida el scoring
+    if df is not None:
+        return content_digest(name, [df])
+    path = store_path(name)
+    if not path.exists():
+        return None
+    digest = store_metadata(path).get("fps_digest")
+    if digest is None:
+        # Stores escritos antes de guardar el digest: se calcula recorriendo el Parquet por bloques
+        import pyarrow.parquet as pq
+
+        digest = content_digest(name, (b.to_pandas() for b in pq.ParquetFile(path).iter_batches()))
+    return digest
+
+
+def model_digest():
+    from models.multi_model import load_registry, REGISTRY_PATH
+    from models.integrity_scorer import MODEL_DIR
+
+    h = hashlib.sha1()
+    h.update((file_digest(REGISTRY_PATH) or "-").encode())
+    for spec in load_registry():
+        for path in sorted(MODEL_DIR.glob(f"{spec['prefix']}_*")):
+            h.update(path.name.encode())
+            h.update(file_digest(path).encode())
+    return h.hexdigest()
+
+
+def stage_key(**parts):
+    payload = json.dumps({"version": STAGE_CACHE_VERSION, **parts}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def process_key(name, input_digest):
+    return stage_key(
+        stage="process",
+        name=name,
+        inputs=input_digest,
+        code=code_digest(PROCESS_CODE),
+        config={
+            "odds_movement_pct": ODDS_MOVEMENT_SUSPICIOUS_PCT,
+            "min_win_streak": MIN_WIN_STREAK_FOR_UPSET_FLAG,
+            "goals_anomaly_multiplier": GOALS_ANOMALY_MULTIPLIER,
+            "xg_deviation": XG_DEVIATION_THRESHOLD,
+            "feature_cols": FEATURE_SETS[name]["feature_cols"],
+            "feature_version": feature_version(name),
+        },
+    )
+
+
+def score_key(store_digests):
+    return stage_key(
+        stage="score",
+        inputs=store_digests,
+        code=code_digest(SCORE_CODE),
+        config={
+            "thresholds": MATCH_INTEGRITY_THRESHOLDS,
+            "feature_cols": {name: spec["feature_cols"] for name, spec in FEATURE_SETS.items()},
+        },
+        model=model_digest(),
+    )
+
+
+def _signature(path):
+    # Las salidas se validan por tamaño y fecha: detecta ficheros borrados o reescritos sin releerlos
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_manifest():
+    if not MANIFEST_PATH.exists():
+        return {}
+    try:
+        return json.loads(MANIFEST_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def is_cached(stage, key):
+    entry = load_manifest().get(stage)
+    if entry is None or entry["key"] != key:
+        return False
+    for path, signature in entry["outputs"].items():
+        if not Path(path).exists() or _signature(path) != signature:
+            return False
+    return True
+
+
+def record_stage(stage, key, outputs):
+    manifest = load_manifest()
+    manifest[stage] = {
+        "key": key,
+        "outputs": {str(path): _signature(path) for path in outputs if Path(path).exists()},
+    }
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def clear_manifest():
+    MANIFEST_PATH.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Caché de etapas del pipeline")
+    parser.add_argument("--clear", action="store_true", help="Borrar el manifiesto (fuerza recalcular todo)")
+    args = parser.parse_args()
+    if args.clear:
+        clear_manifest()
+        print(f"[CACHE] Manifiesto borrado: {MANIFEST_PATH}")
+    else:
+        for stage, entry in sorted(load_manifest().items()):
+            state = "válida" if is_cached(stage, entry["key"]) else "salidas modificadas"
+            print(f"  {stage:<28} {entry['key'][:12]}  {len(entry['outputs'])} salidas  [{state}]")
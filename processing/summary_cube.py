@@ -0,0 +1,88 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.settings import PROCESSED_DATA_DIR
+
+# Agregados de integrity_scores por liga × temporada × mes × nivel de alerta: los gráficos y KPIs
+# del dashboard leen de aquí (cientos de filas) en lugar de recorrer todos los partidos
+CUBE_PATH = PROCESSED_DATA_DIR / "summary_cube.parquet"
+CUBE_DIMENSIONS = ["league_name", "season", "month", "alert_level"]
+HIST_EDGES = np.linspace(0, 100, 21)
+HIST_COLS = [f"hist_{i:02d}" for i in range(len(HIST_EDGES) - 1)]
+SUM_COLS = ["count", "score_sum", *HIST_COLS]
+
+
+def aggregate(results):
+    # Cubo parcial de un bloque de resultados; los bloques se combinan con merge_cubes
+    n = len(results)
+    score = pd.to_numeric(results["integrity_score"], errors="coerce").to_numpy(dtype=float)
+    frame = pd.DataFrame({
+        "league_name": results["league_name"].to_numpy() if "league_name" in results.columns else np.full(n, None),
+        "season": results["season"].to_numpy() if "season" in results.columns else np.full(n, None),
+        "month": pd.to_datetime(results["date"], errors="coerce").dt.strftime("%Y-%m").to_numpy(),
+        "alert_level": results["alert_level"].to_numpy(),
+        "count": np.isfinite(score).astype(np.int64),
+        "score_sum": np.nan_to_num(score),
+        "score_max": score,
+    })
+    bins = np.clip(np.searchsorted(HIST_EDGES, score, side="right") - 1, 0, len(HIST_COLS) - 1)
+    hist = np.zeros((n, len(HIST_COLS)), dtype=np.int64)
+    valid = np.isfinite(score)
+    hist[np.flatnonzero(valid), bins[valid]] = 1
+    frame[HIST_COLS] = hist
+    return _group(frame)
+
+
+def _group(frame):
+    agg = {col: "sum" for col in SUM_COLS}
+    agg["score_max"] = "max"
+    cube = frame.groupby(CUBE_DIMENSIONS, dropna=False, sort=False).agg(agg).reset_index()
+    return cube[CUBE_DIMENSIONS + ["count", "score_sum", "score_max", *HIST_COLS]]
+
+
+def merge_cubes(cubes):
+    cubes = [c for c in cubes if c is not None and not c.empty]
+    if not cubes:
+        return None
+    if len(cubes) == 1:
+        return cubes[0]
+    return _group(pd.concat(cubes, ignore_index=True))
+
+
+def save_cube(cube, output_path=None):
+    output_path = Path(output_path or CUBE_PATH)
+    if cube is None:
+        return None
+    tmp_path = output_path.with_suffix(".tmp")
+    cube.sort_values(CUBE_DIMENSIONS).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def load_cube(scores, scores_path, cube_path=None):
+    # El cubo se genera al puntuar; si falta o es más antiguo que los scores se recalcula en memoria
+    cube_path = Path(cube_path or CUBE_PATH)
+    if cube_path.exists() and cube_path.stat().st_mtime >= Path(scores_path).stat().st_mtime:
+        return pd.read_parquet(cube_path)
+    return aggregate(scores)
+
+
+def filter_cube(cube, leagues=None, seasons=None, levels=None):
+    mask = np.ones(len(cube), dtype=bool)
+    for col, values in (("league_name", leagues), ("season", seasons), ("alert_level", levels)):
+        if values:
+            mask &= cube[col].isin(values).to_numpy()
+    return cube[mask]
+
+
+def rollup(cube, by):
+    # Totales del cubo por las dimensiones pedidas, con media y máximo derivados
+    agg = {col: "sum" for col in SUM_COLS}
+    agg["score_max"] = "max"
+    out = cube.groupby(by, dropna=False).agg(agg) if by else cube.agg(agg).to_frame().T
+    out["mean_score"] = out["score_sum"] / out["count"].where(out["count"] > 0)
+    return out
@@ -0,0 +1,77 @@
+import subprocess
+import statistics
+import argparse
+import time
+import sys
+import re
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Comandos ligeros: deberían arrancar en menos de BUDGET_SECONDS
+COMMANDS = {
+    "main.py --help": ["main.py", "--help"],
+    "integrity_scorer.py --help": ["models/integrity_scorer.py", "--help"],
+    "multi_model.py --help": ["models/multi_model.py", "--help"],
+    "incremental.py --help": ["models/incremental.py", "--help"],
+    "tracking.py": ["models/tracking.py"],
+    "import models.integrity_scorer": ["-c", "import models.integrity_scorer"],
+    "import processing.feature_store": ["-c", "import processing.feature_store"],
+}
+# Se miden pero no cuentan para el objetivo: dash y dash-bootstrap-components son necesarios para servir
+REFERENCE_COMMANDS = {
+    "import dashboard.app": ["-c", "import dashboard.app"],
+}
+BUDGET_SECONDS = 1.0
+
+
+def time_command(args, repeats):
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+def top_imports(args, n=5):
+    # -X importtime escribe en stderr: "import time: self [us] | cumulative | package"
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match and len(match.group(3)) <= 3:
+            rows.append((int(match.group(2)) / 1e6, match.group(4)))
+    return sorted(rows, reverse=True)[:n]
+
+
+def run_benchmark(repeats=5, budget=BUDGET_SECONDS, details=False):
+    print("=" * 60)
+    print("FAIR PLAY SHIELD — Tiempo de arranque")
+    print("=" * 60)
+    over = []
+    for name, args in {**COMMANDS, **REFERENCE_COMMANDS}.items():
+        timings = time_command(args, repeats)
+        median = statistics.median(timings)
+        if name in REFERENCE_COMMANDS:
+            status = "referencia"
+        else:
+            status = "ok" if median <= budget else "LENTO"
+        if status == "LENTO":
+            over.append(name)
+        print(f"  {name:<36} mediana {median:6.3f}s  mín {min(timings):6.3f}s  [{status}]")
+        if details:
+            for seconds, module in top_imports(args):
+                print(f"      {seconds:6.3f}s  {module}")
+    print(f"\n{len(COMMANDS) - len(over)}/{len(COMMANDS)} comandos por debajo de {budget:.1f}s")
+    return over
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fair Play Shield - Benchmark de tiempo de importación")
+    parser.add_argument("--repeats", type=int, default=5, help="Ejecuciones por comando (default: 5)")
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS, help="Segundos máximos por comando")
+    parser.add_argument("--details", action="store_true", help="Mostrar los imports de primer nivel más lentos")
+    args = parser.parse_args()
+    sys.exit(1 if run_benchmark(repeats=args.repeats, budget=args.budget, details=args.details) else 0)